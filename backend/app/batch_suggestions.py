@@ -0,0 +1,95 @@
+import json
+import os
+import re
+from typing import Dict, List, Optional
+
+from .models import Task
+
+# Configuración
+SUGGESTION_BATCH_TOKEN_BUDGET = int(os.getenv("SUGGESTION_BATCH_TOKEN_BUDGET", 6000))
+SUGGESTION_BATCH_OUTPUT_TOKENS = int(os.getenv("SUGGESTION_BATCH_OUTPUT_TOKENS", 250))  # reservados por tarea
+SUGGESTION_BATCH_MAX_TASKS = int(os.getenv("SUGGESTION_BATCH_MAX_TASKS", 25))
+
+BATCH_PREAMBLE = """Analiza cada una de las tareas siguientes y proporciona sugerencias útiles para cada una:
+1. Posibles subtareas
+2. Sugerencias de mejora
+3. Estimación de tiempo
+4. Prioridad recomendada
+
+Las tareas llegan como líneas JSON con su "id". Responde ÚNICAMENTE con un objeto JSON
+cuyas claves sean los ids de las tareas (como texto) y cuyos valores sean las sugerencias
+de esa tarea en texto plano, por ejemplo: {"12": "...", "15": "..."}.
+
+Tareas:
+"""
+
+def estimate_tokens(text: str) -> int:
+    """Aproximación de ~4 caracteres por token; suficiente para repartir el presupuesto"""
+    return len(text) // 4 + 1
+
+def task_line(task: Task) -> str:
+    return json.dumps({
+        "id": task.id,
+        "title": task.title,
+        "description": task.description,
+        "priority": task.priority.value if task.priority else None,
+        "due_date": task.due_date.isoformat() if task.due_date else None,
+    }, ensure_ascii=False)
+
+def pack_tasks(
+    tasks: List[Task],
+    budget: int = SUGGESTION_BATCH_TOKEN_BUDGET,
+    output_tokens: int = SUGGESTION_BATCH_OUTPUT_TOKENS,
+    max_tasks: int = SUGGESTION_BATCH_MAX_TASKS,
+) -> List[List[Task]]:
+    """Agrupa las tareas en lotes cuyo prompt más la salida reservada caben en ``budget``.
+
+    Una tarea que por sí sola supera el presupuesto va en un lote propio.
+    """
+    base = estimate_tokens(BATCH_PREAMBLE)
+    batches: List[List[Task]] = []
+    current: List[Task] = []
+    used = base
+    for task in tasks:
+        cost = estimate_tokens(task_line(task)) + output_tokens
+        if current and (used + cost > budget or len(current) >= max_tasks):
+            batches.append(current)
+            current, used = [], base
+        current.append(task)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+def build_batch_messages(tasks: List[Task]) -> List[dict]:
+    prompt = BATCH_PREAMBLE + "\n".join(task_line(task) for task in tasks)
+    return [{"role": "user", "content": prompt}]
+
+def parse_batch_response(content: Optional[str], task_ids: List[int]) -> Dict[int, str]:
+    """Extrae las sugerencias por id; ignora ids desconocidos y valores vacíos.
+
+    Tolera texto alrededor del JSON (bloques de código, razonamiento previo).
+    """
+    if not content:
+        return {}
+    match = re.search(r"\{.*\}", content, re.DOTALL)
+    if match is None:
+        return {}
+    try:
+        data = json.loads(match.group(0))
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+
+    wanted = set(task_ids)
+    results = {}
+    for key, value in data.items():
+        try:
+            task_id = int(key)
+        except (TypeError, ValueError):
+            continue
+        if task_id not in wanted or not value:
+            continue
+        results[task_id] = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+    return results
@@ -0,0 +1,138 @@
+import codecs
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from enum import Enum
+from typing import AsyncIterator, Iterable, List, Optional, Tuple
+
+# Configuración
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", 1000))
+BULK_MAX_ROWS = int(os.getenv("BULK_MAX_ROWS", 100000))
+BULK_MAX_ERRORS = int(os.getenv("BULK_MAX_ERRORS", 100))
+BULK_MAX_LINE_BYTES = int(os.getenv("BULK_MAX_LINE_BYTES", 1024 * 1024))  # también un registro CSV multilínea
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+
+# (número de línea, fila o None, error o None)
+ParsedRow = Tuple[int, Optional[dict], Optional[str]]
+
+class LineTooLongError(ValueError):
+    """Una línea (o registro CSV) supera ``BULK_MAX_LINE_BYTES``; la importación se corta"""
+
+    def __init__(self, line: int, limit: int):
+        super().__init__(f"Line {line} exceeds {limit} bytes")
+        self.line = line
+        self.limit = limit
+
+def too_long(text: str, limit: int) -> bool:
+    # Solo se codifica lo que podría pasarse: cada carácter ocupa como mucho 4 bytes
+    return len(text) > limit // 4 and len(text.encode("utf-8")) > limit
+
+async def iter_lines(chunks: AsyncIterator[bytes], max_line_bytes: int = BULK_MAX_LINE_BYTES) -> AsyncIterator[str]:
+    """Convierte un cuerpo en streaming en líneas de texto sin cargarlo entero en memoria.
+
+    La línea en curso se acota a ``max_line_bytes``: sin saltos de línea el
+    cuerpo entero acabaría en memoria.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    pending_bytes = line_no = 0
+    async for chunk in chunks:
+        # El byte del salto de línea no aparece dentro de ningún carácter UTF-8 multibyte
+        newline = chunk.rfind(b"\n")
+        pending_bytes = pending_bytes + len(chunk) if newline < 0 else len(chunk) - newline - 1
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            line_no += 1
+            if too_long(line, max_line_bytes):
+                raise LineTooLongError(line_no, max_line_bytes)
+            yield line.rstrip("\r")
+        if pending_bytes > max_line_bytes:
+            raise LineTooLongError(line_no + 1, max_line_bytes)
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+async def iter_ndjson_rows(lines: AsyncIterator[str]) -> AsyncIterator[ParsedRow]:
+    line_no = 0
+    async for line in lines:
+        line_no += 1
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_no, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(row, dict):
+            yield line_no, None, "Each line must be a JSON object"
+            continue
+        yield line_no, row, None
+
+async def iter_csv_rows(lines: AsyncIterator[str], max_record_bytes: int = BULK_MAX_LINE_BYTES) -> AsyncIterator[ParsedRow]:
+    """Filas CSV con cabecera; las celdas vacías se tratan como ausentes.
+
+    Un registro con comillas sin cerrar continúa en la línea siguiente, como
+    permite el formato CSV para campos con saltos de línea.
+    """
+    header: Optional[List[str]] = None
+    record = ""
+    start = line_no = 0
+    async for line in lines:
+        line_no += 1
+        if not record:
+            start = line_no
+            record = line
+        else:
+            record += "\n" + line
+        if record.count('"') % 2:
+            # Comillas sin cerrar: el registro no puede crecer sin límite a base de líneas
+            if too_long(record, max_record_bytes):
+                raise LineTooLongError(start, max_record_bytes)
+            continue
+        text, record = record, ""
+        if not text.strip():
+            continue
+        try:
+            values = next(csv.reader([text]))
+        except csv.Error as e:
+            yield start, None, f"Invalid CSV: {e}"
+            continue
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) > len(header):
+            yield start, None, "More values than header columns"
+            continue
+        yield start, {key: value for key, value in zip(header, values) if value != ""}, None
+    if record:
+        yield start, None, "Unterminated quoted field"
+
+async def chunked(rows: AsyncIterator[ParsedRow], size: int) -> AsyncIterator[List[ParsedRow]]:
+    chunk: List[ParsedRow] = []
+    async for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def export_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    return value
+
+def ndjson_line(columns: Iterable[str], row) -> str:
+    return json.dumps({key: export_value(value) for key, value in zip(columns, row)}, ensure_ascii=False) + "\n"
+
+def csv_lines(rows: Iterable[Iterable]) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for row in rows:
+        writer.writerow(["" if value is None else export_value(value) for value in row])
+    return buffer.getvalue()
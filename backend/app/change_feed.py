@@ -0,0 +1,380 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from typing import AsyncIterator, Deque, Dict, List, Optional, Set, Tuple
+
+from redis.exceptions import RedisError
+
+from .redis_pool import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Configuración
+CHANGE_FEED_BACKEND = os.getenv("CHANGE_FEED_BACKEND", "redis")  # "redis" | "memory" (un solo worker)
+CHANGE_FEED_RETENTION = int(os.getenv("CHANGE_FEED_RETENTION", 1000))  # eventos por usuario para reanudar
+CHANGE_FEED_TTL = int(os.getenv("CHANGE_FEED_TTL", 7 * 24 * 3600))  # segundos sin cambios hasta borrar el historial
+CHANGE_FEED_QUEUE_SIZE = int(os.getenv("CHANGE_FEED_QUEUE_SIZE", 100))  # eventos pendientes por conexión
+CHANGE_FEED_RESUME_BATCH = int(os.getenv("CHANGE_FEED_RESUME_BATCH", 200))
+CHANGE_FEED_HEARTBEAT = float(os.getenv("CHANGE_FEED_HEARTBEAT", 15))
+CHANGE_FEED_MAX_PER_USER = int(os.getenv("CHANGE_FEED_MAX_PER_USER", 20))
+CHANGE_FEED_CHANNEL = os.getenv("CHANGE_FEED_CHANNEL", "task_changes")
+
+# (id del evento, JSON ya serializado): se serializa una vez y se reparte tal cual
+Event = Tuple[str, str]
+
+# Guarda el evento en el stream del usuario y lo anuncia a todos los workers en
+# una sola operación atómica, así el id publicado es el mismo con el que se
+# reanuda. El recorte es explícito (por lotes de ``slack`` eventos) para
+# apuntar el último id descartado: es lo que permite distinguir un cursor
+# demasiado antiguo de uno anterior a que el stream existiera.
+PUBLISH_LUA = """
+local id = redis.call('XADD', KEYS[1], '*', 'data', ARGV[2])
+local excess = redis.call('XLEN', KEYS[1]) - tonumber(ARGV[1])
+if excess > tonumber(ARGV[6]) then
+    local old = redis.call('XRANGE', KEYS[1], '-', '+', 'COUNT', excess)
+    for _, entry in ipairs(old) do
+        redis.call('XDEL', KEYS[1], entry[1])
+    end
+    redis.call('SET', KEYS[2], old[#old][1])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    redis.call('EXPIRE', KEYS[2], ARGV[3])
+end
+redis.call('PUBLISH', ARGV[4], ARGV[5] .. ' ' .. id .. ' ' .. ARGV[2])
+return id
+"""
+
+def id_key(event_id: str) -> Tuple[int, int]:
+    """Ids con el formato de Redis Streams (``<ms>-<seq>``), comparables como tuplas"""
+    ms, _, seq = event_id.partition("-")
+    return int(ms), int(seq or 0)
+
+def is_event_id(value: str) -> bool:
+    try:
+        id_key(value)
+    except ValueError:
+        return False
+    return True
+
+def stream_key(user_id: int) -> str:
+    return f"{CHANGE_FEED_CHANNEL}:{user_id}"
+
+class Subscriber:
+    """Una conexión abierta: buzón acotado y último id entregado.
+
+    El buzón es una ``deque`` que solo existe mientras hay eventos pendientes y
+    un único futuro mientras la conexión espera; una conexión inactiva ocupa
+    bastante menos que con ``asyncio.Queue`` (tres deques por cola).
+    """
+
+    __slots__ = ("user_id", "maxsize", "pending", "last_id", "overflowed", "_waiter")
+
+    def __init__(self, user_id: int, last_id: str, maxsize: int = CHANGE_FEED_QUEUE_SIZE):
+        self.user_id = user_id
+        self.maxsize = maxsize
+        self.pending: Optional[Deque[Event]] = None
+        self.last_id = last_id
+        self.overflowed = False
+        self._waiter: Optional[asyncio.Future] = None
+
+    def offer(self, event: Event) -> bool:
+        """Encola sin bloquear; devuelve ``True`` si el buzón acaba de desbordarse.
+
+        Desde ese momento la conexión deja de recibir y se pondrá al día desde
+        el historial cuando vacíe el buzón.
+        """
+        if self.overflowed:
+            return False
+        if self.pending is None:
+            self.pending = deque()
+        if len(self.pending) >= self.maxsize:
+            self.mark_overflowed()
+            return True
+        self.pending.append(event)
+        self._wake()
+        return False
+
+    def mark_overflowed(self):
+        self.overflowed = True
+        self._wake()
+
+    def _wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def get(self, timeout: float) -> Optional[Event]:
+        """Siguiente evento del buzón; ``None`` si vence ``timeout`` o hay que ponerse al día"""
+        if not self.pending and not self.overflowed:
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                # asyncio.timeout no crea una tarea extra por conexión como wait_for
+                async with asyncio.timeout(timeout):
+                    await self._waiter
+            except TimeoutError:
+                return None
+            finally:
+                self._waiter = None
+        if not self.pending:
+            return None
+        event = self.pending.popleft()
+        if not self.pending:
+            self.pending = None
+        return event
+
+class MemoryChangeLog:
+    """Historial por usuario en proceso; solo reparte eventos dentro del worker"""
+
+    def __init__(self, retention: int = CHANGE_FEED_RETENTION):
+        self.retention = retention
+        self._events: Dict[int, Deque[Event]] = defaultdict(deque)
+        self._trimmed: Dict[int, str] = {}
+        self._last = (int(time.time() * 1000), 0)
+        # Ids anteriores al arranque no se pueden reanudar: el historial se perdió
+        self.started_id = f"{self._last[0]}-0"
+
+    def _next_id(self) -> str:
+        ms = int(time.time() * 1000)
+        last_ms, last_seq = self._last
+        self._last = (ms, 0) if ms > last_ms else (last_ms, last_seq + 1)
+        return f"{self._last[0]}-{self._last[1]}"
+
+    async def append(self, user_id: int, data: str) -> str:
+        event_id = self._next_id()
+        events = self._events[user_id]
+        events.append((event_id, data))
+        if len(events) > self.retention:
+            self._trimmed[user_id] = events.popleft()[0]
+        return event_id
+
+    async def latest(self, user_id: int) -> str:
+        events = self._events.get(user_id)
+        return events[-1][0] if events else self.started_id
+
+    async def history(self, user_id: int, after: str, count: int) -> Optional[List[Event]]:
+        """Eventos posteriores a ``after``; ``None`` si parte de ellos ya no está en el historial"""
+        cursor = id_key(after)
+        trimmed = self._trimmed.get(user_id)
+        if cursor < id_key(self.started_id) or (trimmed and cursor < id_key(trimmed)):
+            return None
+        events = self._events.get(user_id) or ()
+        return [event for event in events if id_key(event[0]) > cursor][:count]
+
+class RedisChangeLog:
+    """Un stream por usuario (``task_changes:<id>``) con los últimos ``retention`` eventos.
+
+    ``task_changes:<id>:trimmed`` guarda el último id descartado. Los streams
+    caducan tras ``ttl`` segundos sin cambios, así que un cursor más antiguo
+    que eso tampoco se puede reanudar.
+    """
+
+    def __init__(self, client, retention: int = CHANGE_FEED_RETENTION, ttl: int = CHANGE_FEED_TTL):
+        self.client = client
+        self.retention = retention
+        self.ttl = ttl
+        self.slack = max(1, retention // 10)
+        self._script = client.register_script(PUBLISH_LUA)
+
+    async def append(self, user_id: int, data: str) -> str:
+        key = stream_key(user_id)
+        return await self._script(
+            keys=[key, f"{key}:trimmed"],
+            args=[self.retention, data, self.ttl, CHANGE_FEED_CHANNEL, user_id, self.slack]
+        )
+
+    async def latest(self, user_id: int) -> str:
+        entries = await self.client.xrevrange(stream_key(user_id), count=1)
+        return entries[0][0] if entries else "0-0"
+
+    async def history(self, user_id: int, after: str, count: int) -> Optional[List[Event]]:
+        """Eventos posteriores a ``after``; ``None`` si parte de ellos ya no está en el historial"""
+        key = stream_key(user_id)
+        cursor = id_key(after)
+        if cursor != (0, 0) and cursor[0] < (time.time() - self.ttl) * 1000:
+            return None
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.get(f"{key}:trimmed")
+            pipe.xrange(key, min=after, count=count + 1)
+            trimmed, entries = await pipe.execute()
+        if trimmed and cursor < id_key(trimmed):
+            return None
+        return [(event_id, fields["data"]) for event_id, fields in entries if event_id != after][:count]
+
+class ChangeFeed:
+    """Reparte los cambios de tareas a las conexiones abiertas (``GET /tasks:changes``).
+
+    Con Redis, cada escritura se guarda en el stream del usuario y se anuncia
+    por pub/sub; un único lector por worker reparte los anuncios a los buzones
+    de sus conexiones. Una conexión lenta no acumula memoria: al llenarse su
+    buzón deja de recibir y, cuando lo vacía, se pone al día leyendo el stream
+    desde su último id. El mismo mecanismo sirve para reanudar tras reconectar
+    (``Last-Event-ID``) y tras una caída del lector.
+    """
+
+    def __init__(self, log=None, client=None, heartbeat: float = CHANGE_FEED_HEARTBEAT):
+        self.log = log or MemoryChangeLog()
+        self.client = client
+        self.heartbeat = heartbeat
+        self._subscribers: Dict[int, Set[Subscriber]] = defaultdict(set)
+        self._task: Optional[asyncio.Task] = None
+        self.counters = {
+            "published": 0,
+            "publish_errors": 0,
+            "delivered": 0,
+            "overflows": 0,
+            "catch_ups": 0,
+            "resets": 0,
+            "reader_errors": 0,
+        }
+
+    async def start(self):
+        if self.client is not None and self._task is None:
+            self._task = asyncio.create_task(self._listen(), name="change-feed-reader")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def publish(self, user_id: int, event_type: str, **payload):
+        """Emite un cambio tras el commit; un fallo de Redis no afecta a la escritura"""
+        data = json.dumps({"type": event_type, **payload}, ensure_ascii=False, default=str)
+        try:
+            event_id = await self.log.append(user_id, data)
+        except RedisError as e:
+            self.counters["publish_errors"] += 1
+            logger.warning("No se pudo publicar el cambio %s del usuario %s: %s", event_type, user_id, e)
+            return
+        self.counters["published"] += 1
+        if self.client is None:
+            # Sin Redis no hay lector: se reparte directamente en este worker
+            self._dispatch(user_id, (event_id, data))
+
+    def _dispatch(self, user_id: int, event: Event):
+        for subscriber in self._subscribers.get(user_id, ()):
+            if subscriber.offer(event):
+                self.counters["overflows"] += 1
+
+    async def _listen(self):
+        delay = 0.5
+        while True:
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(CHANGE_FEED_CHANNEL)
+                delay = 0.5
+                while True:
+                    message = await pubsub.get_message(timeout=1.0)
+                    if message is None:
+                        continue
+                    user_id, event_id, data = message["data"].split(" ", 2)
+                    self._dispatch(int(user_id), (event_id, data))
+            except asyncio.CancelledError:
+                raise
+            except (RedisError, OSError, ValueError) as e:
+                self.counters["reader_errors"] += 1
+                logger.warning("Lector de cambios desconectado, reintentando en %.1fs: %s", delay, e)
+                # Los anuncios perdidos mientras tanto se recuperan desde los streams
+                for subscribers in self._subscribers.values():
+                    for subscriber in subscribers:
+                        subscriber.mark_overflowed()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 10)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except RedisError:
+                    pass
+
+    def has_capacity(self, user_id: int) -> bool:
+        return len(self._subscribers.get(user_id, ())) < CHANGE_FEED_MAX_PER_USER
+
+    async def subscribe(self, user_id: int, last_event_id: Optional[str] = None) -> Subscriber:
+        # El cursor se fija antes de registrar la conexión; lo publicado entre
+        # medias llega por la puesta al día inicial de ``events``
+        cursor = last_event_id or await self.log.latest(user_id)
+        subscriber = Subscriber(user_id, cursor)
+        self._subscribers[user_id].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscribers = self._subscribers.get(subscriber.user_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[subscriber.user_id]
+
+    def _format(self, subscriber: Subscriber, event: Event) -> str:
+        subscriber.last_id = event[0]
+        self.counters["delivered"] += 1
+        return f"id: {event[0]}\ndata: {event[1]}\n\n"
+
+    async def _catch_up(self, subscriber: Subscriber) -> AsyncIterator[str]:
+        """Entrega desde el historial lo posterior a ``last_id``, por lotes"""
+        self.counters["catch_ups"] += 1
+        while True:
+            events = await self.log.history(subscriber.user_id, subscriber.last_id, CHANGE_FEED_RESUME_BATCH)
+            if events is None:
+                # Hueco mayor que el historial: el cliente debe recargar la lista
+                self.counters["resets"] += 1
+                event_id = await self.log.latest(subscriber.user_id)
+                yield self._format(subscriber, (event_id, json.dumps({"type": "reset"})))
+                return
+            for event in events:
+                yield self._format(subscriber, event)
+            if len(events) < CHANGE_FEED_RESUME_BATCH:
+                return
+
+    async def events(self, user_id: int, last_event_id: Optional[str] = None) -> AsyncIterator[str]:
+        """Cuerpo SSE de una conexión: puesta al día, eventos en vivo y heartbeats.
+
+        La suscripción se crea al empezar a enviar, así una petición cancelada
+        antes de la respuesta no deja buzones registrados.
+        """
+        yield "retry: 3000\n\n"
+        try:
+            subscriber = await self.subscribe(user_id, last_event_id)
+        except RedisError as e:
+            logger.warning("No se pudo abrir el feed de cambios del usuario %s: %s", user_id, e)
+            return
+        try:
+            async for chunk in self._catch_up(subscriber):
+                yield chunk
+            while True:
+                if subscriber.overflowed and not subscriber.pending:
+                    subscriber.overflowed = False
+                    async for chunk in self._catch_up(subscriber):
+                        yield chunk
+                event = await subscriber.get(self.heartbeat)
+                if event is None:
+                    if not subscriber.overflowed:
+                        yield ": ping\n\n"
+                    continue
+                # La puesta al día puede haber entregado ya lo que estaba en el buzón
+                if id_key(event[0]) <= id_key(subscriber.last_id):
+                    continue
+                yield self._format(subscriber, event)
+        except RedisError as e:
+            # Se cierra el stream; el cliente reconecta con Last-Event-ID y se pone al día
+            logger.warning("Feed de cambios del usuario %s interrumpido: %s", user_id, e)
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "backend": "redis" if self.client is not None else "memory",
+            "users": len(self._subscribers),
+            "subscribers": sum(len(subscribers) for subscribers in self._subscribers.values()),
+            "reader_running": self._task is not None and not self._task.done(),
+        }
+
+def build_change_feed() -> ChangeFeed:
+    if CHANGE_FEED_BACKEND == "memory":
+        return ChangeFeed(MemoryChangeLog())
+    return ChangeFeed(RedisChangeLog(redis_client), client=redis_client)
+
+change_feed = build_change_feed()
@@ -0,0 +1,297 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .batch_suggestions import estimate_tokens
+from .database import AsyncSessionLocal
+from .llm_gateway import LLMGateway, llm_gateway
+from .models import ChatMessage, ChatSession
+from .prompts import CHAT_SUMMARY_PROMPT, CHAT_SYSTEM_PROMPT
+from .usage_recorder import usage_recorder
+
+logger = logging.getLogger(__name__)
+
+# Configuración
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", 3000))  # resumen + turnos enviados en cada petición
+CHAT_COMPACT_THRESHOLD = int(os.getenv("CHAT_COMPACT_THRESHOLD", 2000))  # tokens sin resumir que disparan la compactación
+CHAT_KEEP_RECENT_TOKENS = int(os.getenv("CHAT_KEEP_RECENT_TOKENS", 800))  # turnos recientes que no se resumen
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", 400))
+CHAT_SUMMARY_MODEL = os.getenv("CHAT_SUMMARY_MODEL", "")  # vacío: el modelo de la sesión
+CHAT_WINDOW_MAX_MESSAGES = int(os.getenv("CHAT_WINDOW_MAX_MESSAGES", 200))
+
+SYSTEM_PROMPT_TOKENS = estimate_tokens(CHAT_SYSTEM_PROMPT)
+
+def session_info(session: ChatSession) -> dict:
+    """Datos públicos de una sesión, con los tokens de prompt ahorrados frente a reenviar todo el historial"""
+    return {
+        "id": session.id,
+        "title": session.title,
+        "model": session.model,
+        "message_count": session.message_count,
+        "summary": session.summary,
+        "compactions": session.compactions,
+        "history_tokens": session.history_tokens,
+        "prompt_tokens_sent": session.prompt_tokens_sent,
+        "prompt_tokens_saved": session.prompt_tokens_full - session.prompt_tokens_sent,
+        "created_at": session.created_at,
+        "updated_at": session.updated_at,
+    }
+
+async def get_user_session(db: AsyncSession, session_id: int, user_id: int) -> Optional[ChatSession]:
+    result = await db.execute(
+        select(ChatSession).where(ChatSession.id == session_id, ChatSession.user_id == user_id)
+    )
+    return result.scalar_one_or_none()
+
+async def recent_messages(db: AsyncSession, session_id: int, limit: int) -> List[dict]:
+    result = await db.execute(
+        select(ChatMessage)
+        .where(ChatMessage.session_id == session_id)
+        .order_by(ChatMessage.id.desc())
+        .limit(limit)
+    )
+    return [
+        {"id": message.id, "role": message.role, "content": message.content, "created_at": message.created_at}
+        for message in reversed(result.scalars().all())
+    ]
+
+async def delete_session(db: AsyncSession, session: ChatSession):
+    await db.execute(delete(ChatMessage).where(ChatMessage.session_id == session.id))
+    await db.delete(session)
+    await db.commit()
+
+async def build_prompt(
+    db: AsyncSession,
+    session: ChatSession,
+    message: str,
+    budget: int = CHAT_HISTORY_TOKEN_BUDGET,
+) -> Tuple[List[dict], int]:
+    """Mensajes de un turno y sus tokens estimados.
+
+    El orden es fijo: prompt de sistema, resumen y turnos aún sin resumir. Entre
+    dos compactaciones cada petición solo añade al final de la anterior, así que
+    el proveedor puede reutilizar el prefijo cacheado. Si el historial pendiente
+    no cabe en ``budget`` (la compactación va retrasada o falló) se descartan
+    los turnos más antiguos.
+    """
+    message_tokens = estimate_tokens(message)
+    available = budget - session.summary_tokens - message_tokens
+    result = await db.execute(
+        select(ChatMessage.role, ChatMessage.content, ChatMessage.tokens)
+        .where(ChatMessage.session_id == session.id, ChatMessage.id > session.summarized_through)
+        .order_by(ChatMessage.id.desc())
+        .limit(CHAT_WINDOW_MAX_MESSAGES)
+    )
+    window, window_tokens = [], 0
+    for role, content, tokens in result:
+        if window_tokens + tokens > available:
+            break
+        window.append({"role": role, "content": content})
+        window_tokens += tokens
+    window.reverse()
+
+    messages = [{"role": "system", "content": CHAT_SYSTEM_PROMPT}]
+    if session.summary:
+        messages.append({"role": "system", "content": f"Resumen de la conversación anterior:\n{session.summary}"})
+    messages += window
+    messages.append({"role": "user", "content": message})
+    return messages, SYSTEM_PROMPT_TOKENS + session.summary_tokens + window_tokens + message_tokens
+
+def full_prompt_tokens(session: ChatSession, message: str) -> int:
+    """Tokens que enviaría un cliente sin estado reenviando la conversación completa"""
+    return SYSTEM_PROMPT_TOKENS + session.history_tokens + estimate_tokens(message)
+
+async def record_turn(
+    session_id: int,
+    message: str,
+    reply: str,
+    prompt_tokens: int,
+    full_tokens: int,
+    session_factory=AsyncSessionLocal,
+) -> Optional[ChatSession]:
+    """Guarda la pregunta y la respuesta de un turno y acumula los contadores de la sesión"""
+    message_tokens, reply_tokens = estimate_tokens(message), estimate_tokens(reply)
+    async with session_factory() as db:
+        db.add_all([
+            ChatMessage(session_id=session_id, role="user", content=message, tokens=message_tokens),
+            ChatMessage(session_id=session_id, role="assistant", content=reply, tokens=reply_tokens),
+        ])
+        await db.execute(
+            update(ChatSession)
+            .where(ChatSession.id == session_id)
+            .values(
+                message_count=ChatSession.message_count + 2,
+                history_tokens=ChatSession.history_tokens + message_tokens + reply_tokens,
+                pending_tokens=ChatSession.pending_tokens + message_tokens + reply_tokens,
+                prompt_tokens_sent=ChatSession.prompt_tokens_sent + prompt_tokens,
+                prompt_tokens_full=ChatSession.prompt_tokens_full + full_tokens,
+                updated_at=datetime.utcnow(),
+            )
+        )
+        await db.commit()
+        return await db.get(ChatSession, session_id)
+
+async def finish_turn(session_id: int, message: str, reply: str, prompt_tokens: int, full_tokens: int) -> dict:
+    """Persiste el turno, programa la compactación si toca y devuelve el uso de tokens del turno"""
+    session = await record_turn(session_id, message, reply, prompt_tokens, full_tokens)
+    usage = {"prompt_tokens": prompt_tokens, "prompt_tokens_saved": full_tokens - prompt_tokens}
+    if session is not None:
+        chat_compactor.schedule(session.id, session.pending_tokens)
+        usage["session_prompt_tokens_saved"] = session.prompt_tokens_full - session.prompt_tokens_sent
+    return usage
+
+def summary_request(previous: Optional[str], messages: List[ChatMessage]) -> List[dict]:
+    lines = []
+    if previous:
+        lines += ["Resumen previo:", previous, ""]
+    lines.append("Conversación:")
+    for message in messages:
+        lines.append(f"{'Usuario' if message.role == 'user' else 'Asistente'}: {message.content}")
+    return [
+        {"role": "system", "content": CHAT_SUMMARY_PROMPT},
+        {"role": "user", "content": "\n".join(lines)},
+    ]
+
+class ChatCompactor:
+    """Resume en segundo plano los turnos antiguos de las sesiones de chat.
+
+    Cuando los tokens sin resumir de una sesión pasan de ``threshold`` se lanza
+    una tarea que pide al modelo un resumen nuevo (el anterior más los turnos a
+    plegar), dejando literales los últimos ``keep_recent`` tokens. El resumen se
+    guarda con un UPDATE condicionado al ``summarized_through`` leído, así que
+    dos compactaciones de la misma sesión (p. ej. en procesos distintos) no se
+    pisan: la segunda no escribe nada.
+    """
+
+    def __init__(
+        self,
+        threshold: int = CHAT_COMPACT_THRESHOLD,
+        keep_recent: int = CHAT_KEEP_RECENT_TOKENS,
+        summary_tokens: int = CHAT_SUMMARY_MAX_TOKENS,
+        model: str = CHAT_SUMMARY_MODEL,
+        session_factory=AsyncSessionLocal,
+        gateway: LLMGateway = llm_gateway,
+    ):
+        self.threshold = threshold
+        self.keep_recent = keep_recent
+        self.summary_tokens = summary_tokens
+        self.model = model
+        self.session_factory = session_factory
+        self.gateway = gateway
+        self._running = False
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self.counters = {
+            "compactions": 0,
+            "conflicts": 0,
+            "failures": 0,
+            "messages_folded": 0,
+            "tokens_folded": 0,
+            "summary_tokens": 0,
+        }
+
+    async def start(self):
+        self._running = True
+
+    async def stop(self):
+        """Cancela las compactaciones en curso; se repetirán en el siguiente turno de cada sesión"""
+        self._running = False
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def schedule(self, session_id: int, pending_tokens: int) -> bool:
+        if not self._running or pending_tokens < self.threshold or session_id in self._tasks:
+            return False
+        task = asyncio.create_task(self.compact(session_id), name=f"chat-compact-{session_id}")
+        self._tasks[session_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(session_id, None))
+        return True
+
+    async def join(self):
+        """Espera a las compactaciones en curso (útil en pruebas)"""
+        await asyncio.gather(*list(self._tasks.values()), return_exceptions=True)
+
+    async def compact(self, session_id: int) -> bool:
+        try:
+            return await self._compact(session_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.counters["failures"] += 1
+            logger.exception("Error compactando la sesión de chat %s", session_id)
+            return False
+
+    async def _compact(self, session_id: int) -> bool:
+        async with self.session_factory() as db:
+            session = await db.get(ChatSession, session_id)
+            if session is None:
+                return False
+            result = await db.execute(
+                select(ChatMessage)
+                .where(ChatMessage.session_id == session_id, ChatMessage.id > session.summarized_through)
+                .order_by(ChatMessage.id)
+            )
+            messages = result.scalars().all()
+            user_id, model = session.user_id, self.model or session.model
+            previous, through = session.summary, session.summarized_through
+
+        # Se conservan literales los turnos más recientes, empezando siempre por una pregunta
+        cut, kept = len(messages), 0
+        while cut > 0 and kept + messages[cut - 1].tokens <= self.keep_recent:
+            cut -= 1
+            kept += messages[cut].tokens
+        while cut < len(messages) and messages[cut].role != "user":
+            cut += 1
+        folded = messages[:cut]
+        if not folded:
+            return False
+
+        request = summary_request(previous, folded)
+        response = await self.gateway.chat_completion(
+            model=model,
+            messages=request,
+            max_tokens=self.summary_tokens,
+            temperature=0.2,
+        )
+        summary = (response.choices[0].message.content or "").strip()
+        if not summary:
+            raise ValueError("El modelo devolvió un resumen vacío")
+        usage = getattr(response, "usage", None)
+        tokens = usage.total_tokens if usage is not None else estimate_tokens(request[1]["content"]) + estimate_tokens(summary)
+        usage_recorder.record(user_id, model, tokens, endpoint="/chat/sessions")
+
+        folded_tokens = sum(message.tokens for message in folded)
+        summary_tokens = estimate_tokens(summary)
+        async with self.session_factory() as db:
+            result = await db.execute(
+                update(ChatSession)
+                .where(ChatSession.id == session_id, ChatSession.summarized_through == through)
+                .values(
+                    summary=summary,
+                    summary_tokens=summary_tokens,
+                    summarized_through=folded[-1].id,
+                    pending_tokens=ChatSession.pending_tokens - folded_tokens,
+                    compactions=ChatSession.compactions + 1,
+                )
+            )
+            await db.commit()
+        if result.rowcount == 0:
+            self.counters["conflicts"] += 1
+            return False
+        self.counters["compactions"] += 1
+        self.counters["messages_folded"] += len(folded)
+        self.counters["tokens_folded"] += folded_tokens
+        self.counters["summary_tokens"] += summary_tokens
+        return True
+
+    def stats(self) -> dict:
+        return {**self.counters, "in_progress": len(self._tasks), "running": self._running}
+
+chat_compactor = ChatCompactor()
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Configuración
+COMPLETION_CACHE_ENABLED = os.getenv("COMPLETION_CACHE_ENABLED", "1") == "1"
+COMPLETION_CACHE_TTL = int(os.getenv("COMPLETION_CACHE_TTL", 3600))
+COMPLETION_CACHE_MAX_ENTRIES = int(os.getenv("COMPLETION_CACHE_MAX_ENTRIES", 1024))
+COMPLETION_CACHE_MAX_BYTES = int(os.getenv("COMPLETION_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+COMPLETION_CACHE_REDIS = os.getenv("COMPLETION_CACHE_REDIS", "0") == "1"
+
+class CompletionCache:
+    """Caché de respuestas del LLM direccionada por contenido.
+
+    La clave es un hash de (modelo, mensajes, temperatura). El primer nivel es un
+    LRU en memoria con TTL y límite de entradas y bytes; opcionalmente se consulta
+    un segundo nivel en Redis compartido entre workers.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = COMPLETION_CACHE_ENABLED,
+        ttl: int = COMPLETION_CACHE_TTL,
+        max_entries: int = COMPLETION_CACHE_MAX_ENTRIES,
+        max_bytes: int = COMPLETION_CACHE_MAX_BYTES,
+        prefix: str = "llm_cache:",
+    ):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.prefix = prefix
+        self.redis = None
+        self._entries: OrderedDict = OrderedDict()
+        self._bytes = 0
+        self.counters = {
+            "memory_hits": 0,
+            "redis_hits": 0,
+            "misses": 0,
+            "sets": 0,
+            "evictions": 0,
+            "redis_errors": 0,
+        }
+
+    def attach_redis(self, client):
+        """Activa el nivel Redis reutilizando un cliente ``redis.asyncio`` existente"""
+        self.redis = client
+
+    @staticmethod
+    def make_key(model: str, messages: list, temperature: Optional[float] = None) -> str:
+        payload = json.dumps(
+            {"model": model, "messages": messages, "temperature": temperature},
+            sort_keys=True,
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value, _ = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return value
+            self._evict(key)
+
+        if self.redis is not None:
+            try:
+                value = await self.redis.get(self.prefix + key)
+            except Exception as e:
+                self.counters["redis_errors"] += 1
+                logger.warning("Error leyendo la caché de completions en Redis: %s", e)
+                value = None
+            if value is not None:
+                self.counters["redis_hits"] += 1
+                self._store(key, value)
+                return value
+
+        self.counters["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: str):
+        if not self.enabled or not value:
+            return
+        self.counters["sets"] += 1
+        self._store(key, value)
+        if self.redis is not None:
+            try:
+                await self.redis.set(self.prefix + key, value, ex=self.ttl)
+            except Exception as e:
+                self.counters["redis_errors"] += 1
+                logger.warning("Error escribiendo la caché de completions en Redis: %s", e)
+
+    def stats(self) -> dict:
+        lookups = self.counters["memory_hits"] + self.counters["redis_hits"] + self.counters["misses"]
+        hits = lookups - self.counters["misses"]
+        return {
+            **self.counters,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def _store(self, key: str, value: str):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._evict(key)
+        self._entries[key] = (time.monotonic() + self.ttl, value, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._evict(oldest)
+            self.counters["evictions"] += 1
+
+    def _evict(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+completion_cache = CompletionCache()
@@ -8,4 +8,15 @@ class TaskStatus(str, Enum):
 class TaskPriority(str, Enum):
     LOW = "LOW"
     MEDIUM = "MEDIUM"
-    HIGH = "HIGH" 
\ No newline at end of file
+    HIGH = "HIGH"
+
+class SuggestionJobStatus(str, Enum):
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"  # reclamado por un worker; ver ``SuggestionQueue._claim``
+    READY = "READY"
+    FAILED = "FAILED"
+
+class WebhookEventStatus(str, Enum):
+    PENDING = "PENDING"
+    PROCESSED = "PROCESSED"
+    FAILED = "FAILED"
@@ -0,0 +1,367 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import openai
+from dotenv import load_dotenv
+from openai import AsyncOpenAI
+
+from .metrics import observe_llm_call, observe_llm_first_token, observe_llm_tokens
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuración
+LLM_PROVIDER_ORDER = [p.strip() for p in os.getenv("LLM_PROVIDER_ORDER", "Groq,Fireworks").split(",") if p.strip()]
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", 5))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", 0.5))
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", 0))  # 0 desactiva el hedging
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 32))  # por modelo
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", 10))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 100))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", 20))
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", 5))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", 30))
+
+# Errores transitorios: se reintentan y cuentan para el circuit breaker
+RETRYABLE_ERRORS = (
+    openai.APIConnectionError,  # incluye APITimeoutError
+    openai.RateLimitError,
+    openai.InternalServerError,
+    httpx.TransportError,
+)
+
+class LLMUnavailableError(Exception):
+    """No hay proveedor disponible: circuitos abiertos, cola llena o reintentos agotados"""
+
+class CircuitOpenError(LLMUnavailableError):
+    """El circuito del proveedor se abrió entre la selección y la llamada"""
+
+class CircuitBreaker:
+    """Circuit breaker por modelo/proveedor.
+
+    Tras ``threshold`` fallos consecutivos se abre durante ``reset_timeout``
+    segundos; después deja pasar una única llamada de prueba (half-open) y se
+    cierra si tiene éxito.
+    """
+
+    def __init__(self, threshold: int = LLM_BREAKER_THRESHOLD, reset_timeout: float = LLM_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def available(self) -> bool:
+        """Indica si se puede intentar una llamada, sin reservar la prueba half-open"""
+        state = self.state
+        return state == "closed" or (state == "half-open" and not self._probing)
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def release_probe(self):
+        """La llamada de prueba se canceló sin resultado; se permite otra"""
+        self._probing = False
+
+class GatewayStream:
+    """Stream de OpenAI que devuelve el permiso de concurrencia del modelo al cerrarse.
+
+    El permiso se libera al agotar el stream, ante un error, con ``aclose`` o,
+    como último recurso, cuando el objeto se recolecta sin haberse iterado.
+    También mide el tiempo hasta el primer token y la duración total de la
+    llamada (desde que se pidió al gateway) y cuenta los tokens generados.
+    """
+
+    def __init__(self, stream, breaker: CircuitBreaker, release, model: str = "", started: Optional[float] = None):
+        self._stream = stream
+        self._breaker = breaker
+        self._release = release
+        self._model = model
+        self._started = time.perf_counter() if started is None else started
+        self._first_token = False
+        self._tokens = 0
+        self._usage = None
+        self._outcome: Optional[str] = None
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        try:
+            async for chunk in self._stream:
+                if chunk.choices and chunk.choices[0].delta.content is not None:
+                    if not self._first_token:
+                        self._first_token = True
+                        observe_llm_first_token(self._model, time.perf_counter() - self._started)
+                    self._tokens += 1
+                if getattr(chunk, "usage", None) is not None:
+                    self._usage = chunk.usage
+                yield chunk
+            self._outcome = "ok"
+        except RETRYABLE_ERRORS:
+            self._outcome = "error"
+            self._breaker.record_failure()
+            raise
+        except Exception:
+            self._outcome = "error"
+            raise
+        finally:
+            await self.aclose()
+
+    async def aclose(self):
+        self._record()
+        self._done()
+        response = getattr(self._stream, "response", None)
+        if response is not None:
+            await response.aclose()
+
+    def _record(self):
+        """Registra la llamada una sola vez; sin resultado, el consumidor la abandonó"""
+        if self._model is None:
+            return
+        outcome = self._outcome or "cancelled"
+        observe_llm_call(self._model, time.perf_counter() - self._started, outcome)
+        if self._usage is not None:
+            observe_llm_tokens(self._model, self._usage.prompt_tokens or 0, self._usage.completion_tokens or 0)
+        else:
+            observe_llm_tokens(self._model, 0, self._tokens)
+        self._model = None
+
+    def _done(self):
+        if self._release is not None:
+            self._release()
+            self._release = None
+
+    def __del__(self):
+        self._record()
+        self._done()
+
+class LLMGateway:
+    """Punto único de salida hacia OpenRouter.
+
+    Comparte un ``httpx.AsyncClient`` con keep-alive entre todas las llamadas,
+    limita la concurrencia por modelo y recorre ``provider_order`` como
+    failover: cada intento fija un único proveedor (``allow_fallbacks=False``)
+    para que el circuit breaker de ese par modelo/proveedor refleje su estado
+    real. Los reintentos usan backoff exponencial con jitter y, si
+    ``hedge_delay`` > 0, se lanza un segundo intento en paralelo contra el
+    siguiente proveedor cuando el primero tarda más de ese tiempo.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        provider_order: Optional[List[str]] = None,
+        timeout: float = LLM_TIMEOUT,
+        connect_timeout: float = LLM_CONNECT_TIMEOUT,
+        max_retries: int = LLM_MAX_RETRIES,
+        retry_backoff: float = LLM_RETRY_BACKOFF,
+        hedge_delay: float = LLM_HEDGE_DELAY,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        queue_timeout: float = LLM_QUEUE_TIMEOUT,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.provider_order = LLM_PROVIDER_ORDER if provider_order is None else provider_order
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.hedge_delay = hedge_delay
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.http_client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_KEEPALIVE),
+            transport=transport,
+        )
+        # Los reintentos los gestiona el gateway, no el SDK
+        self.client = AsyncOpenAI(
+            api_key=api_key or os.getenv("OPENROUTER_API_KEY"),
+            base_url=base_url or os.getenv("BASE_URL"),
+            http_client=self.http_client,
+            max_retries=0,
+        )
+        self._breakers: Dict[Tuple[str, Optional[str]], CircuitBreaker] = defaultdict(CircuitBreaker)
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._in_flight: Dict[str, int] = defaultdict(int)
+        self.counters = {"calls": 0, "retries": 0, "hedges": 0, "failures": 0, "rejected": 0}
+
+    async def chat_completion(
+        self,
+        *,
+        model: str,
+        messages: List[dict],
+        stream: bool = False,
+        timeout: Optional[float] = None,
+        extra_body: Optional[dict] = None,
+        **kwargs
+    ):
+        """Equivalente a ``client.chat.completions.create`` con failover.
+
+        Con ``stream=True`` el permiso de concurrencia del modelo se mantiene
+        hasta que el stream se consume o se cierra.
+        """
+        self.counters["calls"] += 1
+        started = time.perf_counter()
+        semaphore = self._semaphore(model)
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.counters["rejected"] += 1
+            observe_llm_call(model, time.perf_counter() - started, "rejected")
+            raise LLMUnavailableError(f"Demasiadas peticiones en curso para {model}")
+        self._in_flight[model] += 1
+
+        def release():
+            self._in_flight[model] -= 1
+            semaphore.release()
+
+        request = dict(kwargs, model=model, messages=messages, stream=stream, timeout=timeout or self.timeout)
+        try:
+            response, breaker = await self._call_with_retries(model, request, extra_body or {})
+        except BaseException:
+            release()
+            observe_llm_call(model, time.perf_counter() - started, "error")
+            raise
+
+        if not stream:
+            release()
+            observe_llm_call(model, time.perf_counter() - started)
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                observe_llm_tokens(model, usage.prompt_tokens or 0, usage.completion_tokens or 0)
+            return response
+        return GatewayStream(response, breaker, release, model, started)
+
+    async def aclose(self):
+        await self.http_client.aclose()
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "in_flight": dict(self._in_flight),
+            "breakers": {f"{model}/{provider or '-'}": b.state for (model, provider), b in self._breakers.items()},
+        }
+
+    def _semaphore(self, model: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(model)
+        if semaphore is None:
+            semaphore = self._semaphores[model] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    def _providers(self, model: str) -> List[Optional[str]]:
+        """Proveedores con el circuito cerrado (o en prueba), en orden de preferencia"""
+        providers = self.provider_order or [None]
+        return [p for p in providers if self._breakers[(model, p)].available()]
+
+    async def _call_with_retries(self, model: str, request: dict, extra_body: dict):
+        last_error: Optional[Exception] = None
+        for attempt in range(self.max_retries + 1):
+            providers = self._providers(model)
+            if not providers:
+                break
+            if attempt:
+                self.counters["retries"] += 1
+                # Failover inmediato al siguiente proveedor; backoff solo al repetir la ronda
+                if attempt >= len(providers):
+                    await asyncio.sleep(self.retry_backoff * (2 ** (attempt - len(providers))) * random.uniform(0.5, 1.5))
+                shift = attempt % len(providers)
+                providers = providers[shift:] + providers[:shift]
+            try:
+                return await self._hedged_call(model, providers, request, extra_body)
+            except (CircuitOpenError, *RETRYABLE_ERRORS) as e:
+                last_error = e
+                logger.warning("Llamada a %s fallida (intento %s): %s", model, attempt + 1, e)
+        self.counters["failures"] += 1
+        if last_error is None:
+            raise LLMUnavailableError(f"Todos los proveedores de {model} tienen el circuito abierto")
+        raise LLMUnavailableError(f"Reintentos agotados para {model}: {last_error}") from last_error
+
+    async def _hedged_call(self, model: str, providers: List[Optional[str]], request: dict, extra_body: dict):
+        first = asyncio.create_task(self._call(model, providers[0], request, extra_body))
+        if self.hedge_delay <= 0 or len(providers) < 2:
+            return await first
+
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_delay)
+        if done:
+            return first.result()
+
+        self.counters["hedges"] += 1
+        pending = {first, asyncio.create_task(self._call(model, providers[1], request, extra_body))}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+            await self._discard(pending)
+
+    async def _discard(self, tasks):
+        """Cancela los intentos perdedores y cierra sus streams si llegaron a abrirse"""
+        for task in tasks:
+            try:
+                response, _ = await task
+            except BaseException:
+                continue
+            if isinstance(response, openai.AsyncStream):
+                await response.response.aclose()
+
+    async def _call(self, model: str, provider: Optional[str], request: dict, extra_body: dict):
+        breaker = self._breakers[(model, provider)]
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuito abierto para {model}/{provider}")
+        if provider is not None:
+            extra_body = {**extra_body, "provider": {"order": [provider], "allow_fallbacks": False}}
+        try:
+            response = await self.client.chat.completions.create(extra_body=extra_body or None, **request)
+        except RETRYABLE_ERRORS:
+            breaker.record_failure()
+            raise
+        except asyncio.CancelledError:
+            # Intento perdedor de un hedge: no es un fallo del proveedor
+            breaker.release_probe()
+            raise
+        breaker.record_success()
+        return response, breaker
+
+llm_gateway = LLMGateway()
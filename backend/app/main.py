@@ -1,39 +1,69 @@
-from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Request
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel
-from openai import AsyncOpenAI
+import anyio
 import asyncio
+import json
+import logging
 from dotenv import load_dotenv
 import os
 import stripe
 from .auth import (
     get_current_user,
     create_access_token,
-    get_password_hash,
-    verify_password,
-    generate_api_key
+    generate_api_key,
+    password_hasher
 )
-from .models import User, APIRequest, Subscription
-from .database import get_db
-from sqlalchemy.orm import Session
+from .models import ChatSession, User
+from .database import get_db, async_engine
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, List
-import redis
-from .task_router import router as task_router
+from .redis_pool import redis_client
+from .rate_limit import rate_limit
+from .task_router import router as task_router, suggestion_queue
+from .completion_cache import completion_cache, COMPLETION_CACHE_REDIS
+from .usage_recorder import usage_recorder
+from .user_cache import user_cache, USER_CACHE_REDIS
+from .llm_gateway import llm_gateway, LLMUnavailableError
+from .task_stats import stats_reconciler
+from .change_feed import change_feed
+from .row_encoding import warn_missing_encoders
+from .resource_versions import ACCOUNT, cache_headers, not_modified, resource_versions
+from .stripe_events import stripe_inbox
+from .chat_sessions import (
+    build_prompt,
+    chat_compactor,
+    delete_session,
+    finish_turn,
+    full_prompt_tokens,
+    get_user_session,
+    recent_messages,
+    session_info,
+)
+from .metrics import (
+    METRICS_ENABLED,
+    MetricsMiddleware,
+    instrument_engine,
+    loop_lag_monitor,
+    render_metrics,
+    require_metrics_token,
+)
 
 # Cargar variables de entorno
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Configurar Stripe
 stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
 
-# Configurar Redis para rate limiting
-redis_client = redis.Redis(
-    host=os.getenv("REDIS_HOST", "localhost"),
-    port=int(os.getenv("REDIS_PORT", 6379)),
-    db=0,
-    decode_responses=True
-)
+if COMPLETION_CACHE_REDIS:
+    completion_cache.attach_redis(redis_client)
+if USER_CACHE_REDIS:
+    user_cache.attach_redis(redis_client)
 
 app = FastAPI(
     title="AI Task Manager",
@@ -48,21 +78,55 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "X-RateLimit-Limit", "X-RateLimit-Remaining", "Retry-After"],
 )
 
+# Métricas por ruta; va la última para envolver al resto de middlewares
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    instrument_engine(async_engine.sync_engine)
+
 # Incluir el router de tareas
 app.include_router(task_router, prefix="/api", tags=["tasks"])
 
-# Cliente OpenAI global
-client = AsyncOpenAI(
-    api_key=os.getenv("OPENROUTER_API_KEY"),
-    base_url=os.getenv("BASE_URL")
-)
+@app.on_event("startup")
+async def start_background_workers():
+    warn_missing_encoders()
+    await suggestion_queue.start()
+    await usage_recorder.start()
+    await stats_reconciler.start()
+    await change_feed.start()
+    await stripe_inbox.start()
+    await chat_compactor.start()
+    if METRICS_ENABLED:
+        await loop_lag_monitor.start()
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    await suggestion_queue.stop()
+    await usage_recorder.stop()
+    await stats_reconciler.stop()
+    await change_feed.stop()
+    await stripe_inbox.stop()
+    await chat_compactor.stop()
+    await loop_lag_monitor.stop()
+    await redis_client.aclose()
+    await llm_gateway.aclose()
+    password_hasher.shutdown()
 
 # Modelos Pydantic
 class ChatRequest(BaseModel):
     message: str
     model: str = "qwen/qwq-32b:online"
+    stream: bool = False  # Opt-in: enviar la respuesta como Server-Sent Events
+
+class ChatSessionCreate(BaseModel):
+    model: str = "qwen/qwq-32b:online"
+    title: Optional[str] = None
+
+class ChatTurnRequest(BaseModel):
+    message: str
+    stream: bool = False
 
 class UserCreate(BaseModel):
     email: str
@@ -77,12 +141,13 @@ class SubscriptionCreate(BaseModel):
 
 # Endpoints de autenticación
 @app.post("/register", response_model=Token)
-async def register_user(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.email == user.email).first()
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(select(User).where(User.email == user.email))
+    db_user = result.scalar_one_or_none()
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await password_hasher.hash(user.password)
     api_key = generate_api_key()
     
     db_user = User(
@@ -91,112 +156,325 @@ async def register_user(user: UserCreate, db: Session = Depends(get_db)):
         api_key=api_key
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    await user_cache.invalidate(subject=db_user.email)
     
     access_token = create_access_token(data={"sub": user.email})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.post("/token", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.email == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    result = await db.execute(select(User).where(User.email == form_data.username))
+    user = result.scalar_one_or_none()
+    if not user:
         raise HTTPException(
             status_code=400,
             detail="Incorrect email or password"
         )
     
+    verified, new_hash = await password_hasher.verify_and_update(form_data.password, user.hashed_password)
+    if not verified:
+        raise HTTPException(
+            status_code=400,
+            detail="Incorrect email or password"
+        )
+    if new_hash:
+        # El coste de bcrypt cambió: se guarda el hash regenerado
+        user.hashed_password = new_hash
+        await db.commit()
+        await user_cache.invalidate(subject=user.email, user_id=user.id)
+    
     access_token = create_access_token(data={"sub": user.email})
     return {"access_token": access_token, "token_type": "bearer"}
 
-async def record_api_usage(user_id: int, model: str, tokens: int, db: Session):
-    """Registra el uso de la API en la base de datos"""
-    api_request = APIRequest(
-        user_id=user_id,
-        model=model,
-        tokens_used=tokens,
-        endpoint="/chat",
-        method="POST",
-        status_code=200
-    )
-    db.add(api_request)
-    db.commit()
+def record_api_usage(user_id: int, model: str, tokens: int):
+    """Registra el uso de la API; se escribe por lotes en segundo plano"""
+    usage_recorder.record(user_id=user_id, model=model, tokens=tokens)
 
 # Endpoint de chat con rate limiting y tracking de uso
-@app.post("/chat")
+@app.post("/chat", dependencies=[Depends(rate_limit("chat"))])
 async def chat(
     request: ChatRequest,
-    background_tasks: BackgroundTasks,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_user)
 ):
-    # Verificar rate limiting
-    rate_key = f"rate_limit:{current_user.id}"
-    requests = redis_client.get(rate_key)
-    if requests and int(requests) > 100:  # 100 requests per hour
-        raise HTTPException(status_code=429, detail="Rate limit exceeded")
-    
     # Verificar créditos
     if current_user.credits <= 0:
         raise HTTPException(status_code=402, detail="No credits remaining")
     
+    messages = [
+        {
+            "role": "user",
+            "content": request.message
+        }
+    ]
+    
+    # Respuestas idénticas se sirven desde la caché sin llamar a OpenRouter
+    cache_key = completion_cache.make_key(request.model, messages)
+    cached = await completion_cache.get(cache_key)
+    if cached is not None:
+        record_api_usage(current_user.id, request.model, tokens=0)
+        if request.stream:
+            return StreamingResponse(
+                replay_cached_events(cached),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+        return {"response": cached, "cached": True}
+    
     try:
-        stream = await client.chat.completions.create(
+        stream = await llm_gateway.chat_completion(
             extra_headers={
                 "HTTP-Referer": "https://your-site.com",
                 "X-Title": "Your Application",
             },
             model=request.model,
-            messages=[
-                {
-                    "role": "user",
-                    "content": request.message
-                }
-            ],
-            stream=True,
-            extra_body={
-                "provider": {
-                    "order": ["Groq","Fireworks"],
-                    "allow_fallbacks": False
-                }
-            }
+            messages=messages,
+            stream=True
         )
-        
-        response_text = ""
+    except LLMUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if request.stream:
+        return StreamingResponse(
+            stream_chat_events(stream, current_user.id, request.model, cache_key),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    try:
+        parts = []
         tokens_used = 0
         
         async for chunk in stream:
-            if chunk.choices[0].delta.content is not None:
-                response_text += chunk.choices[0].delta.content
+            if chunk.choices and chunk.choices[0].delta.content is not None:
+                parts.append(chunk.choices[0].delta.content)
                 tokens_used += 1
         
-        # Registrar uso en background
-        background_tasks.add_task(
-            record_api_usage,
-            user_id=current_user.id,
-            model=request.model,
-            tokens=tokens_used,
-            db=db
-        )
+        record_api_usage(current_user.id, request.model, tokens_used)
         
+        response_text = "".join(parts)
+        await completion_cache.set(cache_key, response_text)
         return {"response": response_text}
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-async def handle_successful_subscription(session: dict, db: Session):
-    """Maneja una suscripción exitosa"""
-    user = db.query(User).filter(User.email == session.customer_email).first()
-    if user:
-        subscription = Subscription(
-            user_id=user.id,
-            stripe_subscription_id=session.subscription,
-            plan_id=session.line_items[0].price.id,
-            status="active",
-            current_period_end=session.subscription.current_period_end
+def sse_event(data: dict) -> str:
+    """Formatea un evento Server-Sent Events"""
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def stream_chat_events(
+    stream,
+    user_id: int,
+    model: str,
+    cache_key: str
+):
+    """Reenvía los deltas del modelo al cliente a medida que llegan"""
+    parts = []
+    tokens_used = 0
+    try:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content is not None:
+                parts.append(chunk.choices[0].delta.content)
+                tokens_used += 1
+                yield sse_event({"delta": chunk.choices[0].delta.content})
+        await completion_cache.set(cache_key, "".join(parts))
+        yield sse_event({"done": True, "tokens": tokens_used})
+        yield "data: [DONE]\n\n"
+    except Exception as e:
+        yield sse_event({"error": str(e)})
+    finally:
+        # Se registra una sola vez al cerrar el stream, incluso si el cliente se desconecta
+        record_api_usage(user_id, model, tokens_used)
+
+async def replay_cached_events(text: str):
+    """Devuelve una respuesta cacheada con el mismo formato que el stream"""
+    yield sse_event({"delta": text})
+    yield sse_event({"done": True, "tokens": 0, "cached": True})
+    yield "data: [DONE]\n\n"
+
+# Sesiones de chat: el servidor guarda los turnos y envía solo el resumen y los recientes
+@app.post("/chat/sessions")
+async def create_chat_session(
+    request: ChatSessionCreate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    session = ChatSession(user_id=current_user.id, model=request.model, title=request.title)
+    db.add(session)
+    await db.commit()
+    await db.refresh(session)
+    return session_info(session)
+
+@app.get("/chat/sessions")
+async def list_chat_sessions(
+    limit: int = Query(50, ge=1, le=200),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    result = await db.execute(
+        select(ChatSession)
+        .where(ChatSession.user_id == current_user.id)
+        .order_by(ChatSession.updated_at.desc())
+        .limit(limit)
+    )
+    return [session_info(session) for session in result.scalars()]
+
+@app.get("/chat/stats", dependencies=[Depends(require_metrics_token)])
+async def get_chat_stats():
+    return chat_compactor.stats()
+
+@app.get("/chat/sessions/{session_id}")
+async def get_chat_session(
+    session_id: int,
+    limit: int = Query(50, ge=1, le=500),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Sesión con sus ``limit`` mensajes más recientes (también los ya resumidos)"""
+    session = await get_user_session(db, session_id, current_user.id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    return {**session_info(session), "messages": await recent_messages(db, session_id, limit)}
+
+@app.delete("/chat/sessions/{session_id}")
+async def delete_chat_session(
+    session_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    session = await get_user_session(db, session_id, current_user.id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    await delete_session(db, session)
+    return {"message": "Chat session deleted successfully"}
+
+@app.post("/chat/sessions/{session_id}/messages", dependencies=[Depends(rate_limit("chat"))])
+async def chat_session_turn(
+    session_id: int,
+    request: ChatTurnRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    if current_user.credits <= 0:
+        raise HTTPException(status_code=402, detail="No credits remaining")
+    
+    session = await get_user_session(db, session_id, current_user.id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    messages, prompt_tokens = await build_prompt(db, session, request.message)
+    full_tokens = full_prompt_tokens(session, request.message)
+    model = session.model
+    # La conexión no se retiene mientras el modelo responde; el turno se guarda con su propia sesión
+    await db.close()
+    
+    try:
+        stream = await llm_gateway.chat_completion(
+            extra_headers={
+                "HTTP-Referer": "https://your-site.com",
+                "X-Title": "Your Application",
+            },
+            model=model,
+            messages=messages,
+            stream=True
+        )
+    except LLMUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    turn = (session_id, request.message, prompt_tokens, full_tokens)
+    if request.stream:
+        return StreamingResponse(
+            stream_session_events(stream, current_user.id, model, turn),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
         )
-        db.add(subscription)
-        db.commit()
+
+    try:
+        parts = []
+        tokens_used = 0
+        
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content is not None:
+                parts.append(chunk.choices[0].delta.content)
+                tokens_used += 1
+        
+        response_text = "".join(parts)
+        usage = await finish_turn(session_id, request.message, response_text, prompt_tokens, full_tokens)
+        record_api_usage(current_user.id, model, tokens_used)
+        return {"session_id": session_id, "response": response_text, "usage": usage}
+    
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def save_streamed_turn(user_id: int, model: str, turn: tuple, reply: str, tokens_used: int) -> Optional[dict]:
+    """Guarda el turno y cobra sus tokens; si no se puede guardar tampoco se cobra"""
+    session_id, message, prompt_tokens, full_tokens = turn
+    # Si el cliente se desconectó la tarea ya está cancelada: el guardado no debe interrumpirse
+    with anyio.CancelScope(shield=True):
+        try:
+            usage = await finish_turn(session_id, message, reply, prompt_tokens, full_tokens)
+        except Exception:
+            logger.exception("No se pudo guardar el turno de la sesión de chat %s", session_id)
+            return None
+    record_api_usage(user_id, model, tokens_used)
+    return usage
+
+async def stream_session_events(stream, user_id: int, model: str, turn: tuple):
+    """Como ``stream_chat_events``, pero guarda el turno en la sesión al terminar.
+
+    Si el stream se corta (error del proveedor o cliente desconectado) se
+    guarda la respuesta parcial ya enviada, y se cobra lo mismo que se guarda.
+    """
+    parts = []
+    tokens_used = 0
+    completed = False
+    usage = None
+    try:
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content is not None:
+                    parts.append(chunk.choices[0].delta.content)
+                    tokens_used += 1
+                    yield sse_event({"delta": chunk.choices[0].delta.content})
+            completed = True
+        finally:
+            if parts or completed:
+                usage = await save_streamed_turn(user_id, model, turn, "".join(parts), tokens_used)
+        if usage is None:
+            yield sse_event({"error": "Chat turn could not be saved"})
+        else:
+            yield sse_event({"done": True, "tokens": tokens_used, "usage": usage})
+            yield "data: [DONE]\n\n"
+    except Exception as e:
+        yield sse_event({"error": str(e)})
+
+@app.get("/cache/stats", dependencies=[Depends(require_metrics_token)])
+async def get_cache_stats():
+    return completion_cache.stats()
+
+@app.get("/llm/stats", dependencies=[Depends(require_metrics_token)])
+async def get_llm_stats():
+    return llm_gateway.stats()
+
+@app.get("/changes/stats", dependencies=[Depends(require_metrics_token)])
+async def get_change_feed_stats():
+    return change_feed.stats()
+
+@app.get("/etag/stats", dependencies=[Depends(require_metrics_token)])
+async def get_etag_stats():
+    return resource_versions.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(require_metrics_token)])
+async def get_metrics():
+    """Métricas en formato de texto de Prometheus"""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 # Endpoints de suscripción
 @app.post("/create-checkout-session")
@@ -207,8 +485,12 @@ async def create_checkout_session(
     try:
         checkout_session = stripe.checkout.Session.create(
             customer_email=current_user.email,
+            client_reference_id=str(current_user.id),
             line_items=[{"price": subscription.plan_id, "quantity": 1}],
             mode="subscription",
+            # El webhook identifica al usuario y al plan con estos metadatos
+            metadata={"user_id": str(current_user.id), "plan_id": subscription.plan_id},
+            subscription_data={"metadata": {"user_id": str(current_user.id)}},
             success_url="http://localhost:3000/success",
             cancel_url="http://localhost:3000/cancel",
         )
@@ -217,26 +499,34 @@ async def create_checkout_session(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/webhook")
-async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
-    payload = await request.body()
+async def stripe_webhook(request: Request, db: AsyncSession = Depends(get_db)):
+    """Verifica la firma y guarda el evento; se aplica en segundo plano (ver ``stripe_events``)"""
+    payload = (await request.body()).decode("utf-8")
     sig_header = request.headers.get("stripe-signature")
     
     try:
-        event = stripe.Webhook.construct_event(
+        stripe.Webhook.construct_event(
             payload, sig_header, os.getenv("STRIPE_WEBHOOK_SECRET")
         )
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
     
-    if event.type == "checkout.session.completed":
-        session = event.data.object
-        await handle_successful_subscription(session, db)
-    
-    return {"status": "success"}
+    result = await stripe_inbox.receive(db, payload)
+    return {"status": "success", "event": result}
+
+@app.get("/webhook/stats", dependencies=[Depends(require_metrics_token)])
+async def get_webhook_stats():
+    return stripe_inbox.stats()
 
 # Endpoint de información del usuario
 @app.get("/me")
-async def get_user_info(current_user: User = Depends(get_current_user)):
+async def get_user_info(request: Request, response: Response, current_user: User = Depends(get_current_user)):
+    # El usuario puede venir de la caché: su updated_at entra en el ETag para no
+    # fijar con una versión nueva una copia que aún no se ha invalidado
+    etag = await resource_versions.etag(ACCOUNT, current_user.id, current_user.updated_at)
+    if resource_versions.check(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
+    response.headers.update(cache_headers(etag))
     return {
         "email": current_user.email,
         "credits": current_user.credits,
@@ -0,0 +1,382 @@
+import asyncio
+import cProfile
+import hmac
+import logging
+import os
+import random
+import re
+import time
+from bisect import bisect_left
+from collections import deque
+from contextvars import ContextVar
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import Header, HTTPException
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Configuración
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_SLOW_REQUEST_MS = float(os.getenv("METRICS_SLOW_REQUEST_MS", 1000))  # 0 desactiva el log de peticiones lentas
+METRICS_LOOP_LAG_INTERVAL = float(os.getenv("METRICS_LOOP_LAG_INTERVAL", 0.5))  # 0 desactiva la medición
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))  # fracción de peticiones perfiladas; 0 lo desactiva
+PROFILE_THRESHOLD_MS = float(os.getenv("PROFILE_THRESHOLD_MS", 500))  # solo se guardan los perfiles más lentos
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", 100))  # se borran los más antiguos
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")  # Bearer de /metrics y /*/stats; vacío: acceso denegado
+
+# Límites superiores de los buckets (segundos salvo que se indique)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 4096, 16384)
+
+# Ruta de las peticiones que no coinciden con ninguna: la URL cruda dispararía la cardinalidad
+UNMATCHED_ROUTE = "unmatched"
+
+Labels = Tuple[str, ...]
+
+def require_metrics_token(authorization: Optional[str] = Header(None)):
+    """Protege /metrics y los endpoints de estadísticas internas con ``METRICS_TOKEN``"""
+    scheme, _, token = (authorization or "").partition(" ")
+    if not METRICS_TOKEN or scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid metrics token", headers={"WWW-Authenticate": "Bearer"})
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}"
+            for labels, value in self.values.items()
+        ]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, *labels: str, value: float):
+        self.values[labels] = value
+
+class Histogram(Metric):
+    """Histograma acumulativo al estilo Prometheus.
+
+    Por cada combinación de etiquetas guarda los conteos por bucket (sin
+    acumular, se acumulan al exportar), la suma y el total: ``observe`` es una
+    búsqueda binaria y tres sumas.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        self.series: Dict[Labels, list] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self.series.get(labels)
+        if series is None:
+            # [conteos por bucket (+Inf al final), suma, total]
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, (counts, total, count) in self.series.items():
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                le = f'le="{bound if bound == "+Inf" else format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, labels)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "Peticiones HTTP atendidas", ("method", "route", "status")))
+http_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Latencia de las peticiones HTTP hasta enviar el último byte",
+    ("method", "route")))
+http_db_queries = registry.register(Histogram(
+    "http_request_db_queries", "Consultas SQL ejecutadas por petición", ("method", "route"), QUERY_COUNT_BUCKETS))
+http_db_duration = registry.register(Histogram(
+    "http_request_db_duration_seconds", "Tiempo en la base de datos por petición", ("method", "route")))
+http_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "Peticiones HTTP en curso"))
+db_query_duration = registry.register(Histogram(
+    "db_query_duration_seconds", "Duración de cada consulta SQL", ("operation",), FAST_BUCKETS))
+llm_requests = registry.register(Counter(
+    "llm_requests_total", "Llamadas al LLM por modelo y resultado", ("model", "outcome")))
+llm_ttft = registry.register(Histogram(
+    "llm_time_to_first_token_seconds", "Tiempo hasta el primer token en las llamadas con streaming", ("model",)))
+llm_duration = registry.register(Histogram(
+    "llm_request_duration_seconds", "Duración total de las llamadas al LLM, reintentos incluidos", ("model",)))
+llm_tokens = registry.register(Counter(
+    "llm_tokens_total", "Tokens consumidos por modelo", ("model", "kind")))
+llm_completion_tokens = registry.register(Histogram(
+    "llm_completion_tokens", "Tokens generados por llamada", ("model",), TOKEN_BUCKETS))
+redis_duration = registry.register(Histogram(
+    "redis_command_duration_seconds", "Latencia de los comandos Redis", ("command",), FAST_BUCKETS))
+redis_errors = registry.register(Counter(
+    "redis_command_errors_total", "Comandos Redis fallidos", ("command",)))
+loop_lag = registry.register(Histogram(
+    "event_loop_lag_seconds", "Retraso del event loop sobre el intervalo de muestreo", (), FAST_BUCKETS))
+profiles_written = registry.register(Counter(
+    "profiles_written_total", "Perfiles cProfile guardados por superar el umbral"))
+
+class RequestStats:
+    """Consultas SQL y tiempo en base de datos de la petición en curso"""
+
+    __slots__ = ("queries", "db_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+# Las sesiones asíncronas ejecutan los eventos de SQLAlchemy en el mismo task
+# que la ruta, así que una ContextVar basta para atribuir cada consulta
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+def query_operation(statement: str) -> str:
+    """Primera palabra de la sentencia (SELECT, INSERT...), para etiquetar sin disparar la cardinalidad"""
+    head = statement.lstrip()[:10].split(None, 1)
+    return head[0].upper() if head else "OTHER"
+
+def instrument_engine(engine):
+    """Registra la duración de cada consulta del motor (síncrono o ``async_engine.sync_engine``)"""
+    if getattr(engine, "_metrics_instrumented", False):
+        return
+    engine._metrics_instrumented = True
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_query(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def end_query(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        db_query_duration.observe(elapsed, query_operation(statement))
+        stats = current_request.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def discard_query(context):
+        # La consulta falló: after_cursor_execute no llega a ejecutarse
+        starts = context.connection.info.get("query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+def observe_redis(command: str, elapsed: float, failed: bool = False):
+    redis_duration.observe(elapsed, command)
+    if failed:
+        redis_errors.inc(command)
+
+def observe_llm_call(model: str, elapsed: float, outcome: str = "ok"):
+    llm_requests.inc(model, outcome)
+    if outcome == "ok":
+        llm_duration.observe(elapsed, model)
+
+def observe_llm_tokens(model: str, prompt_tokens: int, completion_tokens: int):
+    if prompt_tokens:
+        llm_tokens.inc(model, "prompt", amount=prompt_tokens)
+    llm_tokens.inc(model, "completion", amount=completion_tokens)
+    llm_completion_tokens.observe(completion_tokens, model)
+
+def observe_llm_first_token(model: str, elapsed: float):
+    llm_ttft.observe(elapsed, model)
+
+class RequestProfiler:
+    """Perfil cProfile de una muestra de peticiones, guardado solo si superan el umbral.
+
+    cProfile mide todo el hilo, así que mientras dura el perfil también recoge
+    las demás corrutinas del event loop: solo se perfila una petición a la vez
+    y el archivo debe leerse como «qué hacía el worker durante esa petición».
+    """
+
+    def __init__(
+        self,
+        sample_rate: float = PROFILE_SAMPLE_RATE,
+        threshold_ms: float = PROFILE_THRESHOLD_MS,
+        directory: str = PROFILE_DIR,
+        max_files: int = PROFILE_MAX_FILES,
+    ):
+        self.sample_rate = sample_rate
+        self.threshold_ms = threshold_ms
+        self.directory = directory
+        self.max_files = max_files
+        self._active = False
+        self._written = 0
+        self._files: Deque[str] = deque()
+
+    def start(self) -> Optional[cProfile.Profile]:
+        if self.sample_rate <= 0 or self._active or random.random() >= self.sample_rate:
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Otro profiler (p. ej. un depurador) ya está activo
+            return None
+        self._active = True
+        return profiler
+
+    def finish(self, profiler: cProfile.Profile, method: str, route: str, elapsed_ms: float):
+        profiler.disable()
+        self._active = False
+        if elapsed_ms < self.threshold_ms:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        slug = re.sub(r"[^\w.-]+", "_", route).strip("_") or "root"
+        self._written += 1
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{self._written:05d}-{method}-{slug}-{elapsed_ms:.0f}ms.prof"
+        path = os.path.join(self.directory, name)
+        profiler.dump_stats(path)
+        profiles_written.inc()
+        self._files.append(path)
+        while len(self._files) > self.max_files:
+            try:
+                os.remove(self._files.popleft())
+            except OSError:
+                pass
+
+class MetricsMiddleware:
+    """Middleware ASGI que mide cada petición HTTP por plantilla de ruta.
+
+    La ruta se toma de ``scope["route"]`` una vez resuelta por el router
+    (``/api/tasks/{task_id}``, no la URL), de modo que todas las peticiones al
+    mismo endpoint comparten serie. La duración llega hasta el último byte del
+    cuerpo, así que incluye el streaming de las respuestas SSE.
+    """
+
+    def __init__(self, app, profiler: Optional[RequestProfiler] = None, slow_request_ms: float = METRICS_SLOW_REQUEST_MS):
+        self.app = app
+        self.profiler = profiler or RequestProfiler()
+        self.slow_request_ms = slow_request_ms
+        self.in_flight = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        profiler = self.profiler.start()
+        self.in_flight += 1
+        http_in_flight.set(value=self.in_flight)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.in_flight -= 1
+            http_in_flight.set(value=self.in_flight)
+            current_request.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", None) or UNMATCHED_ROUTE
+            method = scope["method"]
+            http_requests.inc(method, path, str(status))
+            http_duration.observe(elapsed, method, path)
+            http_db_queries.observe(stats.queries, method, path)
+            http_db_duration.observe(stats.db_time, method, path)
+            elapsed_ms = elapsed * 1000
+            if profiler is not None:
+                self.profiler.finish(profiler, method, path, elapsed_ms)
+            if 0 < self.slow_request_ms <= elapsed_ms:
+                logger.warning(
+                    "Petición lenta %s %s: %.0f ms, %d consultas (%.0f ms en base de datos)",
+                    method, path, elapsed_ms, stats.queries, stats.db_time * 1000
+                )
+
+class LoopLagMonitor:
+    """Mide cuánto se retrasa el event loop al despertar de un ``sleep`` de ``interval`` segundos"""
+
+    def __init__(self, interval: float = METRICS_LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self.last_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.last_lag = max(0.0, loop.time() - expected)
+            loop_lag.observe(self.last_lag)
+
+loop_lag_monitor = LoopLagMonitor()
+
+def render_metrics() -> str:
+    """Todas las métricas en el formato de texto de Prometheus"""
+    return registry.render()
@@ -1,8 +1,8 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Index, Text, UniqueConstraint, Enum as SQLEnum
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
-from .enums import TaskStatus, TaskPriority
+from .enums import TaskStatus, TaskPriority, SuggestionJobStatus, WebhookEventStatus
 from .database import Base
 
 class User(Base):
@@ -38,6 +38,12 @@ class Project(Base):
 
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        Index("ix_tasks_user_status_due", "user_id", "status", "due_date"),
+        Index("ix_tasks_user_updated", "user_id", "updated_at", "id"),
+        Index("ix_tasks_parent_task_id", "parent_task_id"),
+        Index("ix_tasks_project_id", "project_id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String)
@@ -59,13 +65,14 @@ class Task(Base):
     parent_task = relationship("Task", remote_side=[id], backref="subtasks")
     tags = relationship("TaskTag", back_populates="task")
     ai_suggestions = relationship("AISuggestion", back_populates="task")
+    suggestion_job = relationship("SuggestionJob", back_populates="task", uselist=False, cascade="all, delete-orphan")
 
 class TaskTag(Base):
     __tablename__ = "task_tags"
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
-    task_id = Column(Integer, ForeignKey("tasks.id"))
+    task_id = Column(Integer, ForeignKey("tasks.id"), index=True)
     
     task = relationship("Task", back_populates="tags")
 
@@ -73,15 +80,52 @@ class AISuggestion(Base):
     __tablename__ = "ai_suggestions"
     
     id = Column(Integer, primary_key=True, index=True)
-    task_id = Column(Integer, ForeignKey("tasks.id"))
+    task_id = Column(Integer, ForeignKey("tasks.id"), index=True)
     suggestion = Column(String)
     created_at = Column(DateTime, default=datetime.utcnow)
     is_applied = Column(Boolean, default=False)
     
     task = relationship("Task", back_populates="ai_suggestions")
 
+class SuggestionJob(Base):
+    __tablename__ = "suggestion_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    task_id = Column(Integer, ForeignKey("tasks.id"), unique=True)
+    status = Column(SQLEnum(SuggestionJobStatus), default=SuggestionJobStatus.PENDING, index=True)
+    attempts = Column(Integer, default=0)
+    last_error = Column(String, nullable=True)
+    next_attempt_at = Column(DateTime, nullable=True)  # backoff tras un fallo; nadie lo reclama antes
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    task = relationship("Task", back_populates="suggestion_job")
+
+class TaskStats(Base):
+    """Contadores de tareas mantenidos por deltas; ``project_id`` 0 son los totales del usuario"""
+    __tablename__ = "task_stats"
+    __table_args__ = (
+        UniqueConstraint("user_id", "project_id", name="uq_task_stats_user_project"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    project_id = Column(Integer, nullable=False, default=0)
+    total = Column(Integer, nullable=False, default=0)
+    todo = Column(Integer, nullable=False, default=0)
+    in_progress = Column(Integer, nullable=False, default=0)
+    done = Column(Integer, nullable=False, default=0)
+    low = Column(Integer, nullable=False, default=0)
+    medium = Column(Integer, nullable=False, default=0)
+    high = Column(Integer, nullable=False, default=0)
+    estimated_hours = Column(Float, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class APIRequest(Base):
     __tablename__ = "api_requests"
+    __table_args__ = (
+        Index("ix_api_requests_user_timestamp", "user_id", "timestamp"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -100,10 +144,68 @@ class Subscription(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), unique=True)
     stripe_subscription_id = Column(String, unique=True)
+    stripe_customer_id = Column(String, nullable=True, index=True)
     plan_id = Column(String)
     status = Column(String)
     current_period_end = Column(DateTime)
+    last_event_at = Column(Integer, nullable=True)  # ``created`` del último evento de Stripe aplicado
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    user = relationship("User", back_populates="subscription")
+
+class StripeEvent(Base):
+    """Bandeja de entrada de webhooks de Stripe; ``event_id`` único hace idempotente la recepción"""
+    __tablename__ = "stripe_events"
+    __table_args__ = (
+        Index("ix_stripe_events_status_created", "status", "created", "id"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    event_id = Column(String, unique=True, nullable=False)
+    type = Column(String, nullable=False)
+    customer = Column(String, nullable=True)  # clave de ordenación: los eventos de un cliente se aplican en orden
+    created = Column(Integer, nullable=False)  # marca de tiempo del evento en Stripe
+    payload = Column(Text, nullable=False)
+    status = Column(SQLEnum(WebhookEventStatus), default=WebhookEventStatus.PENDING, nullable=False)
+    attempts = Column(Integer, default=0)
+    last_error = Column(String, nullable=True)
+    next_attempt_at = Column(DateTime, nullable=True)
+    received_at = Column(DateTime, default=datetime.utcnow)
+    processed_at = Column(DateTime, nullable=True)
+
+class ChatSession(Base):
+    """Conversación persistida; los turnos anteriores a ``summarized_through`` viven solo en ``summary``"""
+    __tablename__ = "chat_sessions"
+    __table_args__ = (
+        Index("ix_chat_sessions_user_updated", "user_id", "updated_at"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    title = Column(String, nullable=True)
+    model = Column(String, nullable=False)
+    summary = Column(Text, nullable=True)
+    summary_tokens = Column(Integer, nullable=False, default=0)
+    summarized_through = Column(Integer, nullable=False, default=0)  # id del último mensaje incluido en el resumen
+    message_count = Column(Integer, nullable=False, default=0)
+    history_tokens = Column(Integer, nullable=False, default=0)  # todos los mensajes
+    pending_tokens = Column(Integer, nullable=False, default=0)  # mensajes aún sin resumir
+    compactions = Column(Integer, nullable=False, default=0)
+    prompt_tokens_sent = Column(Integer, nullable=False, default=0)
+    prompt_tokens_full = Column(Integer, nullable=False, default=0)  # lo que costaría reenviar el historial completo
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ChatMessage(Base):
+    __tablename__ = "chat_messages"
+    __table_args__ = (
+        Index("ix_chat_messages_session_id", "session_id", "id"),
+    )
     
-    user = relationship("User", back_populates="subscription") 
\ No newline at end of file
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(Integer, ForeignKey("chat_sessions.id"), nullable=False)
+    role = Column(String, nullable=False)  # user / assistant
+    content = Column(Text, nullable=False)
+    tokens = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,139 @@
+import json
+import logging
+import math
+import os
+import time
+import uuid
+from collections import defaultdict, deque
+from typing import Dict, Optional, Tuple
+
+from fastapi import Depends, HTTPException, Response
+from redis.exceptions import RedisError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .auth import get_current_user
+from .database import get_db
+from .models import Subscription, User
+from .redis_pool import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Configuración
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "redis")  # "redis" | "memory"
+RATE_LIMIT_WINDOW = int(os.getenv("RATE_LIMIT_WINDOW", 3600))
+RATE_LIMIT_DEFAULT = int(os.getenv("RATE_LIMIT_DEFAULT", 100))
+# Límites por plan de Stripe, p. ej. {"price_pro": 1000, "price_team": 5000}
+RATE_LIMIT_PLANS: Dict[str, int] = json.loads(os.getenv("RATE_LIMIT_PLANS", "{}"))
+
+# (allowed, remaining, retry_after_ms)
+HitResult = Tuple[bool, int, int]
+
+# Ventana deslizante sobre un sorted set: purga, cuenta y registra en una sola
+# operación atómica para que peticiones concurrentes no superen el límite
+SLIDING_WINDOW_LUA = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', key, 0, now - window)
+local count = redis.call('ZCARD', key)
+if count < limit then
+    redis.call('ZADD', key, now, ARGV[4])
+    redis.call('PEXPIRE', key, window)
+    return {1, limit - count - 1, 0}
+end
+local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+return {0, 0, tonumber(oldest[2]) + window - now}
+"""
+
+class MemoryRateLimitBackend:
+    """Ventana deslizante en proceso; para pruebas y como respaldo si Redis cae"""
+
+    def __init__(self):
+        self._hits: Dict[str, deque] = defaultdict(deque)
+
+    async def hit(self, key: str, limit: int, window_ms: int) -> HitResult:
+        now = int(time.time() * 1000)
+        hits = self._hits[key]
+        while hits and hits[0] <= now - window_ms:
+            hits.popleft()
+        if len(hits) < limit:
+            hits.append(now)
+            return True, limit - len(hits), 0
+        return False, 0, hits[0] + window_ms - now
+
+    def reset(self):
+        self._hits.clear()
+
+class RedisRateLimitBackend:
+    """Ventana deslizante atómica en Redis mediante un script Lua"""
+
+    def __init__(self, client, fallback: Optional[MemoryRateLimitBackend] = None):
+        self.client = client
+        self.fallback = fallback or MemoryRateLimitBackend()
+        self._script = client.register_script(SLIDING_WINDOW_LUA)
+
+    async def hit(self, key: str, limit: int, window_ms: int) -> HitResult:
+        now = int(time.time() * 1000)
+        try:
+            allowed, remaining, retry_after = await self._script(
+                keys=[key], args=[now, window_ms, limit, f"{now}-{uuid.uuid4().hex}"]
+            )
+        except RedisError as e:
+            logger.warning("Redis no disponible para rate limiting, usando límite en memoria: %s", e)
+            return await self.fallback.hit(key, limit, window_ms)
+        return bool(allowed), int(remaining), int(retry_after)
+
+def build_backend():
+    if RATE_LIMIT_BACKEND == "memory":
+        return MemoryRateLimitBackend()
+    return RedisRateLimitBackend(redis_client)
+
+rate_limit_backend = build_backend()
+
+async def get_user_plan(db: AsyncSession, user_id: int) -> Optional[str]:
+    result = await db.execute(
+        select(Subscription.plan_id).where(
+            Subscription.user_id == user_id,
+            Subscription.status == "active"
+        )
+    )
+    return result.scalar_one_or_none()
+
+def rate_limit(
+    scope: str,
+    window: int = RATE_LIMIT_WINDOW,
+    default_limit: int = RATE_LIMIT_DEFAULT,
+    plan_limits: Optional[Dict[str, int]] = None,
+):
+    """Crea una dependencia que limita las peticiones por usuario y plan.
+
+    Uso: ``@app.post("/chat", dependencies=[Depends(rate_limit("chat"))])``
+    """
+    plan_limits = RATE_LIMIT_PLANS if plan_limits is None else plan_limits
+    window_ms = window * 1000
+
+    async def dependency(
+        response: Response,
+        current_user: User = Depends(get_current_user),
+        db: AsyncSession = Depends(get_db)
+    ):
+        limit = default_limit
+        if plan_limits:
+            plan = await get_user_plan(db, current_user.id)
+            limit = plan_limits.get(plan, default_limit)
+
+        allowed, remaining, retry_after_ms = await rate_limit_backend.hit(
+            f"rate_limit:{scope}:{current_user.id}", limit, window_ms
+        )
+        headers = {
+            "X-RateLimit-Limit": str(limit),
+            "X-RateLimit-Remaining": str(remaining),
+        }
+        if not allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(retry_after_ms / 1000)))
+            raise HTTPException(status_code=429, detail="Rate limit exceeded", headers=headers)
+        response.headers.update(headers)
+
+    return dependency
@@ -0,0 +1,56 @@
+import os
+import time
+import redis.asyncio as redis
+from redis.asyncio.client import Pipeline
+from dotenv import load_dotenv
+
+from .metrics import observe_redis
+
+load_dotenv()
+
+# Configuración
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 1.0))
+
+class InstrumentedPipeline(Pipeline):
+    """Pipeline que mide el viaje completo (un solo round trip) como comando PIPELINE"""
+
+    async def execute(self, raise_on_error: bool = True):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = await super().execute(raise_on_error)
+            failed = False
+            return result
+        finally:
+            observe_redis("PIPELINE", time.perf_counter() - start, failed)
+
+class InstrumentedRedis(redis.Redis):
+    """Cliente que registra la latencia de cada comando en las métricas"""
+
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = await super().execute_command(*args, **options)
+            failed = False
+            return result
+        finally:
+            observe_redis(str(args[0]).upper(), time.perf_counter() - start, failed)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None) -> InstrumentedPipeline:
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+# Pool compartido por rate limiting, cachés y pub/sub
+redis_pool = redis.ConnectionPool(
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    db=0,
+    decode_responses=True,
+    max_connections=REDIS_MAX_CONNECTIONS,
+    socket_timeout=REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+)
+redis_client = InstrumentedRedis(connection_pool=redis_pool)
@@ -0,0 +1,154 @@
+import hashlib
+import logging
+import os
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from fastapi import Response
+from redis.exceptions import RedisError
+
+from .redis_pool import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Configuración
+RESOURCE_VERSION_BACKEND = os.getenv("RESOURCE_VERSION_BACKEND", "redis")  # "redis" | "memory" (un solo worker)
+RESOURCE_VERSION_TTL = int(os.getenv("RESOURCE_VERSION_TTL", 7 * 24 * 3600))  # segundos sin cambios hasta olvidar la versión
+
+# Ámbitos versionados por separado: gastar créditos no invalida la lista de tareas
+TASKS = "tasks"  # tareas y sus sugerencias
+ACCOUNT = "account"  # créditos y suscripción (/me)
+
+CACHE_CONTROL = "private, no-cache"
+
+# Una versión que no existe (nueva o expirada) empieza en el reloj actual en
+# microsegundos, no en 0: tras perder la clave no vuelve a salir un número ya
+# servido, y un ETag antiguo nunca coincide con datos distintos.
+READ_LUA = """
+local version = redis.call('GET', KEYS[1])
+if not version then
+    version = ARGV[1]
+    redis.call('SET', KEYS[1], version, 'EX', ARGV[2])
+end
+return version
+"""
+
+BUMP_LUA = """
+for _, key in ipairs(KEYS) do
+    redis.call('SET', key, ARGV[1], 'NX', 'EX', ARGV[2])
+    redis.call('INCR', key)
+    redis.call('EXPIRE', key, ARGV[2])
+end
+return #KEYS
+"""
+
+def seed() -> int:
+    return time.time_ns() // 1000
+
+def make_etag(user_id: int, version: int, parts: Iterable = ()) -> str:
+    """ETag fuerte; ``parts`` distingue representaciones de la misma versión (filtros, formato)"""
+    parts = tuple(str(part) for part in parts)
+    if not parts:
+        return f'"{user_id}-{version}"'
+    digest = hashlib.blake2b("\0".join(parts).encode(), digest_size=6).hexdigest()
+    return f'"{user_id}-{version}-{digest}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparación débil de ``If-None-Match`` (RFC 9110), que admite listas y ``*``"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+def cache_headers(etag: Optional[str]) -> Dict[str, str]:
+    if etag is None:
+        return {}
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+def not_modified(etag: str, headers: Optional[Dict[str, str]] = None) -> Response:
+    return Response(status_code=304, headers={**(headers or {}), **cache_headers(etag)})
+
+class MemoryVersionStore:
+    def __init__(self):
+        self._versions: Dict[Tuple[str, int], int] = {}
+
+    async def get(self, scope: str, user_id: int) -> int:
+        return self._versions.setdefault((scope, user_id), seed())
+
+    async def bump(self, scope: str, user_ids: Iterable[int]):
+        for user_id in user_ids:
+            key = (scope, user_id)
+            self._versions[key] = self._versions.get(key, seed()) + 1
+
+class RedisVersionStore:
+    """Contadores por usuario y ámbito en Redis, compartidos por todos los workers"""
+
+    def __init__(self, client, ttl: int = RESOURCE_VERSION_TTL, prefix: str = "version:"):
+        self.ttl = ttl
+        self.prefix = prefix
+        self._read = client.register_script(READ_LUA)
+        self._bump = client.register_script(BUMP_LUA)
+
+    async def get(self, scope: str, user_id: int) -> int:
+        return int(await self._read(keys=[f"{self.prefix}{scope}:{user_id}"], args=[seed(), self.ttl]))
+
+    async def bump(self, scope: str, user_ids: Iterable[int]):
+        keys = [f"{self.prefix}{scope}:{user_id}" for user_id in user_ids]
+        if keys:
+            await self._bump(keys=keys, args=[seed(), self.ttl])
+
+class ResourceVersions:
+    """Versión por usuario de lo que devuelven los GET cacheables, para ETags y 304.
+
+    Quien modifica los datos llama a ``bump`` después del commit, y quien los
+    lee obtiene la versión antes de consultarlos: así un ETag nunca acompaña a
+    datos más antiguos que su versión, y si coincide con ``If-None-Match`` se
+    responde 304 sin tocar la base de datos. Si el almacén falla, la lectura
+    devuelve None (respuesta completa sin ETag); un ``bump`` perdido deja ETags
+    válidos como mucho hasta que la versión expira (``RESOURCE_VERSION_TTL``).
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.counters = {"not_modified": 0, "full": 0, "bumps": 0, "errors": 0}
+
+    async def get(self, scope: str, user_id: int) -> Optional[int]:
+        try:
+            return await self.store.get(scope, user_id)
+        except RedisError as e:
+            self.counters["errors"] += 1
+            logger.warning("No se pudo leer la versión %s del usuario %s: %s", scope, user_id, e)
+            return None
+
+    async def bump(self, scope: str, *user_ids: int):
+        try:
+            await self.store.bump(scope, user_ids)
+            self.counters["bumps"] += len(user_ids)
+        except RedisError as e:
+            self.counters["errors"] += 1
+            logger.warning("No se pudo incrementar la versión %s de %s: %s", scope, user_ids, e)
+
+    async def etag(self, scope: str, user_id: int, *parts) -> Optional[str]:
+        version = await self.get(scope, user_id)
+        return None if version is None else make_etag(user_id, version, parts)
+
+    def check(self, if_none_match: Optional[str], etag: Optional[str]) -> bool:
+        """True si el cliente ya tiene esta versión y basta un 304"""
+        if etag is not None and etag_matches(if_none_match, etag):
+            self.counters["not_modified"] += 1
+            return True
+        self.counters["full"] += 1
+        return False
+
+    def stats(self) -> dict:
+        return {**self.counters, "backend": "memory" if isinstance(self.store, MemoryVersionStore) else "redis"}
+
+def build_resource_versions() -> ResourceVersions:
+    if RESOURCE_VERSION_BACKEND == "memory":
+        return ResourceVersions(MemoryVersionStore())
+    return ResourceVersions(RedisVersionStore(redis_client))
+
+resource_versions = build_resource_versions()
@@ -0,0 +1,64 @@
+import json
+import logging
+import os
+from datetime import date
+from enum import Enum
+from typing import Iterable, Optional, Sequence
+
+# orjson y msgpack son dependencias obligatorias (requirements.txt). Los fallbacks
+# solo cubren una instalación rota, y ``warn_missing_encoders`` la avisa al arrancar
+try:
+    import orjson
+except ImportError:  # se codifica con json de la biblioteca estándar
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # se responde siempre JSON
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+# Configuración
+TASK_LIST_FAST_PATH = os.getenv("TASK_LIST_FAST_PATH", "0") == "1"
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+def warn_missing_encoders():
+    """Avisa al arrancar si ``TASK_LIST_FAST_PATH`` está activo sin orjson o msgpack"""
+    if not TASK_LIST_FAST_PATH:
+        return
+    if orjson is None:
+        logger.warning("TASK_LIST_FAST_PATH=1 sin orjson instalado: las listas de tareas se codifican con json estándar")
+    if msgpack is None:
+        logger.warning("TASK_LIST_FAST_PATH=1 sin msgpack instalado: Accept: application/msgpack recibe JSON")
+
+def encode_default(value):
+    """Tipos que ni json ni msgpack conocen; mismo formato que ``jsonable_encoder``"""
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+def negotiate(accept: Optional[str]) -> str:
+    """MessagePack solo si el cliente lo pide en ``Accept`` (y msgpack se pudo importar)"""
+    if msgpack is not None and accept:
+        for media_type in MSGPACK_MEDIA_TYPES:
+            if media_type in accept:
+                return media_type
+    return JSON_MEDIA_TYPE
+
+def encode_rows(columns: Sequence[str], rows: Iterable[Sequence], media_type: str = JSON_MEDIA_TYPE) -> bytes:
+    """Codifica tuplas de columnas como una lista de objetos sin instanciar modelos.
+
+    Las columnas sobrantes al final de cada fila (p. ej. las del cursor) se
+    ignoran. El JSON es idéntico al de la respuesta validada con Pydantic.
+    """
+    items = [dict(zip(columns, row)) for row in rows]
+    if media_type != JSON_MEDIA_TYPE:
+        return msgpack.packb(items, default=encode_default)
+    if orjson is not None:
+        return orjson.dumps(items)
+    return json.dumps(items, ensure_ascii=False, separators=(",", ":"), default=encode_default).encode("utf-8")
@@ -0,0 +1,380 @@
+import asyncio
+import contextlib
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import AsyncSessionLocal, async_engine
+from .enums import WebhookEventStatus
+from .models import StripeEvent, Subscription, User
+from .resource_versions import ACCOUNT, resource_versions
+from .user_cache import user_cache
+
+logger = logging.getLogger(__name__)
+
+# Configuración
+STRIPE_WEBHOOK_CONCURRENCY = int(os.getenv("STRIPE_WEBHOOK_CONCURRENCY", 4))  # clientes procesados en paralelo
+STRIPE_WEBHOOK_MAX_RETRIES = int(os.getenv("STRIPE_WEBHOOK_MAX_RETRIES", 8))
+STRIPE_WEBHOOK_RETRY_BACKOFF = float(os.getenv("STRIPE_WEBHOOK_RETRY_BACKOFF", 5.0))
+STRIPE_WEBHOOK_POLL_INTERVAL = float(os.getenv("STRIPE_WEBHOOK_POLL_INTERVAL", 30.0))
+STRIPE_WEBHOOK_BATCH_SIZE = int(os.getenv("STRIPE_WEBHOOK_BATCH_SIZE", 200))
+STRIPE_DEFAULT_PLAN_CREDITS = int(os.getenv("STRIPE_DEFAULT_PLAN_CREDITS", 1000))
+STRIPE_FREE_CREDITS = int(os.getenv("STRIPE_FREE_CREDITS", 100))  # tope de créditos al cancelar la suscripción
+
+# Créditos por precio de Stripe: "price_basic:1000,price_pro:10000"
+STRIPE_PLAN_CREDITS = {
+    plan.strip(): int(credits)
+    for plan, _, credits in (
+        item.partition(":") for item in os.getenv("STRIPE_PLAN_CREDITS", "").split(",") if item.strip()
+    )
+}
+
+# Estados de Stripe en los que la suscripción da acceso al plan
+ACTIVE_STATUSES = {"active", "trialing"}
+
+events_table = StripeEvent.__table__
+
+# Usuarios cuyo caché hay que invalidar tras confirmar la transacción: (email, id)
+Invalidations = List[Tuple[str, int]]
+EventHandler = Callable[[AsyncSession, dict], Awaitable[Invalidations]]
+
+def signature_header(payload: str, secret: str, timestamp: Optional[int] = None) -> str:
+    """Cabecera ``Stripe-Signature`` válida para ``payload``; permite probar el webhook con eventos firmados en local"""
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signature = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+def plan_credits(plan_id: Optional[str]) -> int:
+    return STRIPE_PLAN_CREDITS.get(plan_id, STRIPE_DEFAULT_PLAN_CREDITS)
+
+def period_end(obj: dict) -> Optional[datetime]:
+    value = obj.get("current_period_end")
+    return datetime.utcfromtimestamp(value) if value else None
+
+def subscription_plan(obj: dict) -> Optional[str]:
+    """Precio del primer elemento de la suscripción"""
+    items = (obj.get("items") or {}).get("data") or []
+    if items:
+        return (items[0].get("price") or {}).get("id")
+    return (obj.get("plan") or {}).get("id")
+
+def ordering_key(obj: dict) -> Optional[str]:
+    return obj.get("customer") or obj.get("customer_email")
+
+async def find_user(db: AsyncSession, user_id=None, email: Optional[str] = None) -> Optional[User]:
+    if user_id is not None and str(user_id).isdigit():
+        user = await db.get(User, int(user_id))
+        if user is not None:
+            return user
+    if email:
+        result = await db.execute(select(User).where(User.email == email))
+        return result.scalar_one_or_none()
+    return None
+
+async def subscription_for(db: AsyncSession, user_id: int, stripe_subscription_id: str) -> Subscription:
+    """Suscripción existente (por id de Stripe o, si no, del usuario) o una nueva sin guardar todavía"""
+    result = await db.execute(
+        select(Subscription).where(Subscription.stripe_subscription_id == stripe_subscription_id)
+    )
+    subscription = result.scalar_one_or_none()
+    if subscription is None:
+        result = await db.execute(select(Subscription).where(Subscription.user_id == user_id))
+        subscription = result.scalar_one_or_none()
+    if subscription is None:
+        subscription = Subscription(user_id=user_id, stripe_subscription_id=stripe_subscription_id)
+        db.add(subscription)
+    return subscription
+
+def is_stale(subscription: Subscription, event: dict) -> bool:
+    """Stripe no garantiza el orden de entrega: se descartan los eventos anteriores al último aplicado"""
+    return subscription.last_event_at is not None and event["created"] < subscription.last_event_at
+
+async def event_subscription(db: AsyncSession, obj: dict) -> Tuple[Optional[Subscription], Optional[User]]:
+    """Suscripción a la que se refiere el evento y su usuario.
+
+    Si todavía no existe (el evento se adelantó al checkout) se usa el usuario
+    de los metadatos, que nuestro checkout rellena al crear la suscripción.
+    """
+    result = await db.execute(select(Subscription).where(Subscription.stripe_subscription_id == obj["id"]))
+    subscription = result.scalar_one_or_none()
+    if subscription is not None:
+        return subscription, await db.get(User, subscription.user_id)
+    user = await find_user(db, (obj.get("metadata") or {}).get("user_id"))
+    if user is None:
+        logger.info("Suscripción de Stripe %s sin usuario asociado; se ignora", obj["id"])
+        return None, None
+    return await subscription_for(db, user.id, obj["id"]), user
+
+async def handle_checkout_completed(db: AsyncSession, event: dict) -> Invalidations:
+    """Alta de la suscripción al completar el checkout"""
+    obj = event["data"]["object"]
+    if obj.get("mode") != "subscription" or not obj.get("subscription"):
+        return []
+    email = obj.get("customer_email") or (obj.get("customer_details") or {}).get("email")
+    user = await find_user(db, obj.get("client_reference_id"), email)
+    if user is None:
+        raise LookupError(f"No hay usuario para la sesión de checkout {obj.get('id')}")
+
+    subscription = await subscription_for(db, user.id, obj["subscription"])
+    if is_stale(subscription, event):
+        return []
+    # Si customer.subscription.created llegó antes ya la activó y dio los créditos
+    grant = subscription.status not in ACTIVE_STATUSES
+    subscription.stripe_subscription_id = obj["subscription"]
+    subscription.stripe_customer_id = obj.get("customer")
+    subscription.plan_id = (obj.get("metadata") or {}).get("plan_id") or subscription.plan_id
+    subscription.status = "active"
+    subscription.last_event_at = event["created"]
+    user.subscription_id = obj["subscription"]
+    if grant:
+        user.credits = plan_credits(subscription.plan_id)
+    return [(user.email, user.id)]
+
+async def handle_subscription_changed(db: AsyncSession, event: dict) -> Invalidations:
+    """Alta, renovación o cambio de plan: estado, fin de periodo y créditos del plan"""
+    obj = event["data"]["object"]
+    subscription, user = await event_subscription(db, obj)
+    if subscription is None or is_stale(subscription, event):
+        return []
+
+    previous_end = subscription.current_period_end
+    previous_plan = subscription.plan_id
+    was_active = subscription.status in ACTIVE_STATUSES
+    new_end = period_end(obj)
+
+    subscription.stripe_subscription_id = obj["id"]
+    subscription.stripe_customer_id = obj.get("customer") or subscription.stripe_customer_id
+    subscription.status = obj.get("status")
+    subscription.plan_id = subscription_plan(obj) or previous_plan
+    subscription.current_period_end = new_end or previous_end
+    subscription.last_event_at = event["created"]
+
+    if subscription.status in ACTIVE_STATUSES:
+        user.subscription_id = obj["id"]
+        renewed = previous_end is not None and new_end is not None and new_end > previous_end
+        changed_plan = previous_plan is not None and subscription.plan_id != previous_plan
+        if not was_active or renewed or changed_plan:
+            user.credits = plan_credits(subscription.plan_id)
+    return [(user.email, user.id)]
+
+async def handle_subscription_deleted(db: AsyncSession, event: dict) -> Invalidations:
+    """Baja: la suscripción queda cancelada y los créditos se limitan al plan gratuito"""
+    obj = event["data"]["object"]
+    subscription, user = await event_subscription(db, obj)
+    if subscription is None or is_stale(subscription, event):
+        return []
+    subscription.stripe_subscription_id = obj["id"]
+    subscription.stripe_customer_id = obj.get("customer") or subscription.stripe_customer_id
+    subscription.status = obj.get("status") or "canceled"
+    subscription.current_period_end = period_end(obj) or subscription.current_period_end
+    subscription.last_event_at = event["created"]
+    if user.subscription_id == obj["id"]:
+        user.subscription_id = None
+    user.credits = min(user.credits or 0, STRIPE_FREE_CREDITS)
+    return [(user.email, user.id)]
+
+EVENT_HANDLERS: Dict[str, EventHandler] = {
+    "checkout.session.completed": handle_checkout_completed,
+    "customer.subscription.created": handle_subscription_changed,
+    "customer.subscription.updated": handle_subscription_changed,
+    "customer.subscription.deleted": handle_subscription_deleted,
+}
+
+class StripeEventInbox:
+    """Bandeja de entrada de webhooks de Stripe procesada en segundo plano.
+
+    La ruta del webhook solo verifica la firma, guarda el evento en
+    ``stripe_events`` (``ON CONFLICT DO NOTHING`` sobre el id de Stripe, así que
+    sus reintentos no duplican nada) y responde al momento. Un dispatcher
+    agrupa los pendientes por cliente y los aplica en el orden en que Stripe
+    los creó: clientes distintos en paralelo, los de un mismo cliente de uno en
+    uno. Si un evento falla se reintenta con backoff y los posteriores de su
+    cliente esperan; tras ``max_retries`` intentos queda FAILED y deja de
+    bloquearlos. Cada evento se marca PROCESSED en la misma transacción en la
+    que se aplica, con un UPDATE condicionado a que siga PENDING: con varios
+    workers solo uno lo aplica.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        handlers: Optional[Dict[str, EventHandler]] = None,
+        concurrency: int = STRIPE_WEBHOOK_CONCURRENCY,
+        max_retries: int = STRIPE_WEBHOOK_MAX_RETRIES,
+        backoff: float = STRIPE_WEBHOOK_RETRY_BACKOFF,
+        poll_interval: float = STRIPE_WEBHOOK_POLL_INTERVAL,
+        batch_size: int = STRIPE_WEBHOOK_BATCH_SIZE,
+    ):
+        self.session_factory = session_factory
+        self.handlers = EVENT_HANDLERS if handlers is None else handlers
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        # SQLite admite un único escritor: serializar aquí las escrituras de la
+        # bandeja (cola FIFO) evita que compitan en el busy handler, que no es
+        # equitativo y dispara la latencia del acuse de recibo
+        self._write_lock = asyncio.Lock() if async_engine.dialect.name == "sqlite" else None
+        self.counters = {"received": 0, "duplicates": 0, "ignored": 0, "processed": 0, "retries": 0, "failed": 0}
+
+    async def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="stripe-events")
+
+    async def stop(self):
+        """Detiene el dispatcher; los eventos sin aplicar quedan PENDING en la base de datos"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            self._wakeup = None
+
+    def notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _writing(self):
+        return self._write_lock if self._write_lock is not None else contextlib.nullcontext()
+
+    async def receive(self, db: AsyncSession, payload: str) -> str:
+        """Guarda un evento con la firma ya verificada: ``queued``, ``duplicate`` o ``ignored``"""
+        event = json.loads(payload)
+        if event["type"] not in self.handlers:
+            self.counters["ignored"] += 1
+            return "ignored"
+        insert = postgresql_insert if async_engine.dialect.name == "postgresql" else sqlite_insert
+        statement = insert(events_table).values(
+            event_id=event["id"],
+            type=event["type"],
+            customer=ordering_key(event["data"]["object"]),
+            created=event["created"],
+            payload=payload,
+            status=WebhookEventStatus.PENDING,
+            attempts=0,
+            received_at=datetime.utcnow(),
+        ).on_conflict_do_nothing(index_elements=["event_id"])
+        async with self._writing():
+            result = await db.execute(statement)
+            await db.commit()
+        if result.rowcount != 1:
+            self.counters["duplicates"] += 1
+            return "duplicate"
+        self.counters["received"] += 1
+        self.notify()
+        return "queued"
+
+    async def run_once(self) -> int:
+        """Aplica los eventos pendientes que ya tocan; devuelve cuántos se procesaron"""
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(StripeEvent.id, StripeEvent.customer, StripeEvent.next_attempt_at)
+                .where(StripeEvent.status == WebhookEventStatus.PENDING)
+                .order_by(StripeEvent.created, StripeEvent.id)
+                .limit(self.batch_size)
+            )
+            rows = result.all()
+
+        groups: Dict[str, list] = {}
+        for row in rows:
+            groups.setdefault(row.customer or f"event:{row.id}", []).append(row)
+
+        now = datetime.utcnow()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def drain(group) -> int:
+            processed = 0
+            async with semaphore:
+                for row in group:
+                    # Los eventos posteriores del cliente esperan al que está en backoff
+                    if row.next_attempt_at is not None and row.next_attempt_at > now:
+                        break
+                    if not await self._process(row.id):
+                        break
+                    processed += 1
+            return processed
+
+        return sum(await asyncio.gather(*(drain(group) for group in groups.values())))
+
+    async def _process(self, event_id: int) -> bool:
+        """Aplica un evento; False si falló y queda pendiente de reintento"""
+        async with self.session_factory() as db, self._writing():
+            claimed = await db.execute(
+                update(StripeEvent)
+                .where(StripeEvent.id == event_id, StripeEvent.status == WebhookEventStatus.PENDING)
+                .values(status=WebhookEventStatus.PROCESSED, processed_at=datetime.utcnow(), next_attempt_at=None)
+            )
+            if claimed.rowcount != 1:
+                # Otro worker lo aplicó (o lo marcó FAILED) mientras tanto
+                await db.rollback()
+                return True
+            record = await db.get(StripeEvent, event_id)
+            handler = self.handlers.get(record.type)
+            try:
+                invalidations = await handler(db, json.loads(record.payload)) if handler else []
+                await db.commit()
+                error = None
+            except Exception as e:
+                await db.rollback()
+                error = e
+
+        if error is not None:
+            await self._record_failure(event_id, error)
+            return False
+        self.counters["processed"] += 1
+        for email, user_id in invalidations:
+            await user_cache.invalidate(subject=email, user_id=user_id)
+        if invalidations:
+            await resource_versions.bump(ACCOUNT, *{user_id for _, user_id in invalidations})
+        return True
+
+    async def _record_failure(self, event_id: int, error: Exception):
+        async with self.session_factory() as db, self._writing():
+            record = await db.get(StripeEvent, event_id)
+            record.attempts = (record.attempts or 0) + 1
+            record.last_error = str(error)[:500]
+            if record.attempts >= self.max_retries:
+                record.status = WebhookEventStatus.FAILED
+                self.counters["failed"] += 1
+                logger.warning(
+                    "Evento de Stripe %s (%s) falló tras %s intentos: %s",
+                    record.event_id, record.type, record.attempts, error
+                )
+            else:
+                delay = self.backoff * (2 ** (record.attempts - 1)) * (1 + random.random())
+                record.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+                self.counters["retries"] += 1
+                asyncio.get_running_loop().call_later(delay, self.notify)
+            await db.commit()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                if await self.run_once():
+                    continue
+            except Exception:
+                logger.exception("Error procesando eventos de Stripe pendientes")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> dict:
+        return {**self.counters, "running": self._task is not None and not self._task.done()}
+
+stripe_inbox = StripeEventInbox()
@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional, Set, Tuple
+
+from sqlalchemy import and_, or_, select, update
+
+from .database import AsyncSessionLocal
+from .enums import SuggestionJobStatus
+from .models import AISuggestion, SuggestionJob, Task
+from .resource_versions import TASKS, resource_versions
+
+logger = logging.getLogger(__name__)
+
+# Configuración
+SUGGESTION_WORKERS = int(os.getenv("SUGGESTION_WORKERS", 2))
+SUGGESTION_QUEUE_SIZE = int(os.getenv("SUGGESTION_QUEUE_SIZE", 1000))
+SUGGESTION_MAX_RETRIES = int(os.getenv("SUGGESTION_MAX_RETRIES", 3))
+SUGGESTION_RETRY_BACKOFF = float(os.getenv("SUGGESTION_RETRY_BACKOFF", 2.0))
+SUGGESTION_SWEEP_INTERVAL = float(os.getenv("SUGGESTION_SWEEP_INTERVAL", 60.0))
+SUGGESTION_CLAIM_TIMEOUT = float(os.getenv("SUGGESTION_CLAIM_TIMEOUT", 300.0))  # segundos hasta dar por muerto un RUNNING
+
+# Recibe el id del trabajo y devuelve el texto de la sugerencia (None: no hay nada que sugerir)
+JobHandler = Callable[[int], Awaitable[Optional[str]]]
+
+class SuggestionQueue:
+    """Cola asíncrona en proceso para generar sugerencias de IA fuera del request.
+
+    El estado de cada trabajo se persiste en la tabla ``suggestion_jobs``; la cola
+    en memoria solo contiene ids, así que los trabajos pendientes que no caben en
+    la cola (o que quedaron de un reinicio) se recuperan con un barrido periódico.
+
+    Antes de llamar al handler cada trabajo se reclama con un UPDATE condicionado
+    (PENDING -> RUNNING), así que aunque varios procesos barran los mismos
+    pendientes solo uno lo ejecuta. La sugerencia y el paso a READY se guardan
+    en una sola transacción, y solo si el reclamo sigue siendo de este worker;
+    un RUNNING sin terminar durante ``claim_timeout`` (worker caído) se puede
+    volver a reclamar. Un fallo deja el trabajo PENDING con ``next_attempt_at``:
+    ningún proceso lo reclama antes, así que el backoff se respeta aunque sea
+    otro worker quien lo reintente.
+    """
+
+    def __init__(
+        self,
+        handler: JobHandler,
+        workers: int = SUGGESTION_WORKERS,
+        maxsize: int = SUGGESTION_QUEUE_SIZE,
+        max_retries: int = SUGGESTION_MAX_RETRIES,
+        backoff: float = SUGGESTION_RETRY_BACKOFF,
+        sweep_interval: float = SUGGESTION_SWEEP_INTERVAL,
+        claim_timeout: float = SUGGESTION_CLAIM_TIMEOUT,
+        session_factory=AsyncSessionLocal,
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.maxsize = maxsize
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.sweep_interval = sweep_interval
+        self.claim_timeout = claim_timeout
+        self.session_factory = session_factory
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list = []
+        self._queued: Set[int] = set()
+        self._retrying: Set[int] = set()
+
+    async def start(self):
+        """Arranca el pool de workers y el barrido de trabajos pendientes"""
+        if self._queue is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"suggestion-worker-{i}")
+            for i in range(self.workers)
+        ]
+        self._tasks.append(asyncio.create_task(self._sweeper(), name="suggestion-sweeper"))
+
+    async def stop(self):
+        """Detiene los workers; los trabajos no terminados se recuperan al expirar su reclamo"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        self._queued.clear()
+        self._retrying.clear()
+
+    def enqueue(self, job_id: int) -> bool:
+        """Encola un trabajo sin bloquear; devuelve False si la cola está llena"""
+        if self._queue is None or job_id in self._queued:
+            return False
+        try:
+            self._queue.put_nowait(job_id)
+        except asyncio.QueueFull:
+            return False
+        self._queued.add(job_id)
+        return True
+
+    async def join(self):
+        """Espera a que la cola se vacíe (útil en pruebas)"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    def _retry(self, job_id: int):
+        self._retrying.discard(job_id)
+        self.enqueue(job_id)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception:
+                logger.exception("Error inesperado procesando el trabajo de sugerencias %s", job_id)
+            finally:
+                self._queued.discard(job_id)
+                self._queue.task_done()
+
+    async def _run(self, job_id: int):
+        claimed_at = await self._claim(job_id)
+        if claimed_at is None:
+            return
+        try:
+            content = await self.handler(job_id)
+        except Exception as e:
+            failure = await self._record_failure(job_id, claimed_at, e)
+            if failure is None:
+                return
+            attempts, delay = failure
+            if attempts < self.max_retries:
+                self._retrying.add(job_id)
+                asyncio.get_running_loop().call_later(delay, self._retry, job_id)
+            else:
+                logger.warning("Trabajo de sugerencias %s falló tras %s intentos: %s", job_id, attempts, e)
+            return
+        await self._complete(job_id, claimed_at, content)
+
+    def _claimable(self, now: datetime):
+        return or_(
+            and_(
+                SuggestionJob.status == SuggestionJobStatus.PENDING,
+                or_(SuggestionJob.next_attempt_at.is_(None), SuggestionJob.next_attempt_at <= now),
+            ),
+            and_(
+                SuggestionJob.status == SuggestionJobStatus.RUNNING,
+                SuggestionJob.updated_at < now - timedelta(seconds=self.claim_timeout),
+            ),
+        )
+
+    def _owned(self, job_id: int, claimed_at: datetime):
+        return and_(
+            SuggestionJob.id == job_id,
+            SuggestionJob.status == SuggestionJobStatus.RUNNING,
+            SuggestionJob.updated_at == claimed_at,
+        )
+
+    async def _claim(self, job_id: int) -> Optional[datetime]:
+        """Pasa el trabajo a RUNNING; devuelve la marca del reclamo o None si otro lo tiene"""
+        now = datetime.utcnow()
+        async with self.session_factory() as db:
+            result = await db.execute(
+                update(SuggestionJob)
+                .where(SuggestionJob.id == job_id, self._claimable(now))
+                .values(status=SuggestionJobStatus.RUNNING, updated_at=now)
+            )
+            await db.commit()
+        return now if result.rowcount == 1 else None
+
+    async def _complete(self, job_id: int, claimed_at: datetime, content: Optional[str]):
+        async with self.session_factory() as db:
+            result = await db.execute(
+                update(SuggestionJob)
+                .where(self._owned(job_id, claimed_at))
+                .values(status=SuggestionJobStatus.READY, updated_at=datetime.utcnow())
+            )
+            if result.rowcount != 1:
+                # El reclamo expiró o el trabajo se resolvió por otra vía (p. ej. suggestions:batch)
+                await db.rollback()
+                return
+            if content is not None:
+                task_id = await db.scalar(select(SuggestionJob.task_id).where(SuggestionJob.id == job_id))
+                db.add(AISuggestion(task_id=task_id, suggestion=content))
+            user_id = await self._owner(db, job_id)
+            await db.commit()
+        # El estado forma parte de GET /tasks/{id}/suggestions
+        if user_id is not None:
+            await resource_versions.bump(TASKS, user_id)
+
+    async def _record_failure(self, job_id: int, claimed_at: datetime, error: Exception) -> Optional[Tuple[int, float]]:
+        """Devuelve el trabajo a PENDING hasta ``next_attempt_at`` (o FAILED al agotar los intentos).
+
+        Devuelve los intentos y los segundos hasta el siguiente, o None si el trabajo ya no era nuestro.
+        """
+        async with self.session_factory() as db:
+            attempts = (await db.scalar(select(SuggestionJob.attempts).where(SuggestionJob.id == job_id)) or 0) + 1
+            failed = attempts >= self.max_retries
+            delay = 0.0 if failed else self.backoff * (2 ** (attempts - 1)) * (1 + random.random())
+            now = datetime.utcnow()
+            result = await db.execute(
+                update(SuggestionJob)
+                .where(self._owned(job_id, claimed_at))
+                .values(
+                    attempts=attempts,
+                    last_error=str(error)[:500],
+                    status=SuggestionJobStatus.FAILED if failed else SuggestionJobStatus.PENDING,
+                    next_attempt_at=None if failed else now + timedelta(seconds=delay),
+                    updated_at=now,
+                )
+            )
+            if result.rowcount != 1:
+                await db.rollback()
+                return None
+            user_id = await self._owner(db, job_id) if failed else None
+            await db.commit()
+        if user_id is not None:
+            await resource_versions.bump(TASKS, user_id)
+        return attempts, delay
+
+    @staticmethod
+    async def _owner(db, job_id: int) -> Optional[int]:
+        result = await db.execute(
+            select(Task.user_id).join(SuggestionJob, SuggestionJob.task_id == Task.id).where(SuggestionJob.id == job_id)
+        )
+        return result.scalar_one_or_none()
+
+    async def _sweeper(self):
+        while True:
+            try:
+                async with self.session_factory() as db:
+                    result = await db.execute(
+                        select(SuggestionJob.id)
+                        .where(self._claimable(datetime.utcnow()))
+                        .order_by(SuggestionJob.id)
+                        .limit(self.maxsize)
+                    )
+                    pending = result.scalars().all()
+                for job_id in pending:
+                    if job_id in self._retrying:
+                        continue
+                    if not self.enqueue(job_id) and self._queue.full():
+                        break
+            except Exception:
+                logger.exception("Error recuperando trabajos de sugerencias pendientes")
+            await asyncio.sleep(self.sweep_interval)
@@ -1,21 +1,58 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import insert, select, update, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 from enum import Enum
-from .models import Task as TaskModel, TaskStatus, TaskPriority, AISuggestion
+import asyncio
+import base64
+import json
+import logging
+import time
+from .models import Task as TaskModel, TaskStatus, TaskPriority, AISuggestion, SuggestionJob, Project, User
 from .auth import get_current_user
-from .database import get_db
-from openai import AsyncOpenAI
-import os
-from .enums import TaskStatus as TaskStatusEnum, TaskPriority as TaskPriorityEnum
+from .database import get_db, AsyncSessionLocal
+from .suggestion_queue import SuggestionQueue
+from .completion_cache import completion_cache
+from .llm_gateway import LLMGateway, llm_gateway
+from .rate_limit import rate_limit
+from .usage_recorder import usage_recorder
+from .batch_suggestions import (
+    build_batch_messages,
+    estimate_tokens,
+    pack_tasks,
+    parse_batch_response
+)
+from .bulk_io import (
+    BULK_CHUNK_SIZE,
+    BULK_MAX_ERRORS,
+    BULK_MAX_ROWS,
+    EXPORT_BATCH_SIZE,
+    LineTooLongError,
+    chunked,
+    csv_lines,
+    iter_csv_rows,
+    iter_lines,
+    iter_ndjson_rows,
+    ndjson_line
+)
+from .change_feed import change_feed, is_event_id
+from .task_stats import StatsDelta, read_stats, reconcile
+from .task_search import TASK_SEARCH_DEFAULT_LIMIT, TASK_SEARCH_MAX_LIMIT, search_tasks
+from .task_tree import TASK_TREE_DEFAULT_DEPTH, TASK_TREE_MAX_DEPTH, ancestors_query, load_tree
+from .row_encoding import JSON_MEDIA_TYPE, TASK_LIST_FAST_PATH, encode_rows, negotiate
+from .resource_versions import TASKS, cache_headers, not_modified, resource_versions
+from .enums import TaskStatus as TaskStatusEnum, TaskPriority as TaskPriorityEnum, SuggestionJobStatus
 
 router = APIRouter()
-ai_client = AsyncOpenAI(
-    api_key=os.getenv("OPENROUTER_API_KEY"),
-    base_url=os.getenv("BASE_URL")
-)
+logger = logging.getLogger(__name__)
+
+SUGGESTION_MODEL = "qwen/qwq-32b:online"
+SUGGESTION_TEMPERATURE = 0.7
+BATCH_SUGGESTION_MAX_IDS = 500
 
 # Modelos Pydantic
 class TaskStatus(str, Enum):
@@ -54,38 +91,613 @@ class Task(TaskBase):
     class Config:
         orm_mode = True
 
+class Suggestion(BaseModel):
+    id: int
+    suggestion: Optional[str] = None
+    created_at: datetime
+    is_applied: bool = False
+
+    class Config:
+        orm_mode = True
+
+class TaskSuggestions(BaseModel):
+    status: SuggestionJobStatus
+    error: Optional[str] = None
+    suggestions: List[Suggestion]
+
+class BatchSuggestionRequest(BaseModel):
+    task_ids: List[int]
+
+class BatchSuggestionItem(BaseModel):
+    task_id: int
+    suggestion_id: Optional[int] = None
+    source: str  # "batch" | "fallback" | "failed"
+    tokens: int = 0
+    error: Optional[str] = None
+
+class BatchSuggestionReport(BaseModel):
+    results: List[BatchSuggestionItem]
+    batches: int
+    llm_calls: int
+    fallbacks: int
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    tokens_per_task: float
+    elapsed_ms: float
+
+class TaskTreeNode(BaseModel):
+    id: int
+    title: str
+    status: Optional[TaskStatusEnum] = None
+    priority: Optional[TaskPriorityEnum] = None
+    due_date: Optional[datetime] = None
+    estimated_hours: Optional[float] = None
+    completed_at: Optional[datetime] = None
+    project_id: Optional[int] = None
+    parent_task_id: Optional[int] = None
+    depth: int
+    subtree_tasks: int
+    subtree_estimated_hours: float
+    completion_pct: float
+    truncated: bool = False  # hay hijos por debajo del límite de profundidad
+    children: List["TaskTreeNode"] = []
+
+TaskTreeNode.update_forward_refs()
+
+class TaskStatsSummary(BaseModel):
+    project_id: Optional[int] = None  # None: todas las tareas del usuario
+    total: int
+    todo: int
+    in_progress: int
+    done: int
+    low: int
+    medium: int
+    high: int
+    estimated_hours: float
+    overdue: int
+    completion_pct: float
+
+class TaskStatsResponse(BaseModel):
+    user: TaskStatsSummary
+    projects: List[TaskStatsSummary]
+
+class StatsDrift(BaseModel):
+    user_id: int
+    project_id: int
+    diff: Dict[str, float]
+
+class BulkTaskRow(TaskCreate):
+    # Identificadores propios del fichero importado para enlazar subtareas
+    ref: Optional[str] = None
+    parent_ref: Optional[str] = None
+
+class BulkImportError(BaseModel):
+    line: int
+    error: str
+
+class BulkImportReport(BaseModel):
+    inserted: int
+    failed: int
+    chunks: int
+    errors: List[BulkImportError]
+    refs: Dict[str, int]
+    elapsed_ms: float
+
+class TaskSearchHit(BaseModel):
+    id: int
+    title: str
+    description: Optional[str] = None
+    status: Optional[TaskStatusEnum] = None
+    priority: Optional[TaskPriorityEnum] = None
+    due_date: Optional[datetime] = None
+    project_id: Optional[int] = None
+    score: float
+    snippet: Optional[str] = None  # fragmento con los términos entre corchetes
+
+# Columnas que se pueden pedir con ?fields=
+TASK_FIELDS = tuple(Task.__fields__)
+EXPORT_COLUMNS = [column.key for column in TaskModel.__table__.columns]
+
+async def get_task_or_404(db: AsyncSession, task_id: int, user_id: int) -> TaskModel:
+    task = await db.get(TaskModel, task_id)
+    if not task or task.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return task
+
+def task_payload(task: TaskModel) -> dict:
+    """Tarea serializada como en las respuestas de la API, para el feed de cambios"""
+    return jsonable_encoder({field: getattr(task, field) for field in TASK_FIELDS})
+
+def encode_cursor(updated_at: datetime, task_id: int) -> str:
+    raw = json.dumps([updated_at.isoformat(), task_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        updated_at, task_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(updated_at), int(task_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @router.post("/tasks", response_model=Task)
-async def create_task(task: TaskCreate, db: Session = Depends(get_db)):
-    db_task = TaskModel(**task.dict())
+async def create_task(
+    task: TaskCreate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    db_task = TaskModel(**task.dict(), user_id=current_user.id)
     db.add(db_task)
-    db.commit()
-    db.refresh(db_task)
+    await db.flush()
+    job = SuggestionJob(task_id=db_task.id)
+    db.add(job)
+    stats = StatsDelta()
+    stats.add_task(db_task)
+    await stats.flush(db)
+    await db.commit()
+    await db.refresh(db_task)
     
-    # Generar sugerencias de IA
-    await generate_ai_suggestions(db_task, db)
+    # Las sugerencias de IA se generan en segundo plano
+    suggestion_queue.enqueue(job.id)
+    await resource_versions.bump(TASKS, current_user.id)
+    await change_feed.publish(current_user.id, "task.created", task_id=db_task.id, task=task_payload(db_task))
     
     return db_task
 
+class TaskImporter:
+    """Valida e inserta tareas por lotes para ``POST /tasks:bulk``.
+
+    Cada lote es una transacción con un único INSERT multi-fila. ``parent_ref``
+    apunta al ``ref`` de otra fila del mismo fichero; las filas cuyo padre aún
+    no se ha insertado esperan al lote siguiente.
+    """
+
+    def __init__(self, db: AsyncSession, user_id: int, create_jobs: bool = False):
+        self.db = db
+        self.user_id = user_id
+        self.create_jobs = create_jobs
+        self.refs: Dict[str, int] = {}
+        self.waiting: List[Tuple[int, BulkTaskRow]] = []
+        self.errors: List[BulkImportError] = []
+        self.stats = StatsDelta()
+        self.chunk_ids: List[int] = []
+        self.rows = 0
+        self.inserted = 0
+        self.failed = 0
+        self.chunks = 0
+
+    def fail(self, line: int, error: str):
+        self.failed += 1
+        if len(self.errors) < BULK_MAX_ERRORS:
+            self.errors.append(BulkImportError(line=line, error=error))
+
+    async def add_chunk(self, chunk):
+        self.rows += len(chunk)
+        if self.rows > BULK_MAX_ROWS:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Row limit of {BULK_MAX_ROWS} exceeded after importing {self.inserted} tasks"
+            )
+        
+        valid: List[Tuple[int, BulkTaskRow]] = []
+        chunk_refs = set()
+        for line, raw, error in chunk:
+            if error:
+                self.fail(line, error)
+                continue
+            for key in ("ref", "parent_ref"):
+                if raw.get(key) is not None:
+                    raw[key] = str(raw[key])
+            try:
+                row = BulkTaskRow(**raw)
+            except ValidationError as e:
+                self.fail(line, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+                continue
+            if row.parent_ref is not None and row.parent_task_id is not None:
+                self.fail(line, "Use either parent_task_id or parent_ref")
+                continue
+            if row.ref is not None:
+                if row.ref in self.refs or row.ref in chunk_refs:
+                    self.fail(line, f"Duplicate ref {row.ref}")
+                    continue
+                chunk_refs.add(row.ref)
+            valid.append((line, row))
+        
+        valid = await self._check_ownership(valid)
+        self.waiting = await self._insert_resolved(self.waiting + valid)
+        await self.stats.flush(self.db)
+        await self.db.commit()
+        self.chunks += 1
+        if self.chunk_ids:
+            await resource_versions.bump(TASKS, self.user_id)
+            # Un evento por lote; el cliente pide las tareas que le interesen
+            await change_feed.publish(self.user_id, "tasks.imported", task_ids=self.chunk_ids)
+            self.chunk_ids = []
+
+    def finish(self) -> List[BulkImportError]:
+        for line, row in self.waiting:
+            self.fail(line, f"Unknown parent_ref {row.parent_ref}")
+        self.waiting = []
+        return sorted(self.errors, key=lambda error: error.line)
+
+    async def _check_ownership(self, rows: List[Tuple[int, BulkTaskRow]]) -> List[Tuple[int, BulkTaskRow]]:
+        """Descarta filas que apuntan a proyectos o tareas de otro usuario"""
+        project_ids = {row.project_id for _, row in rows if row.project_id is not None}
+        parent_ids = {row.parent_task_id for _, row in rows if row.parent_task_id is not None}
+        own_projects = set()
+        own_parents = set()
+        if project_ids:
+            result = await self.db.execute(
+                select(Project.id).where(Project.id.in_(project_ids), Project.user_id == self.user_id)
+            )
+            own_projects = set(result.scalars())
+        if parent_ids:
+            result = await self.db.execute(
+                select(TaskModel.id).where(TaskModel.id.in_(parent_ids), TaskModel.user_id == self.user_id)
+            )
+            own_parents = set(result.scalars())
+        
+        valid = []
+        for line, row in rows:
+            if row.project_id is not None and row.project_id not in own_projects:
+                self.fail(line, f"Project {row.project_id} not found")
+            elif row.parent_task_id is not None and row.parent_task_id not in own_parents:
+                self.fail(line, f"Parent task {row.parent_task_id} not found")
+            else:
+                valid.append((line, row))
+        return valid
+
+    async def _insert_resolved(self, pending: List[Tuple[int, BulkTaskRow]]) -> List[Tuple[int, BulkTaskRow]]:
+        """Inserta por niveles las filas cuyo padre ya existe; devuelve las que siguen esperando"""
+        while pending:
+            ready, blocked = [], []
+            for item in pending:
+                parent_ref = item[1].parent_ref
+                (ready if parent_ref is None or parent_ref in self.refs else blocked).append(item)
+            if not ready:
+                return blocked
+            await self._insert(ready)
+            pending = blocked
+        return []
+
+    async def _insert(self, rows: List[Tuple[int, BulkTaskRow]]):
+        now = datetime.utcnow()
+        params = []
+        for _, row in rows:
+            values = row.dict(exclude={"ref", "parent_ref"})
+            if row.parent_ref is not None:
+                values["parent_task_id"] = self.refs[row.parent_ref]
+            values.update(
+                user_id=self.user_id,
+                created_at=now,
+                updated_at=now,
+                completed_at=now if row.status == TaskStatusEnum.DONE else None
+            )
+            params.append(values)
+            self.stats.add(self.user_id, values["project_id"], row.status, row.priority, row.estimated_hours)
+        
+        result = await self.db.execute(
+            insert(TaskModel).returning(TaskModel.id, sort_by_parameter_order=True),
+            params
+        )
+        ids = result.scalars().all()
+        self.chunk_ids.extend(ids)
+        for (_, row), task_id in zip(rows, ids):
+            if row.ref is not None:
+                self.refs[row.ref] = task_id
+        if self.create_jobs:
+            # El sweeper de la cola de sugerencias recoge los trabajos PENDING
+            await self.db.execute(insert(SuggestionJob), [{"task_id": task_id} for task_id in ids])
+        self.inserted += len(ids)
+
+@router.post("/tasks:bulk", response_model=BulkImportReport)
+async def bulk_import_tasks(
+    request: Request,
+    suggestions: bool = Query(False, description="Crear trabajos de sugerencias de IA para las tareas importadas"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Importa tareas desde NDJSON (``application/x-ndjson``) o CSV (``text/csv``) en streaming.
+
+    Las filas se validan contra ``TaskCreate`` en lotes de ``BULK_CHUNK_SIZE``;
+    las inválidas se informan por número de línea y no detienen la importación.
+    """
+    content_type = request.headers.get("content-type", "")
+    lines = iter_lines(request.stream())
+    if "csv" in content_type:
+        rows = iter_csv_rows(lines)
+    elif "ndjson" in content_type or "jsonl" in content_type:
+        rows = iter_ndjson_rows(lines)
+    else:
+        raise HTTPException(status_code=415, detail="Use application/x-ndjson or text/csv")
+    
+    start = time.perf_counter()
+    importer = TaskImporter(db, current_user.id, create_jobs=suggestions)
+    try:
+        async for chunk in chunked(rows, BULK_CHUNK_SIZE):
+            await importer.add_chunk(chunk)
+    except LineTooLongError as e:
+        raise HTTPException(
+            status_code=413,
+            detail=f"{e} (BULK_MAX_LINE_BYTES) after importing {importer.inserted} tasks"
+        )
+    errors = importer.finish()
+    
+    return BulkImportReport(
+        inserted=importer.inserted,
+        failed=importer.failed,
+        chunks=importer.chunks,
+        errors=errors,
+        refs=importer.refs,
+        elapsed_ms=round((time.perf_counter() - start) * 1000, 1)
+    )
+
+@router.get("/tasks:export")
+async def export_tasks(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    current_user: User = Depends(get_current_user)
+):
+    """Exporta todas las tareas del usuario en streaming con un cursor de servidor.
+
+    Usa su propia sesión para no depender de cuándo se cierra la de ``get_db``.
+    """
+    user_id = current_user.id
+    
+    async def rows():
+        async with AsyncSessionLocal() as db:
+            result = await db.stream(
+                select(*TaskModel.__table__.columns)
+                .where(TaskModel.user_id == user_id)
+                .order_by(TaskModel.id)
+                .execution_options(yield_per=EXPORT_BATCH_SIZE)
+            )
+            if format == "csv":
+                yield csv_lines([EXPORT_COLUMNS])
+            async for partition in result.partitions():
+                if format == "csv":
+                    yield csv_lines(partition)
+                else:
+                    yield "".join(ndjson_line(EXPORT_COLUMNS, row) for row in partition)
+    
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        rows(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="tasks.{format}"'}
+    )
+
+@router.get("/tasks:search", response_model=List[TaskSearchHit])
+async def search_user_tasks(
+    q: str = Query(..., min_length=1, max_length=200),
+    prefix: bool = True,
+    limit: int = Query(TASK_SEARCH_DEFAULT_LIMIT, ge=1, le=TASK_SEARCH_MAX_LIMIT),
+    offset: int = Query(0, ge=0),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Búsqueda de texto completo en título, descripción, etiquetas y sugerencias de IA.
+
+    Devuelve las tareas que contienen todos los términos (por prefijo salvo
+    ``prefix=false``), ordenadas por relevancia.
+    """
+    hits = await search_tasks(db, current_user.id, q, limit=limit, offset=offset, prefix=prefix)
+    if hits is None:
+        raise HTTPException(status_code=400, detail="The query has no searchable terms")
+    return hits
+
+@router.get("/tasks:changes")
+async def task_changes(
+    request: Request,
+    last_event_id: Optional[str] = Query(None, description="Reanuda tras este id; equivale a la cabecera Last-Event-ID"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Feed de cambios de las tareas del usuario como Server-Sent Events.
+
+    Cada evento lleva un ``id`` reanudable y un JSON con ``type``
+    (``task.created``, ``task.updated``, ``task.deleted``, ``tasks.imported`` o
+    ``reset`` si el hueco supera el historial y hay que recargar la lista).
+    """
+    cursor = last_event_id or request.headers.get("last-event-id")
+    if cursor is not None and not is_event_id(cursor):
+        raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    if not change_feed.has_capacity(current_user.id):
+        raise HTTPException(status_code=429, detail="Too many open change feeds", headers={"Retry-After": "5"})
+    # La sesión de get_current_user solo se cerraría al terminar el stream:
+    # se libera ya para que las conexiones abiertas no retengan el pool
+    await db.close()
+    return StreamingResponse(
+        change_feed.events(current_user.id, cursor),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def stats_summary(counts: dict) -> TaskStatsSummary:
+    completion = round(100 * counts["done"] / counts["total"], 1) if counts["total"] else 0.0
+    return TaskStatsSummary(**counts, completion_pct=completion)
+
+@router.get("/stats", response_model=TaskStatsResponse)
+async def get_task_stats(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Contadores por estado y prioridad, horas estimadas y vencidas, del usuario y por proyecto.
+
+    Se leen de ``task_stats`` (mantenida por deltas), sin recorrer las tareas.
+    """
+    user, projects = await read_stats(db, current_user.id)
+    return TaskStatsResponse(
+        user=stats_summary(user),
+        projects=[stats_summary(project) for project in projects]
+    )
+
+@router.post("/stats:reconcile", response_model=List[StatsDrift])
+async def reconcile_task_stats(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Recalcula las estadísticas del usuario desde cero y devuelve la deriva corregida"""
+    return await reconcile(db, current_user.id)
+
 @router.get("/tasks", response_model=List[Task])
-async def get_tasks(db: Session = Depends(get_db)):
-    tasks = db.query(TaskModel).all()
-    return tasks
+async def get_tasks(
+    request: Request,
+    response: Response,
+    status: Optional[List[TaskStatusEnum]] = Query(None),
+    priority: Optional[List[TaskPriorityEnum]] = Query(None),
+    project_id: Optional[int] = None,
+    parent_task_id: Optional[int] = None,
+    due_after: Optional[datetime] = None,
+    due_before: Optional[datetime] = None,
+    fields: Optional[str] = Query(None, description="Columnas separadas por comas, p. ej. id,title,status"),
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Lista las tareas del usuario paginando por (updated_at, id) descendente.
 
-@router.get("/tasks/{task_id}", response_model=Task)
-async def get_task(task_id: int, db: Session = Depends(get_db)):
-    task = db.query(TaskModel).filter(TaskModel.id == task_id).first()
-    if not task:
+    El cursor de la siguiente página se devuelve en la cabecera ``X-Next-Cursor``
+    y la versión en ``ETag``: con ``If-None-Match`` vigente se responde 304 sin
+    consultar la base de datos. Con ``TASK_LIST_FAST_PATH`` se leen tuplas de columnas y se codifican
+    directamente (orjson, o MessagePack si ``Accept`` lo pide) sin validar cada
+    fila con el modelo ``Task``.
+    """
+    media_type = negotiate(request.headers.get("accept")) if TASK_LIST_FAST_PATH else JSON_MEDIA_TYPE
+    etag = await resource_versions.etag(TASKS, current_user.id, request.url.query, media_type)
+    if resource_versions.check(request.headers.get("if-none-match"), etag):
+        return not_modified(etag, {"Vary": "Accept"} if TASK_LIST_FAST_PATH else None)
+    
+    projection = None
+    if TASK_LIST_FAST_PATH and not fields:
+        fields = ",".join(TASK_FIELDS)
+    if fields:
+        projection = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = set(projection) - set(TASK_FIELDS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+        # updated_at e id siempre se leen porque forman el cursor
+        columns = [getattr(TaskModel, field) for field in projection]
+        columns += [getattr(TaskModel, field) for field in ("updated_at", "id") if field not in projection]
+        query = select(*columns)
+    else:
+        query = select(TaskModel)
+    
+    query = query.where(TaskModel.user_id == current_user.id)
+    if status:
+        query = query.where(TaskModel.status.in_(status))
+    if priority:
+        query = query.where(TaskModel.priority.in_(priority))
+    if project_id is not None:
+        query = query.where(TaskModel.project_id == project_id)
+    if parent_task_id is not None:
+        query = query.where(TaskModel.parent_task_id == parent_task_id)
+    if due_after is not None:
+        query = query.where(TaskModel.due_date >= due_after)
+    if due_before is not None:
+        query = query.where(TaskModel.due_date < due_before)
+    if cursor:
+        cursor_updated_at, cursor_id = decode_cursor(cursor)
+        query = query.where(or_(
+            TaskModel.updated_at < cursor_updated_at,
+            and_(TaskModel.updated_at == cursor_updated_at, TaskModel.id < cursor_id)
+        ))
+    
+    query = query.order_by(TaskModel.updated_at.desc(), TaskModel.id.desc()).limit(limit + 1)
+    result = await db.execute(query)
+    rows = result.all() if projection else result.scalars().all()
+    
+    headers = cache_headers(etag)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        headers["X-Next-Cursor"] = encode_cursor(last.updated_at, last.id)
+    
+    if projection and TASK_LIST_FAST_PATH:
+        headers["Vary"] = "Accept"
+        return Response(content=encode_rows(projection, rows, media_type), media_type=media_type, headers=headers)
+    if projection:
+        items = [{field: row._mapping[field] for field in projection} for row in rows]
+        return JSONResponse(content=jsonable_encoder(items), headers=headers)
+    
+    response.headers.update(headers)
+    return rows
+
+async def check_parent(db: AsyncSession, task_id: int, parent_id: int, user_id: int):
+    """Impide asignar un padre ajeno o que convierta la jerarquía en un ciclo"""
+    if parent_id == task_id:
+        raise HTTPException(status_code=400, detail="A task cannot be its own parent")
+    await get_task_or_404(db, parent_id, user_id)
+    result = await db.execute(ancestors_query(parent_id))
+    if task_id in set(result.scalars()):
+        raise HTTPException(status_code=409, detail="parent_task_id would create a cycle")
+
+@router.get("/tasks/{task_id}/tree", response_model=TaskTreeNode)
+async def get_task_tree(
+    task_id: int,
+    depth: int = Query(TASK_TREE_DEFAULT_DEPTH, ge=0, le=TASK_TREE_MAX_DEPTH),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Subárbol de una tarea en una sola consulta (CTE recursivo).
+
+    Los acumulados (``subtree_tasks``, ``subtree_estimated_hours``,
+    ``completion_pct``) cubren los niveles devueltos.
+    """
+    roots = await load_tree(db, TaskModel.id == task_id, current_user.id, depth)
+    if not roots:
         raise HTTPException(status_code=404, detail="Task not found")
+    return JSONResponse(content=roots[0])
+
+@router.get("/projects/{project_id}/tree", response_model=List[TaskTreeNode])
+async def get_project_tree(
+    project_id: int,
+    depth: int = Query(TASK_TREE_DEFAULT_DEPTH, ge=0, le=TASK_TREE_MAX_DEPTH),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Árboles de todas las tareas raíz de un proyecto"""
+    project = await db.get(Project, project_id)
+    if not project or project.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Project not found")
+    
+    roots = and_(TaskModel.project_id == project_id, TaskModel.parent_task_id.is_(None))
+    return JSONResponse(content=await load_tree(db, roots, current_user.id, depth))
+
+@router.get("/tasks/{task_id}", response_model=Task)
+async def get_task(
+    task_id: int,
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    etag = await resource_versions.etag(TASKS, current_user.id)
+    if resource_versions.check(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
+    task = await get_task_or_404(db, task_id, current_user.id)
+    response.headers.update(cache_headers(etag))
     return task
 
 @router.put("/tasks/{task_id}", response_model=Task)
-async def update_task(task_id: int, task: TaskUpdate, db: Session = Depends(get_db)):
-    db_task = db.query(TaskModel).filter(TaskModel.id == task_id).first()
-    if not db_task:
-        raise HTTPException(status_code=404, detail="Task not found")
+async def update_task(
+    task_id: int,
+    task: TaskUpdate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    db_task = await get_task_or_404(db, task_id, current_user.id)
     
-    for field, value in task.dict(exclude_unset=True).items():
+    changes = task.dict(exclude_unset=True)
+    new_parent_id = changes.get("parent_task_id")
+    if new_parent_id is not None and new_parent_id != db_task.parent_task_id:
+        await check_parent(db, task_id, new_parent_id, current_user.id)
+    
+    stats = StatsDelta()
+    stats.add_task(db_task, -1)
+    for field, value in changes.items():
         setattr(db_task, field, value)
+    stats.add_task(db_task)
     
     if task.status == TaskStatusEnum.DONE and not db_task.completed_at:
         db_task.completed_at = datetime.utcnow()
@@ -93,22 +705,40 @@ async def update_task(task_id: int, task: TaskUpdate, db: Session = Depends(get_
         db_task.completed_at = None
     
     db_task.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(db_task)
+    await stats.flush(db)
+    await db.commit()
+    await db.refresh(db_task)
+    await resource_versions.bump(TASKS, current_user.id)
+    await change_feed.publish(current_user.id, "task.updated", task_id=db_task.id, task=task_payload(db_task))
     return db_task
 
 @router.delete("/tasks/{task_id}")
-async def delete_task(task_id: int, db: Session = Depends(get_db)):
-    db_task = db.query(TaskModel).filter(TaskModel.id == task_id).first()
-    if not db_task:
-        raise HTTPException(status_code=404, detail="Task not found")
+async def delete_task(
+    task_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    db_task = await get_task_or_404(db, task_id, current_user.id)
     
-    db.delete(db_task)
-    db.commit()
+    stats = StatsDelta()
+    stats.add_task(db_task, -1)
+    await stats.flush(db)
+    await db.delete(db_task)
+    await db.commit()
+    await resource_versions.bump(TASKS, current_user.id)
+    await change_feed.publish(current_user.id, "task.deleted", task_id=task_id)
     return {"message": "Task deleted successfully"}
 
-async def generate_ai_suggestions(task: TaskModel, db: Session):
-    """Genera sugerencias de IA para una tarea."""
+def usage_tokens(response, messages: List[dict], content: Optional[str]) -> Tuple[int, int]:
+    """Tokens (prompt, completion) de la respuesta; estimados si el proveedor no los devuelve"""
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        return usage.prompt_tokens or 0, usage.completion_tokens or 0
+    prompt = "".join(message["content"] for message in messages)
+    return estimate_tokens(prompt), estimate_tokens(content or "")
+
+async def request_ai_suggestion(task: TaskModel, gateway: LLMGateway = llm_gateway) -> Tuple[str, int, int]:
+    """Pide las sugerencias de una tarea; devuelve el texto y los tokens (prompt, completion), 0 si venía de caché"""
     prompt = f"""
     Analiza esta tarea y proporciona sugerencias útiles:
     
@@ -124,41 +754,201 @@ async def generate_ai_suggestions(task: TaskModel, db: Session):
     4. Prioridad recomendada
     """
     
-    try:
-        response = await ai_client.chat.completions.create(
-            model="qwen/qwq-32b:online",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7
-        )
-        
-        suggestion = AISuggestion(
-            task_id=task.id,
-            suggestion_type="comprehensive",
-            content=response.choices[0].message.content
-        )
-        
-        db.add(suggestion)
-        db.commit()
-        
-    except Exception as e:
-        print(f"Error generating AI suggestions: {e}")
+    messages = [{"role": "user", "content": prompt}]
+    
+    cache_key = completion_cache.make_key(SUGGESTION_MODEL, messages, SUGGESTION_TEMPERATURE)
+    content = await completion_cache.get(cache_key)
+    if content is not None:
+        return content, 0, 0
+    
+    response = await gateway.chat_completion(
+        model=SUGGESTION_MODEL,
+        messages=messages,
+        temperature=SUGGESTION_TEMPERATURE
+    )
+    content = response.choices[0].message.content
+    await completion_cache.set(cache_key, content)
+    return (content, *usage_tokens(response, messages, content))
+
+def make_suggestion_handler(gateway: LLMGateway = llm_gateway, session_factory=AsyncSessionLocal):
+    """Crea el handler de la cola de sugerencias; el gateway es inyectable para pruebas.
+
+    La tarea se lee en una sesión corta que se cierra antes de llamar al
+    modelo; la cola guarda la sugerencia junto con el paso a READY.
+    """
+    async def run_suggestion_job(job_id: int) -> Optional[str]:
+        async with session_factory() as db:
+            job = await db.get(SuggestionJob, job_id)
+            task = await db.get(TaskModel, job.task_id) if job is not None else None
+        if task is None:
+            return None
+        content, _, _ = await request_ai_suggestion(task, gateway)
+        return content
+    return run_suggestion_job
+
+suggestion_queue = SuggestionQueue(make_suggestion_handler())
 
-@router.get("/tasks/{task_id}/suggestions")
+@router.get("/tasks/{task_id}/suggestions", response_model=TaskSuggestions)
 async def get_task_suggestions(
     task_id: int,
-    current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
 ):
-    task = db.query(TaskModel).filter(
-        TaskModel.id == task_id,
-        TaskModel.user_id == current_user["id"]
-    ).first()
+    etag = await resource_versions.etag(TASKS, current_user.id)
+    if resource_versions.check(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
     
-    if not task:
+    result = await db.execute(
+        select(TaskModel.id).where(
+            TaskModel.id == task_id,
+            TaskModel.user_id == current_user.id
+        )
+    )
+    
+    if result.scalar_one_or_none() is None:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    suggestions = db.query(AISuggestion).filter(
-        AISuggestion.task_id == task_id
-    ).all()
+    result = await db.execute(select(SuggestionJob).where(SuggestionJob.task_id == task_id))
+    job = result.scalar_one_or_none()
+    result = await db.execute(
+        select(AISuggestion).where(AISuggestion.task_id == task_id)
+    )
+    suggestions = result.scalars().all()
+    
+    response.headers.update(cache_headers(etag))
+    return {
+        "status": job.status if job else SuggestionJobStatus.READY,
+        "error": job.last_error if job and job.status == SuggestionJobStatus.FAILED else None,
+        "suggestions": suggestions
+    }
+
+async def run_suggestion_batch(tasks: List[TaskModel], gateway: LLMGateway) -> Tuple[Dict[int, str], int, int]:
+    """Una llamada para un lote de tareas; devuelve las sugerencias por id y los tokens (prompt, completion)"""
+    messages = build_batch_messages(tasks)
+    response = await gateway.chat_completion(
+        model=SUGGESTION_MODEL,
+        messages=messages,
+        temperature=SUGGESTION_TEMPERATURE
+    )
+    content = response.choices[0].message.content
+    prompt_tokens, completion_tokens = usage_tokens(response, messages, content)
+    return parse_batch_response(content, [task.id for task in tasks]), prompt_tokens, completion_tokens
+
+@router.post(
+    "/tasks/suggestions:batch",
+    response_model=BatchSuggestionReport,
+    dependencies=[Depends(rate_limit("suggestions"))]
+)
+async def batch_task_suggestions(
+    request: BatchSuggestionRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Genera sugerencias para varias tareas empaquetándolas en pocas llamadas al modelo.
+
+    Las tareas que el modelo omite en la respuesta del lote se reintentan con
+    la llamada individual de siempre.
+    """
+    task_ids = list(dict.fromkeys(request.task_ids))
+    if not task_ids or len(task_ids) > BATCH_SUGGESTION_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"Between 1 and {BATCH_SUGGESTION_MAX_IDS} task ids are required")
+    if current_user.credits <= 0:
+        raise HTTPException(status_code=402, detail="No credits remaining")
+    
+    result = await db.execute(
+        select(TaskModel).where(
+            TaskModel.id.in_(task_ids),
+            TaskModel.user_id == current_user.id
+        )
+    )
+    tasks = {task.id: task for task in result.scalars()}
+    missing = [task_id for task_id in task_ids if task_id not in tasks]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Tasks not found: {missing}")
+    # La conexión no se retiene mientras el modelo responde; los resultados se
+    # escriben después en una transacción nueva de la misma sesión
+    await db.close()
+    
+    start = time.perf_counter()
+    batches = pack_tasks([tasks[task_id] for task_id in task_ids])
+    outcomes = await asyncio.gather(
+        *(run_suggestion_batch(batch, llm_gateway) for batch in batches),
+        return_exceptions=True
+    )
+    
+    items: Dict[int, BatchSuggestionItem] = {}
+    contents: Dict[int, str] = {}
+    prompt_tokens = completion_tokens = 0
+    # Solo las llamadas que llegaron al modelo: ni lotes fallidos ni aciertos de caché
+    llm_calls = 0
+    dropped: List[TaskModel] = []
+    for batch, outcome in zip(batches, outcomes):
+        if isinstance(outcome, Exception):
+            logger.warning("Lote de %s sugerencias fallido, se usa la llamada individual: %s", len(batch), outcome)
+            dropped.extend(batch)
+            continue
+        parsed, batch_prompt, batch_completion = outcome
+        llm_calls += 1
+        prompt_tokens += batch_prompt
+        completion_tokens += batch_completion
+        usage_recorder.record(current_user.id, SUGGESTION_MODEL, batch_prompt + batch_completion, endpoint="/api/tasks/suggestions:batch")
+        share = (batch_prompt + batch_completion) // len(batch)
+        for task in batch:
+            if task.id in parsed:
+                contents[task.id] = parsed[task.id]
+                items[task.id] = BatchSuggestionItem(task_id=task.id, source="batch", tokens=share)
+            else:
+                dropped.append(task)
+    
+    fallbacks = await asyncio.gather(
+        *(request_ai_suggestion(task, llm_gateway) for task in dropped),
+        return_exceptions=True
+    )
+    for task, outcome in zip(dropped, fallbacks):
+        if isinstance(outcome, Exception):
+            items[task.id] = BatchSuggestionItem(task_id=task.id, source="failed", error=str(outcome))
+            continue
+        content, task_prompt, task_completion = outcome
+        prompt_tokens += task_prompt
+        completion_tokens += task_completion
+        tokens = task_prompt + task_completion
+        if tokens:
+            llm_calls += 1
+            usage_recorder.record(current_user.id, SUGGESTION_MODEL, tokens, endpoint="/api/tasks/suggestions:batch")
+        contents[task.id] = content
+        items[task.id] = BatchSuggestionItem(task_id=task.id, source="fallback", tokens=tokens)
+    
+    suggestions = {task_id: AISuggestion(task_id=task_id, suggestion=content) for task_id, content in contents.items()}
+    db.add_all(suggestions.values())
+    if suggestions:
+        # Las tareas ya atendidas no necesitan pasar por la cola individual; un
+        # trabajo que ya estaba RUNNING descarta su resultado al no poder cerrarse
+        await db.execute(
+            update(SuggestionJob)
+            .where(
+                SuggestionJob.task_id.in_(suggestions),
+                SuggestionJob.status.in_([SuggestionJobStatus.PENDING, SuggestionJobStatus.RUNNING])
+            )
+            .values(status=SuggestionJobStatus.READY, updated_at=datetime.utcnow())
+        )
+    await db.flush()
+    for task_id, suggestion in suggestions.items():
+        items[task_id].suggestion_id = suggestion.id
+    await db.commit()
+    if suggestions:
+        await resource_versions.bump(TASKS, current_user.id)
     
-    return suggestions 
\ No newline at end of file
+    total_tokens = prompt_tokens + completion_tokens
+    return BatchSuggestionReport(
+        results=[items[task_id] for task_id in task_ids],
+        batches=len(batches),
+        llm_calls=llm_calls,
+        fallbacks=len(dropped),
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=total_tokens,
+        tokens_per_task=round(total_tokens / len(task_ids), 1),
+        elapsed_ms=round((time.perf_counter() - start) * 1000, 1)
+    )
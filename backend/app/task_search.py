@@ -0,0 +1,105 @@
+import os
+import re
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import async_engine
+
+# Configuración
+TASK_SEARCH_DEFAULT_LIMIT = int(os.getenv("TASK_SEARCH_DEFAULT_LIMIT", 20))
+TASK_SEARCH_MAX_LIMIT = int(os.getenv("TASK_SEARCH_MAX_LIMIT", 100))
+TASK_SEARCH_MAX_TERMS = int(os.getenv("TASK_SEARCH_MAX_TERMS", 8))
+TASK_SEARCH_MIN_PREFIX = int(os.getenv("TASK_SEARCH_MIN_PREFIX", 2))  # términos más cortos se buscan exactos
+
+# Índice mantenido por triggers (migración 0004). En SQLite es una tabla FTS5
+# cuyo rowid es el id de la tarea; en PostgreSQL, una tabla con un tsvector
+# ponderado e índice GIN.
+SEARCH_TABLE = "task_search"
+
+# Pesos por columna: título > etiquetas > descripción > sugerencias de IA
+SQLITE_WEIGHTS = {"title": 10.0, "description": 4.0, "tags": 6.0, "suggestions": 1.0, "owner": 0.0}
+
+TERM_PATTERN = re.compile(r"[^\W_]+", re.UNICODE)
+
+SQLITE_SEARCH = text(f"""
+    SELECT t.id, t.title, t.description, t.status, t.priority, t.due_date, t.project_id,
+           -bm25({SEARCH_TABLE}, {", ".join(str(weight) for weight in SQLITE_WEIGHTS.values())}) AS score,
+           snippet({SEARCH_TABLE}, -1, '[', ']', '…', 12) AS snippet
+    FROM {SEARCH_TABLE}
+    JOIN tasks t ON t.id = {SEARCH_TABLE}.rowid
+    WHERE {SEARCH_TABLE} MATCH :match
+    ORDER BY score DESC, t.id DESC
+    LIMIT :limit OFFSET :offset
+""")
+
+POSTGRES_SEARCH = text(f"""
+    SELECT t.id, t.title, t.description, t.status, t.priority, t.due_date, t.project_id,
+           ts_rank_cd(s.document, q.query) AS score,
+           ts_headline('simple', coalesce(t.description, t.title), q.query,
+                       'StartSel=[, StopSel=], MaxFragments=1, MaxWords=12, MinWords=4') AS snippet
+    FROM {SEARCH_TABLE} s
+    JOIN tasks t ON t.id = s.task_id
+    CROSS JOIN (SELECT to_tsquery('simple', :match) AS query) q
+    WHERE s.user_id = :user_id AND s.document @@ q.query
+    ORDER BY score DESC, t.id DESC
+    LIMIT :limit OFFSET :offset
+""")
+
+def search_terms(query: str) -> List[str]:
+    """Palabras de la consulta en minúsculas, sin operadores ni duplicados"""
+    terms: List[str] = []
+    for term in TERM_PATTERN.findall(query.lower()):
+        if term not in terms:
+            terms.append(term)
+    return terms[:TASK_SEARCH_MAX_TERMS]
+
+def is_prefix(term: str, prefix: bool) -> bool:
+    return prefix and len(term) >= TASK_SEARCH_MIN_PREFIX
+
+def fts5_match(user_id: int, terms: List[str], prefix: bool = True) -> str:
+    """Expresión MATCH de FTS5 limitada a las tareas del usuario.
+
+    El filtro por usuario va dentro de la consulta (columna ``owner`` con el
+    token ``u<id>``) para que FTS5 cruce las listas de postings en lugar de
+    filtrar después todos los resultados globales. Cada término se entrecomilla,
+    así que la entrada del usuario nunca se interpreta como sintaxis de FTS5.
+    Solo se restringen los términos a las columnas de texto cuando alguno
+    coincidiría con el propio token ``owner``: el filtro de columnas duplica el
+    coste de bm25 con términos muy frecuentes.
+    """
+    owner = f"u{user_id}"
+    parts = [f'"{term}"*' if is_prefix(term, prefix) else f'"{term}"' for term in terms]
+    expression = " AND ".join(parts)
+    if any(owner.startswith(term) if is_prefix(term, prefix) else owner == term for term in terms):
+        expression = f"{{title description tags suggestions}}:({expression})"
+    return f"owner:{owner} AND ({expression})"
+
+def tsquery(terms: List[str], prefix: bool = True) -> str:
+    """Expresión para ``to_tsquery``; los términos solo contienen caracteres de palabra"""
+    return " & ".join(f"{term}:*" if is_prefix(term, prefix) else term for term in terms)
+
+async def search_tasks(
+    db: AsyncSession,
+    user_id: int,
+    query: str,
+    limit: int = TASK_SEARCH_DEFAULT_LIMIT,
+    offset: int = 0,
+    prefix: bool = True,
+) -> Optional[List[dict]]:
+    """Tareas del usuario que contienen todos los términos, de mayor a menor relevancia.
+
+    Devuelve ``None`` si la consulta no tiene ningún término buscable.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return None
+    if async_engine.dialect.name == "postgresql":
+        statement = POSTGRES_SEARCH
+        params = {"match": tsquery(terms, prefix), "user_id": user_id}
+    else:
+        statement = SQLITE_SEARCH
+        params = {"match": fts5_match(user_id, terms, prefix)}
+    result = await db.execute(statement, {**params, "limit": limit, "offset": offset})
+    return [dict(row._mapping) for row in result]
@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import os
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import case, func, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import AsyncSessionLocal, async_engine
+from .enums import TaskPriority, TaskStatus
+from .models import Task, TaskStats
+
+logger = logging.getLogger(__name__)
+
+# Configuración
+TASK_STATS_RECONCILE_INTERVAL = float(os.getenv("TASK_STATS_RECONCILE_INTERVAL", 3600))  # 0 desactiva el job
+
+stats_table = TaskStats.__table__
+
+USER_SCOPE = 0  # project_id de la fila con los totales del usuario
+COUNTER_COLUMNS = ["total", "todo", "in_progress", "done", "low", "medium", "high", "estimated_hours"]
+STATUS_COLUMNS = {TaskStatus.TODO: "todo", TaskStatus.IN_PROGRESS: "in_progress", TaskStatus.DONE: "done"}
+PRIORITY_COLUMNS = {TaskPriority.LOW: "low", TaskPriority.MEDIUM: "medium", TaskPriority.HIGH: "high"}
+
+def contribution(status, priority, estimated_hours) -> Counter:
+    """Lo que una tarea aporta a los contadores de su usuario y su proyecto"""
+    counts = Counter(total=1)
+    if status is not None:
+        counts[STATUS_COLUMNS[TaskStatus(status)]] += 1
+    if priority is not None:
+        counts[PRIORITY_COLUMNS[TaskPriority(priority)]] += 1
+    if estimated_hours:
+        counts["estimated_hours"] += estimated_hours
+    return counts
+
+def upsert(values: dict, increment: bool = True):
+    """INSERT ... ON CONFLICT para SQLite y PostgreSQL; suma o sustituye los contadores"""
+    insert = postgresql_insert if async_engine.dialect.name == "postgresql" else sqlite_insert
+    statement = insert(stats_table).values(**values)
+    if increment:
+        changes = {column: stats_table.c[column] + statement.excluded[column] for column in COUNTER_COLUMNS}
+    else:
+        changes = {column: statement.excluded[column] for column in COUNTER_COLUMNS}
+    changes["updated_at"] = statement.excluded.updated_at
+    return statement.on_conflict_do_update(index_elements=["user_id", "project_id"], set_=changes)
+
+class StatsDelta:
+    """Acumula los cambios de contadores de una transacción y los aplica con un upsert por ámbito.
+
+    Se escribe en la misma transacción que la tarea, así que los contadores
+    nunca quedan a medias si la escritura falla.
+    """
+
+    def __init__(self):
+        self._deltas: Dict[Tuple[int, int], Counter] = defaultdict(Counter)
+
+    def add(self, user_id: int, project_id: Optional[int], status, priority, estimated_hours, sign: int = 1):
+        counts = contribution(status, priority, estimated_hours)
+        scopes = [(user_id, USER_SCOPE)]
+        if project_id:
+            scopes.append((user_id, project_id))
+        for scope in scopes:
+            for column, value in counts.items():
+                self._deltas[scope][column] += sign * value
+
+    def add_task(self, task: Task, sign: int = 1):
+        self.add(task.user_id, task.project_id, task.status, task.priority, task.estimated_hours, sign)
+
+    async def flush(self, db: AsyncSession):
+        now = datetime.utcnow()
+        for (user_id, project_id), counts in self._deltas.items():
+            values = {column: counts.get(column, 0) for column in COUNTER_COLUMNS}
+            if not any(values.values()):
+                continue
+            await db.execute(upsert({"user_id": user_id, "project_id": project_id, "updated_at": now, **values}))
+        self._deltas.clear()
+
+def empty_counts() -> dict:
+    return {column: 0 for column in COUNTER_COLUMNS}
+
+async def recompute(db: AsyncSession, user_id: Optional[int] = None) -> Dict[Tuple[int, int], dict]:
+    """Contadores calculados desde cero a partir de ``tasks``"""
+    query = (
+        select(
+            Task.user_id,
+            Task.project_id,
+            func.count().label("total"),
+            *(
+                func.sum(case((Task.status == status, 1), else_=0)).label(column)
+                for status, column in STATUS_COLUMNS.items()
+            ),
+            *(
+                func.sum(case((Task.priority == priority, 1), else_=0)).label(column)
+                for priority, column in PRIORITY_COLUMNS.items()
+            ),
+            func.sum(func.coalesce(Task.estimated_hours, 0)).label("estimated_hours"),
+        )
+        .group_by(Task.user_id, Task.project_id)
+    )
+    if user_id is not None:
+        query = query.where(Task.user_id == user_id)
+
+    expected: Dict[Tuple[int, int], dict] = defaultdict(empty_counts)
+    for row in await db.execute(query):
+        scopes = [(row.user_id, USER_SCOPE)]
+        if row.project_id:
+            scopes.append((row.user_id, row.project_id))
+        for scope in scopes:
+            for column in COUNTER_COLUMNS:
+                expected[scope][column] += row._mapping[column] or 0
+    return expected
+
+async def reconcile(db: AsyncSession, user_id: Optional[int] = None) -> List[dict]:
+    """Recalcula los contadores, corrige las filas que difieren y devuelve la deriva encontrada.
+
+    No bloquea las escrituras concurrentes: una tarea modificada mientras se
+    recalcula puede aparecer como deriva y se corregirá en la siguiente pasada.
+    """
+    expected = await recompute(db, user_id)
+
+    query = select(stats_table)
+    if user_id is not None:
+        query = query.where(stats_table.c.user_id == user_id)
+    actual = {
+        (row.user_id, row.project_id): {column: row._mapping[column] for column in COUNTER_COLUMNS}
+        for row in await db.execute(query)
+    }
+
+    drift = []
+    now = datetime.utcnow()
+    for scope in expected.keys() | actual.keys():
+        wanted = expected.get(scope) or empty_counts()
+        stored = actual.get(scope) or empty_counts()
+        diff = {
+            column: wanted[column] - stored[column]
+            for column in COUNTER_COLUMNS
+            if abs(wanted[column] - stored[column]) > 1e-6
+        }
+        if not diff:
+            continue
+        drift.append({"user_id": scope[0], "project_id": scope[1], "diff": diff})
+        await db.execute(upsert({"user_id": scope[0], "project_id": scope[1], "updated_at": now, **wanted}, increment=False))
+    await db.commit()
+    return drift
+
+def overdue_query(user_id: int, now: datetime):
+    """Tareas abiertas vencidas por proyecto.
+
+    No se precalculan en ``task_stats``: una tarea pasa a vencida con el reloj,
+    sin ninguna escritura que actualice el contador. Se cuentan al leer con un
+    rango sobre ``ix_tasks_user_status_due`` que solo recorre las tareas
+    abiertas y vencidas del usuario (lo comprueba ``benchmarks.query_plans``).
+    """
+    return (
+        select(Task.project_id, func.count())
+        .where(
+            Task.user_id == user_id,
+            Task.status.in_([TaskStatus.TODO, TaskStatus.IN_PROGRESS]),
+            Task.due_date < now
+        )
+        .group_by(Task.project_id)
+    )
+
+async def read_stats(db: AsyncSession, user_id: int) -> Tuple[dict, List[dict]]:
+    """Totales del usuario y por proyecto: una fila por ámbito más el recuento de vencidas"""
+    result = await db.execute(select(stats_table).where(stats_table.c.user_id == user_id))
+    rows = {row.project_id: {column: row._mapping[column] for column in COUNTER_COLUMNS} for row in result}
+
+    result = await db.execute(overdue_query(user_id, datetime.utcnow()))
+    overdue = Counter()
+    for project_id, count in result:
+        overdue[USER_SCOPE] += count
+        if project_id:
+            overdue[project_id] += count
+
+    user = {"project_id": None, **(rows.pop(USER_SCOPE, None) or empty_counts()), "overdue": overdue[USER_SCOPE]}
+    projects = [
+        {"project_id": project_id, **counts, "overdue": overdue[project_id]}
+        for project_id, counts in sorted(rows.items())
+        if counts["total"]
+    ]
+    return user, projects
+
+class StatsReconciler:
+    """Job periódico que recalcula ``task_stats`` y registra la deriva"""
+
+    def __init__(self, session_factory=AsyncSessionLocal, interval: float = TASK_STATS_RECONCILE_INTERVAL):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.last_run: Optional[datetime] = None
+        self.last_drift: List[dict] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run(), name="stats-reconciler")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run_once(self, user_id: Optional[int] = None) -> List[dict]:
+        async with self.session_factory() as db:
+            drift = await reconcile(db, user_id)
+        self.last_run = datetime.utcnow()
+        self.last_drift = drift
+        if drift:
+            logger.warning("Deriva en task_stats corregida en %s ámbitos: %s", len(drift), drift[:10])
+        return drift
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Error reconciliando task_stats")
+
+stats_reconciler = StatsReconciler()
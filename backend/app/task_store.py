@@ -0,0 +1,381 @@
+import gc
+import json
+import logging
+import marshal
+import os
+import sys
+import threading
+from itertools import islice, repeat
+from operator import itemgetter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Configuración
+TASK_STORE_DIR = os.getenv("TASK_STORE_DIR", "./data/tasks")  # vacío: solo en memoria
+TASK_STORE_FSYNC = os.getenv("TASK_STORE_FSYNC", "0") == "1"  # fsync tras cada escritura (sobrevive a cortes de luz)
+TASK_STORE_COMPACT_OPS = int(os.getenv("TASK_STORE_COMPACT_OPS", 50000))  # operaciones en el log antes de compactar; 0 lo desactiva
+
+SNAPSHOT_FILE = "snapshot.marshal"
+SNAPSHOT_VERSION = 2
+# Cabecera de texto antes del marshal: la versión se comprueba sin decodificar nada
+SNAPSHOT_MAGIC = b"task-store-snapshot"
+INDEXED_FIELDS = ("status", "priority", "tag")
+
+class TaskRecord(NamedTuple):
+    """Tarea almacenada: tupla con nombre, sin ``__dict__`` y con las etiquetas en una tupla.
+
+    Es inmutable: las actualizaciones crean un registro nuevo, lo que permite
+    que el snapshot serialice en otro hilo una copia de la lista de registros
+    sin bloquear las escrituras.
+    """
+
+    id: int
+    title: str
+    description: str
+    status: str
+    priority: str
+    tags: Tuple[str, ...]
+    created_at: str
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "title": self.title,
+            "description": self.description,
+            "status": self.status,
+            "priority": self.priority,
+            "tags": list(self.tags),
+            "created_at": self.created_at,
+        }
+
+def make_record(id: int, title: str, description: str, status: str, priority: str, tags: Iterable[str], created_at: str) -> TaskRecord:
+    """Registro con los valores repetidos internados: una sola copia de cada cadena en memoria"""
+    return TaskRecord(id, title, description, sys.intern(status), sys.intern(priority), tuple(map(sys.intern, tags)), created_at)
+
+class SnapshotVersionError(RuntimeError):
+    """El snapshot es de otro formato: cargarlo (o ignorarlo) perdería tareas"""
+
+def snapshot_header() -> bytes:
+    return b"%s %d\n" % (SNAPSHOT_MAGIC, SNAPSHOT_VERSION)
+
+def read_snapshot(path: str) -> dict:
+    """Datos del snapshot; ``SnapshotVersionError`` si su versión no es ``SNAPSHOT_VERSION``.
+
+    No se ignora: los segmentos que cubre ya se borraron al compactar.
+    """
+    with open(path, "rb") as snapshot:
+        content = snapshot.read()
+    end = content.find(b"\n")
+    header = content[:end] if end >= 0 else content
+    if header != snapshot_header().rstrip(b"\n"):
+        found = header[:40].decode("ascii", "replace") if header.startswith(SNAPSHOT_MAGIC) else "sin cabecera"
+        raise SnapshotVersionError(
+            f"{path}: se esperaba la versión {SNAPSHOT_VERSION} del snapshot ({found}); "
+            "conviértelo o apártalo para arrancar"
+        )
+    # memoryview: un snapshot grande no se copia para saltar la cabecera
+    return marshal.loads(memoryview(content)[end + 1:])
+
+def segment_name(segment: int) -> str:
+    return f"log.{segment:08d}.jsonl"
+
+def parse_segment(name: str) -> Optional[int]:
+    if name.startswith("log.") and name.endswith(".jsonl") and name[4:-6].isdigit():
+        return int(name[4:-6])
+    return None
+
+class TaskStore:
+    """Almacén de tareas en memoria con índices secundarios y persistencia opcional.
+
+    Las tareas viven en un dict por id (en orden de creación) y los índices por
+    estado, prioridad y etiqueta son dicts ``id -> None`` usados como conjuntos
+    ordenados: altas, bajas y cambios son O(1) y un listado filtrado recorre
+    solo el índice más pequeño de los que pide.
+
+    Con ``directory`` cada escritura se añade a un log (una línea JSON por
+    operación, en segmentos numerados). Cada ``compact_ops`` operaciones se
+    rota a un segmento nuevo y un hilo escribe un snapshot del estado con el
+    número de ese segmento; al terminar borra los segmentos que el snapshot ya
+    cubre. Al arrancar se carga el snapshot y se reproducen los segmentos
+    posteriores; como cada operación guarda el registro completo, reproducir
+    de más (un corte entre el snapshot y el borrado) es inofensivo.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = TASK_STORE_DIR,
+        fsync: bool = TASK_STORE_FSYNC,
+        compact_ops: int = TASK_STORE_COMPACT_OPS,
+    ):
+        self.directory = directory or None
+        self.fsync = fsync
+        self.compact_ops = compact_ops
+        self._tasks: Dict[int, TaskRecord] = {}
+        self._indexes: Dict[str, Dict[str, Dict[int, None]]] = {field: {} for field in INDEXED_FIELDS}
+        self._unsorted: Set[Tuple[str, str]] = set()
+        self._next_id = 1
+        self._file = None
+        self._segment = 0
+        self._ops = 0
+        self._compactor: Optional[threading.Thread] = None
+        if self.directory is not None:
+            # Cargar crea millones de tuplas que viven para siempre: el recolector
+            # de ciclos solo las recorrería una y otra vez sin liberar nada
+            collecting = gc.isenabled()
+            gc.disable()
+            try:
+                self._load()
+            finally:
+                if collecting:
+                    gc.enable()
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def get(self, task_id: int) -> Optional[TaskRecord]:
+        return self._tasks.get(task_id)
+
+    def create(self, title: str, description: str, status: str, priority: str, tags: Iterable[str], created_at: str) -> TaskRecord:
+        record = make_record(self._next_id, title, description, status, priority, tags, created_at)
+        self._next_id += 1
+        self._put(record)
+        self._log(["p", *record])
+        return record
+
+    def update(self, task_id: int, **changes) -> Optional[TaskRecord]:
+        """Sustituye los campos indicados; devuelve None si la tarea no existe"""
+        current = self._tasks.get(task_id)
+        if current is None:
+            return None
+        record = make_record(*current._replace(**changes))
+        self._put(record)
+        self._log(["p", *record])
+        return record
+
+    def delete(self, task_id: int) -> bool:
+        if not self._remove(task_id):
+            return False
+        self._log(["d", task_id])
+        return True
+
+    def list(
+        self,
+        status: Optional[str] = None,
+        priority: Optional[str] = None,
+        tag: Optional[str] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+    ) -> List[TaskRecord]:
+        """Tareas en orden de id que cumplen todos los filtros"""
+        filters = [(field, value) for field, value in zip(INDEXED_FIELDS, (status, priority, tag)) if value is not None]
+        stop = None if limit is None else offset + limit
+        if not filters:
+            return list(islice(self._tasks.values(), offset, stop))
+        buckets = []
+        for field, value in filters:
+            bucket = self._indexes[field].get(value)
+            if not bucket:
+                return []
+            buckets.append((field, value, bucket))
+        field, value, _ = min(buckets, key=lambda item: len(item[2]))
+        ids = iter(self._sorted_bucket(field, value))
+        for other, _, bucket in buckets:
+            if other != field:
+                ids = filter(bucket.__contains__, ids)
+        return list(map(self._tasks.__getitem__, islice(ids, offset, stop)))
+
+    def _sorted_bucket(self, field: str, value: str) -> Dict[int, None]:
+        """Un id que vuelve a un índice se añade al final; se reordena solo cuando hace falta listar"""
+        bucket = self._indexes[field][value]
+        if (field, value) in self._unsorted:
+            bucket = self._indexes[field][value] = dict.fromkeys(sorted(bucket))
+            self._unsorted.discard((field, value))
+        return bucket
+
+    def _index_add(self, field: str, value: str, task_id: int):
+        bucket = self._indexes[field].get(value)
+        if bucket is None:
+            bucket = self._indexes[field][value] = {}
+        elif task_id < next(reversed(bucket)):
+            self._unsorted.add((field, value))
+        bucket[task_id] = None
+
+    def _index_remove(self, field: str, value: str, task_id: int):
+        bucket = self._indexes[field].get(value)
+        if bucket is None:
+            return
+        bucket.pop(task_id, None)
+        if not bucket:
+            del self._indexes[field][value]
+            self._unsorted.discard((field, value))
+
+    def _put(self, record: TaskRecord):
+        """Alta o sustitución de un registro; solo toca los índices cuyos valores cambian"""
+        previous = self._tasks.get(record.id)
+        self._tasks[record.id] = record
+        if previous is None:
+            self._index_add("status", record.status, record.id)
+            self._index_add("priority", record.priority, record.id)
+            for tag in record.tags:
+                self._index_add("tag", tag, record.id)
+            return
+        if previous.status != record.status:
+            self._index_remove("status", previous.status, record.id)
+            self._index_add("status", record.status, record.id)
+        if previous.priority != record.priority:
+            self._index_remove("priority", previous.priority, record.id)
+            self._index_add("priority", record.priority, record.id)
+        if previous.tags != record.tags:
+            for tag in set(previous.tags) - set(record.tags):
+                self._index_remove("tag", tag, record.id)
+            for tag in set(record.tags) - set(previous.tags):
+                self._index_add("tag", tag, record.id)
+
+    def _remove(self, task_id: int) -> bool:
+        record = self._tasks.pop(task_id, None)
+        if record is None:
+            return False
+        self._index_remove("status", record.status, task_id)
+        self._index_remove("priority", record.priority, task_id)
+        for tag in record.tags:
+            self._index_remove("tag", tag, task_id)
+        return True
+
+    # Persistencia
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        first_segment = 0
+        snapshot_path = self._path(SNAPSHOT_FILE)
+        if os.path.exists(snapshot_path):
+            data = read_snapshot(snapshot_path)
+            first_segment = data["segment"]
+            self._next_id = data["next_id"]
+            # Filas e índices se reconstruyen sin pasar por Python fila a fila
+            rows = data["tasks"]
+            self._tasks = dict(zip(map(itemgetter(0), rows), map(tuple.__new__, repeat(TaskRecord), rows)))
+            self._indexes = {
+                field: {value: dict.fromkeys(ids) for value, ids in values.items()}
+                for field, values in data["indexes"].items()
+            }
+
+        segments = sorted(segment for segment in map(parse_segment, os.listdir(self.directory)) if segment is not None)
+        for segment in segments:
+            if segment < first_segment:
+                # Compactación interrumpida después de escribir el snapshot
+                os.remove(self._path(segment_name(segment)))
+                continue
+            self._ops += self._replay(self._path(segment_name(segment)))
+        self._segment = max(segments[-1] if segments else 0, first_segment)
+        self._file = open(self._path(segment_name(self._segment)), "a", encoding="utf-8")
+
+    def _replay(self, path: str) -> int:
+        with open(path, "rb") as log:
+            content = log.read()
+        complete = content.rfind(b"\n") + 1
+        if complete < len(content):
+            # Última línea a medio escribir por una caída: se recorta para seguir añadiendo detrás
+            logger.warning("Entrada incompleta al final de %s; se descarta", path)
+            with open(path, "r+b") as log:
+                log.truncate(complete)
+        # Solo "\n" separa entradas: json.dumps con ensure_ascii=False deja U+2028 tal cual
+        lines = content[:complete].split(b"\n")[:-1]
+        try:
+            entries = json.loads(b"[" + b",".join(lines) + b"]")
+        except ValueError:
+            entries = []
+            offset = 0
+            for line in lines:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    self._cut_corrupt(path, content, offset)
+                    break
+                offset += len(line) + 1
+        for entry in entries:
+            if entry[0] == "p":
+                record = make_record(*entry[1:])
+                self._put(record)
+                self._next_id = max(self._next_id, record.id + 1)
+            else:
+                self._remove(entry[1])
+        return len(entries)
+
+    @staticmethod
+    def _cut_corrupt(path: str, content: bytes, offset: int):
+        """Aparta el segmento desde la entrada corrupta y lo recorta ahí.
+
+        El resto no se puede reproducir, y sin recortar las escrituras que se
+        añadan a este segmento quedarían detrás de la línea corrupta.
+        """
+        corrupt = path + ".corrupt"
+        with open(corrupt, "ab") as side:
+            side.write(content[offset:])
+        with open(path, "r+b") as log:
+            log.truncate(offset)
+        logger.warning("Entrada corrupta en %s (byte %s); el resto del segmento se mueve a %s", path, offset, corrupt)
+
+    def _log(self, entry: list):
+        if self._file is None:
+            return
+        self._file.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._ops += 1
+        if self.compact_ops and self._ops >= self.compact_ops:
+            self.compact()
+
+    def compact(self, wait: bool = False):
+        """Escribe un snapshot del estado actual y borra los segmentos del log que cubre"""
+        if self._file is None or (self._compactor is not None and self._compactor.is_alive()):
+            return
+        self._file.close()
+        self._segment += 1
+        self._file = open(self._path(segment_name(self._segment)), "a", encoding="utf-8")
+        self._ops = 0
+        # Los registros no se modifican nunca: basta con copiar la lista y los ids de cada índice
+        records = list(self._tasks.values())
+        indexes = {field: {value: list(bucket) for value, bucket in values.items()} for field, values in self._indexes.items()}
+        header = {"segment": self._segment, "next_id": self._next_id}
+        self._compactor = threading.Thread(
+            target=self._write_snapshot, args=(header, records, indexes), name="task-store-snapshot", daemon=True
+        )
+        self._compactor.start()
+        if wait:
+            self._compactor.join()
+
+    def _write_snapshot(self, header: dict, records: List[TaskRecord], indexes: dict):
+        temporary = self._path(SNAPSHOT_FILE + ".tmp")
+        data = {
+            **header,
+            # Tuplas simples: al cargar se convierten en registros sin llamar a TaskRecord
+            "tasks": list(map(tuple, records)),
+            "indexes": {field: {value: sorted(ids) for value, ids in values.items()} for field, values in indexes.items()},
+        }
+        try:
+            with open(temporary, "wb") as snapshot:
+                # marshal es lo más rápido de la stdlib para tuplas de str/int y comparte
+                # las cadenas internadas; su formato (versión 4) es estable desde Python 3.4
+                snapshot.write(snapshot_header())
+                snapshot.write(marshal.dumps(data))
+                snapshot.flush()
+                os.fsync(snapshot.fileno())
+            os.replace(temporary, self._path(SNAPSHOT_FILE))
+            for name in os.listdir(self.directory):
+                segment = parse_segment(name)
+                if segment is not None and segment < header["segment"]:
+                    os.remove(self._path(name))
+        except OSError:
+            logger.exception("Error escribiendo el snapshot de tareas")
+
+    def close(self):
+        if self._compactor is not None:
+            self._compactor.join()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
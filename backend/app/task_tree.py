@@ -0,0 +1,122 @@
+import os
+from typing import Dict, List, Optional
+
+from sqlalchemy import case, exists, func, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from .enums import TaskStatus
+from .models import Task
+
+# Configuración
+TASK_TREE_DEFAULT_DEPTH = int(os.getenv("TASK_TREE_DEFAULT_DEPTH", 20))
+TASK_TREE_MAX_DEPTH = int(os.getenv("TASK_TREE_MAX_DEPTH", 100))
+
+def tree_query(roots, user_id: int, max_depth: int):
+    """Subárbol completo en una sola consulta, con acumulados por nodo calculados en SQL.
+
+    ``roots`` es una condición sobre ``Task`` que selecciona las raíces. El CTE
+    ``tree`` recorre los hijos hasta ``max_depth``; ``closure`` empareja cada
+    nodo con todos sus descendientes dentro del árbol para sumar horas y
+    contar tareas completadas por subárbol.
+    """
+    tree = (
+        select(Task.id, Task.parent_task_id, literal(0).label("depth"))
+        .where(roots, Task.user_id == user_id)
+        .cte("tree", recursive=True)
+    )
+    tree = tree.union_all(
+        select(Task.id, Task.parent_task_id, (tree.c.depth + 1).label("depth"))
+        .join(tree, Task.parent_task_id == tree.c.id)
+        .where(tree.c.depth < max_depth, Task.user_id == user_id)
+    )
+
+    closure = (
+        select(tree.c.id.label("ancestor_id"), tree.c.id.label("node_id"), literal(0).label("hops"))
+        .cte("closure", recursive=True)
+    )
+    closure = closure.union_all(
+        select(closure.c.ancestor_id, tree.c.id, (closure.c.hops + 1).label("hops"))
+        .join(closure, tree.c.parent_task_id == closure.c.node_id)
+        .where(closure.c.hops < max_depth)
+    )
+
+    node = aliased(Task)
+    rollup = (
+        select(
+            closure.c.ancestor_id,
+            func.count().label("subtree_tasks"),
+            func.sum(func.coalesce(node.estimated_hours, 0)).label("subtree_estimated_hours"),
+            func.sum(case((node.status == TaskStatus.DONE, 1), else_=0)).label("subtree_done"),
+        )
+        .join(node, node.id == closure.c.node_id)
+        .group_by(closure.c.ancestor_id)
+        .subquery("rollup")
+    )
+
+    child = aliased(Task)
+    truncated = case(
+        (tree.c.depth >= max_depth, exists().where(child.parent_task_id == tree.c.id)),
+        else_=False,
+    )
+    return (
+        select(
+            Task.id,
+            Task.title,
+            Task.status,
+            Task.priority,
+            Task.due_date,
+            Task.estimated_hours,
+            Task.completed_at,
+            Task.project_id,
+            tree.c.parent_task_id,
+            tree.c.depth,
+            rollup.c.subtree_tasks,
+            rollup.c.subtree_estimated_hours,
+            rollup.c.subtree_done,
+            truncated.label("truncated"),
+        )
+        .join(tree, tree.c.id == Task.id)
+        .join(rollup, rollup.c.ancestor_id == Task.id)
+        .order_by(tree.c.depth, Task.id)
+    )
+
+def ancestors_query(task_id: int):
+    """Ids de la cadena de padres de ``task_id`` (incluido); UNION corta ciclos ya existentes"""
+    chain = select(Task.id, Task.parent_task_id).where(Task.id == task_id).cte("ancestors", recursive=True)
+    chain = chain.union(
+        select(Task.id, Task.parent_task_id).join(chain, Task.id == chain.c.parent_task_id)
+    )
+    return select(chain.c.id)
+
+async def load_tree(db: AsyncSession, roots, user_id: int, max_depth: int) -> List[dict]:
+    """Ejecuta ``tree_query`` y monta los nodos anidados; devuelve las raíces"""
+    result = await db.execute(tree_query(roots, user_id, max_depth))
+    nodes: Dict[int, dict] = {}
+    top: List[dict] = []
+    for row in result:
+        done = row.subtree_done or 0
+        node = {
+            "id": row.id,
+            "title": row.title,
+            "status": row.status.value if row.status else None,
+            "priority": row.priority.value if row.priority else None,
+            "due_date": row.due_date.isoformat() if row.due_date else None,
+            "estimated_hours": row.estimated_hours,
+            "completed_at": row.completed_at.isoformat() if row.completed_at else None,
+            "project_id": row.project_id,
+            "parent_task_id": row.parent_task_id,
+            "depth": row.depth,
+            "subtree_tasks": row.subtree_tasks,
+            "subtree_estimated_hours": float(row.subtree_estimated_hours or 0),
+            "completion_pct": round(100 * done / row.subtree_tasks, 1),
+            "truncated": bool(row.truncated),
+            "children": [],
+        }
+        nodes[row.id] = node
+        parent: Optional[dict] = nodes.get(row.parent_task_id) if row.depth else None
+        if parent is None:
+            top.append(node)
+        else:
+            parent["children"].append(node)
+    return top
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import os
+from collections import Counter
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import bindparam, insert, update
+
+from .database import AsyncSessionLocal
+from .models import APIRequest, User
+from .resource_versions import ACCOUNT, resource_versions
+from .user_cache import user_cache
+
+logger = logging.getLogger(__name__)
+
+# Configuración
+USAGE_BATCH_SIZE = int(os.getenv("USAGE_BATCH_SIZE", 200))
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", 2.0))
+USAGE_MAX_BUFFER = int(os.getenv("USAGE_MAX_BUFFER", 50000))
+USAGE_CREDITS_PER_REQUEST = int(os.getenv("USAGE_CREDITS_PER_REQUEST", 1))
+
+users_table = User.__table__
+
+class UsageRecorder:
+    """Acumula los registros de uso de la API y los escribe por lotes.
+
+    ``record`` solo añade el evento a un buffer en memoria. Un flusher en segundo
+    plano escribe el lote cuando alcanza ``batch_size`` o cada ``flush_interval``
+    segundos, con su propia sesión: un único INSERT multi-fila en ``api_requests``
+    y el descuento de créditos agregado por usuario en la misma transacción.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        batch_size: int = USAGE_BATCH_SIZE,
+        flush_interval: float = USAGE_FLUSH_INTERVAL,
+        max_buffer: int = USAGE_MAX_BUFFER,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer: List[dict] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.dropped = 0
+
+    def record(
+        self,
+        user_id: int,
+        model: str,
+        tokens: int,
+        endpoint: str = "/chat",
+        method: str = "POST",
+        status_code: int = 200,
+        credits: int = USAGE_CREDITS_PER_REQUEST,
+    ):
+        """Encola un evento de uso sin bloquear"""
+        if len(self._buffer) >= self.max_buffer:
+            self.dropped += 1
+            logger.error("Buffer de uso lleno, se descarta un registro de %s", user_id)
+            return
+        self._buffer.append({
+            "user_id": user_id,
+            "model": model,
+            "tokens_used": tokens,
+            "endpoint": endpoint,
+            "method": method,
+            "status_code": status_code,
+            "timestamp": datetime.utcnow(),
+            "credits": credits,
+        })
+        if len(self._buffer) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="usage-recorder")
+
+    async def stop(self):
+        """Detiene el flusher y escribe todo lo pendiente"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            self._wakeup = None
+        while self._buffer:
+            if not await self.flush():
+                break
+
+    async def flush(self) -> bool:
+        """Escribe un lote; devuelve False si la escritura falló"""
+        async with self._lock:
+            if not self._buffer:
+                return True
+            batch = self._buffer[:self.batch_size]
+            del self._buffer[:self.batch_size]
+            try:
+                await self._write(batch)
+            except Exception:
+                logger.exception("Error escribiendo %s registros de uso; se reintentará", len(batch))
+                self._buffer[:0] = batch
+                return False
+            return True
+
+    async def _write(self, batch: List[dict]):
+        spent = Counter()
+        for event in batch:
+            spent[event["user_id"]] += event["credits"]
+        rows = [{k: v for k, v in event.items() if k != "credits"} for event in batch]
+
+        async with self.session_factory() as db:
+            await db.execute(insert(APIRequest).values(rows))
+            charges = [{"uid": user_id, "spent": amount} for user_id, amount in spent.items() if amount]
+            if charges:
+                await db.execute(
+                    update(users_table)
+                    .where(users_table.c.id == bindparam("uid"))
+                    .values(credits=users_table.c.credits - bindparam("spent")),
+                    charges
+                )
+            await db.commit()
+
+        # Los créditos cacheados en get_current_user ya no son válidos
+        for user_id in spent:
+            await user_cache.invalidate(user_id=user_id)
+        charged = [charge["uid"] for charge in charges]
+        if charged:
+            await resource_versions.bump(ACCOUNT, *charged)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self._buffer:
+                if not await self.flush():
+                    break
+
+usage_recorder = UsageRecorder()
@@ -0,0 +1,154 @@
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional
+
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+# Configuración
+USER_CACHE_ENABLED = os.getenv("USER_CACHE_ENABLED", "1") == "1"
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 30))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", 10000))
+USER_CACHE_REDIS = os.getenv("USER_CACHE_REDIS", "0") == "1"
+
+# Solo lo que leen get_current_user y sus llamadores: ni ``hashed_password`` ni
+# ``api_key`` entran en la caché (ni, por tanto, en Redis); quien los verifica
+# los lee de la base de datos
+USER_COLUMNS = ("id", "email", "is_active", "subscription_id", "credits", "created_at", "updated_at")
+DATETIME_COLUMNS = {key for key in USER_COLUMNS if User.__table__.columns[key].type.python_type is datetime}
+
+class UserCache:
+    """Caché de usuarios autenticados por subject del JWT (el email).
+
+    Guarda una instantánea de ``USER_COLUMNS`` con un TTL corto y devuelve
+    instancias transitorias (no ligadas a ninguna sesión): sirven para leer
+    ``id``, ``credits``, etc., pero no para modificar el usuario ni para
+    comprobar credenciales (no llevan secretos). Los cambios de
+    créditos, suscripción o ``is_active`` deben llamar a ``invalidate``.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = USER_CACHE_ENABLED,
+        ttl: float = USER_CACHE_TTL,
+        max_entries: int = USER_CACHE_MAX_ENTRIES,
+        prefix: str = "user_cache:",
+    ):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.prefix = prefix
+        self.redis = None
+        self._entries: OrderedDict = OrderedDict()
+        self._subjects: Dict[int, str] = {}
+        self.counters = {"hits": 0, "redis_hits": 0, "misses": 0, "invalidations": 0}
+
+    def attach_redis(self, client):
+        """Activa el nivel Redis reutilizando un cliente ``redis.asyncio`` existente"""
+        self.redis = client
+
+    async def get(self, subject: str) -> Optional[User]:
+        if not self.enabled:
+            return None
+
+        entry = self._entries.get(subject)
+        if entry is not None:
+            expires_at, data = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(subject)
+                self.counters["hits"] += 1
+                return User(**data)
+            self._forget(subject)
+
+        if self.redis is not None:
+            try:
+                raw = await self.redis.get(self.prefix + subject)
+            except Exception as e:
+                logger.warning("Error leyendo la caché de usuarios en Redis: %s", e)
+                raw = None
+            if raw is not None:
+                data = self._decode(raw)
+                self._store(subject, data)
+                self.counters["redis_hits"] += 1
+                return User(**data)
+
+        self.counters["misses"] += 1
+        return None
+
+    async def set(self, subject: str, user: User):
+        if not self.enabled:
+            return
+        data = {key: getattr(user, key) for key in USER_COLUMNS}
+        self._store(subject, data)
+        if self.redis is not None:
+            try:
+                ttl = max(1, int(self.ttl))
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    pipe.set(self.prefix + subject, self._encode(data), ex=ttl)
+                    pipe.set(f"{self.prefix}id:{user.id}", subject, ex=ttl)
+                    await pipe.execute()
+            except Exception as e:
+                logger.warning("Error escribiendo la caché de usuarios en Redis: %s", e)
+
+    async def invalidate(self, subject: Optional[str] = None, user_id: Optional[int] = None):
+        """Descarta un usuario por subject o por id"""
+        if subject is None and user_id is not None:
+            subject = self._subjects.get(user_id)
+            if subject is None and self.redis is not None:
+                try:
+                    subject = await self.redis.get(f"{self.prefix}id:{user_id}")
+                except Exception as e:
+                    logger.warning("Error leyendo la caché de usuarios en Redis: %s", e)
+        if subject is None:
+            return
+        self.counters["invalidations"] += 1
+        self._forget(subject)
+        if self.redis is not None:
+            keys = [self.prefix + subject]
+            if user_id is not None:
+                keys.append(f"{self.prefix}id:{user_id}")
+            try:
+                await self.redis.delete(*keys)
+            except Exception as e:
+                logger.warning("Error invalidando la caché de usuarios en Redis: %s", e)
+
+    def clear(self):
+        self._entries.clear()
+        self._subjects.clear()
+
+    def stats(self) -> dict:
+        return {**self.counters, "entries": len(self._entries)}
+
+    def _store(self, subject: str, data: dict):
+        self._forget(subject)
+        self._entries[subject] = (time.monotonic() + self.ttl, data)
+        self._subjects[data["id"]] = subject
+        while len(self._entries) > self.max_entries:
+            self._forget(next(iter(self._entries)))
+
+    def _forget(self, subject: str):
+        entry = self._entries.pop(subject, None)
+        if entry is not None:
+            self._subjects.pop(entry[1]["id"], None)
+
+    @staticmethod
+    def _encode(data: dict) -> str:
+        return json.dumps({
+            key: value.isoformat() if isinstance(value, datetime) else value
+            for key, value in data.items()
+        })
+
+    @staticmethod
+    def _decode(raw: str) -> dict:
+        data = {key: value for key, value in json.loads(raw).items() if key in USER_COLUMNS}
+        for key in DATETIME_COLUMNS:
+            if data.get(key):
+                data[key] = datetime.fromisoformat(data[key])
+        return data
+
+user_cache = UserCache()
@@ -0,0 +1,71 @@
+"""Benchmark del coste de ``get_current_user`` por petición, con y sin caché de usuarios.
+
+Crea un SQLite temporal con un usuario, genera un JWT y resuelve la dependencia
+``get_current_user`` N veces (una sesión por iteración, como en una petición),
+contando consultas SQL y tiempo medio por llamada.
+
+Uso (desde ``backend/``)::
+
+    python -m benchmarks.auth_overhead --iterations 5000
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # La URL debe fijarse antes de importar app.database
+        os.environ["SQLALCHEMY_DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'auth.db')}"
+        os.environ.pop("ASYNC_DATABASE_URL", None)
+
+        from sqlalchemy import event
+        from app.auth import create_access_token, get_current_user
+        from app.database import AsyncSessionLocal, Base, SessionLocal, async_engine, engine
+        from app.models import User
+        from app.user_cache import user_cache
+
+        Base.metadata.create_all(engine)
+        with SessionLocal() as db:
+            db.add(User(email="bench@example.com", hashed_password="x", api_key="bench"))
+            db.commit()
+        token = create_access_token(data={"sub": "bench@example.com"})
+
+        queries = 0
+
+        @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+        def count_query(*_):
+            nonlocal queries
+            queries += 1
+
+        async def run(enabled: bool) -> dict:
+            nonlocal queries
+            user_cache.enabled = enabled
+            user_cache.clear()
+            queries = 0
+            start = time.perf_counter()
+            for _ in range(args.iterations):
+                async with AsyncSessionLocal() as db:
+                    await get_current_user(token=token, db=db)
+            elapsed = time.perf_counter() - start
+            return {
+                "iterations": args.iterations,
+                "us_per_request": round(elapsed / args.iterations * 1e6, 1),
+                "queries_per_request": round(queries / args.iterations, 3),
+            }
+
+        async def both():
+            results = {"without_cache": await run(False), "with_cache": await run(True)}
+            await async_engine.dispose()
+            return results
+
+        print(json.dumps(asyncio.run(both()), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Benchmark de importación y exportación masiva de tareas.
+
+Compara ``POST /api/tasks`` fila a fila (un commit por tarea) con
+``POST /api/tasks:bulk`` en NDJSON, y mide ``GET /api/tasks:export`` sobre el
+resultado. La app se ejecuta en proceso sobre un SQLite temporal.
+
+Uso (desde ``backend/``)::
+
+    python -m benchmarks.bulk_import --rows 20000 --single-rows 500
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--single-rows", type=int, default=500, help="filas para la ruta de una en una")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # La configuración debe fijarse antes de importar la app
+        os.environ["SQLALCHEMY_DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bulk.db')}"
+        os.environ.pop("ASYNC_DATABASE_URL", None)
+        os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+
+        import httpx
+        from app import main as app_main
+        from app.database import Base, async_engine, engine
+
+        Base.metadata.create_all(engine)
+
+        def ndjson(rows: int) -> bytes:
+            lines = []
+            for i in range(rows):
+                row = {"ref": f"t{i}", "title": f"Tarea {i}", "description": "importada", "priority": "HIGH"}
+                if i % 10:
+                    row["parent_ref"] = f"t{i - i % 10}"
+                lines.append(json.dumps(row))
+            return "\n".join(lines).encode()
+
+        async def run() -> dict:
+            transport = httpx.ASGITransport(app=app_main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+                response = await client.post("/register", json={"email": "bulk@example.com", "password": "bulk"})
+                headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+                start = time.perf_counter()
+                for i in range(args.single_rows):
+                    await client.post("/api/tasks", json={"title": f"Tarea {i}"}, headers=headers)
+                single = time.perf_counter() - start
+
+                body = ndjson(args.rows)
+                start = time.perf_counter()
+                response = await client.post(
+                    "/api/tasks:bulk",
+                    content=body,
+                    headers={**headers, "Content-Type": "application/x-ndjson"}
+                )
+                bulk = time.perf_counter() - start
+                report = response.json()
+
+                start = time.perf_counter()
+                exported = 0
+                async with client.stream("GET", "/api/tasks:export", headers=headers) as response:
+                    async for _ in response.aiter_lines():
+                        exported += 1
+                export = time.perf_counter() - start
+
+            await async_engine.dispose()
+            return {
+                "single_rows_per_s": round(args.single_rows / single),
+                "bulk_rows_per_s": round(report["inserted"] / bulk),
+                "bulk_inserted": report["inserted"],
+                "bulk_failed": report["failed"],
+                "bulk_chunks": report["chunks"],
+                "export_rows_per_s": round(exported / export),
+                "exported": exported,
+            }
+
+        print(json.dumps(asyncio.run(run()), indent=2))
+
+if __name__ == "__main__":
+    main()
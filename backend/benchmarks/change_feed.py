@@ -0,0 +1,197 @@
+"""Prueba de carga del feed de cambios: miles de suscriptores SSE inactivos.
+
+Arranca ``uvicorn app.main:app`` en un subproceso sobre un SQLite temporal
+(migrado con Alembic), registra ``--users`` usuarios y abre ``--subscribers``
+conexiones a ``GET /api/tasks:changes`` repartidas entre ellos. Mide la
+memoria residente del servidor antes y después (memoria por conexión) y,
+con todas abiertas, la latencia de entrega de un cambio por usuario a todas
+sus conexiones.
+
+Por defecto usa el backend en memoria; con ``--redis`` usa el Redis de
+``REDIS_HOST``/``REDIS_PORT`` (streams + pub/sub, como en producción).
+
+Uso (desde ``backend/``)::
+
+    python -m benchmarks.change_feed --subscribers 5000 --users 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+METRICS_TOKEN = "benchmark"
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def rss_kb(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+class Subscriber:
+    """Conexión SSE cruda (sin cliente HTTP) para que el coste del lado cliente sea mínimo"""
+
+    def __init__(self, port: int, token: str):
+        self.port = port
+        self.token = token
+        self.received = {}
+        self.connected = asyncio.Event()
+
+    async def run(self):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        writer.write(
+            "GET /api/tasks:changes HTTP/1.1\r\n"
+            "Host: bench\r\n"
+            f"Authorization: Bearer {self.token}\r\n"
+            "Accept: text/event-stream\r\n\r\n".encode()
+        )
+        await writer.drain()
+        status = await reader.readline()
+        if b" 200 " not in status:
+            raise RuntimeError(status.decode().strip())
+        self.connected.set()
+        try:
+            # Cuerpo con transfer-encoding chunked: basta con buscar las líneas "data:"
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                if line.startswith(b"data: "):
+                    event = json.loads(line[6:])
+                    task = event.get("task") or {}
+                    if task.get("title", "").startswith("bench "):
+                        self.received[task["title"]] = time.perf_counter()
+        finally:
+            writer.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--subscribers", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--port", type=int, default=8123)
+    parser.add_argument("--redis", action="store_true", help="usar Redis en lugar del backend en memoria")
+    args = parser.parse_args()
+
+    backend = os.path.join(os.path.dirname(__file__), "..")
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'feed.db')}"
+        env = {
+            **os.environ,
+            "SQLALCHEMY_DATABASE_URL": url,
+            "RATE_LIMIT_BACKEND": "memory",
+            "RATE_LIMIT_DEFAULT": str(10 ** 9),
+            "CHANGE_FEED_BACKEND": "redis" if args.redis else "memory",
+            "CHANGE_FEED_MAX_PER_USER": str(args.subscribers),
+            "BCRYPT_ROUNDS": "4",
+            "COMPLETION_CACHE_ENABLED": "0",
+            "METRICS_TOKEN": METRICS_TOKEN,
+            "OPENROUTER_API_KEY": os.environ.get("OPENROUTER_API_KEY", "benchmark"),
+            # Sin proveedor LLM accesible: las sugerencias en segundo plano fallan rápido
+            "BASE_URL": "http://127.0.0.1:9/api/v1",
+            "LLM_MAX_RETRIES": "0",
+        }
+        env.pop("ASYNC_DATABASE_URL", None)
+        subprocess.run(
+            [sys.executable, "-m", "alembic", "-x", f"url={url}", "upgrade", "head"],
+            cwd=backend, env=env, check=True, capture_output=True
+        )
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port), "--log-level", "warning"],
+            cwd=backend, env=env
+        )
+        try:
+            print(json.dumps(asyncio.run(run(args, server.pid)), indent=2))
+        finally:
+            server.terminate()
+            server.wait()
+
+async def run(args, pid: int) -> dict:
+    import httpx
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=30) as client:
+        stats_headers = {"Authorization": f"Bearer {METRICS_TOKEN}"}
+        for _ in range(100):
+            try:
+                await client.get("/changes/stats", headers=stats_headers)
+                break
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+
+        tokens = []
+        for i in range(args.users):
+            response = await client.post("/register", json={"email": f"feed{i}@example.com", "password": "feed"})
+            tokens.append(response.json()["access_token"])
+
+        # Una conexión y un cambio de calentamiento para cargar todo el código implicado
+        warmup = Subscriber(args.port, tokens[0])
+        warmup_task = asyncio.create_task(warmup.run())
+        await warmup.connected.wait()
+        headers = {"Authorization": f"Bearer {tokens[0]}"}
+        await client.post("/api/tasks", json={"title": "warmup"}, headers=headers)
+        await asyncio.sleep(0.5)
+        warmup_task.cancel()
+        await asyncio.sleep(0.5)
+        baseline = rss_kb(pid)
+
+        subscribers = [Subscriber(args.port, tokens[i % args.users]) for i in range(args.subscribers)]
+        start = time.perf_counter()
+        tasks = []
+        for offset in range(0, len(subscribers), 200):
+            batch = subscribers[offset:offset + 200]
+            tasks += [asyncio.create_task(subscriber.run()) for subscriber in batch]
+            await asyncio.gather(*(subscriber.connected.wait() for subscriber in batch))
+        connect_s = time.perf_counter() - start
+        while (await client.get("/changes/stats", headers=stats_headers)).json()["subscribers"] < args.subscribers:
+            await asyncio.sleep(0.1)
+        await asyncio.sleep(1)
+        loaded = rss_kb(pid)
+
+        # Un cambio por usuario; cada una de sus conexiones debe recibirlo
+        sent = {}
+        for i, token in enumerate(tokens):
+            title = f"bench {i}"
+            sent[title] = time.perf_counter()
+            await client.post("/api/tasks", json={"title": title}, headers={"Authorization": f"Bearer {token}"})
+        deadline = time.perf_counter() + 10
+        while time.perf_counter() < deadline:
+            if all(len(subscriber.received) == 1 for subscriber in subscribers):
+                break
+            await asyncio.sleep(0.05)
+        latencies = [
+            (received - sent[title]) * 1000
+            for subscriber in subscribers
+            for title, received in subscriber.received.items()
+        ]
+        stats = (await client.get("/changes/stats", headers=stats_headers)).json()
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    return {
+        "backend": stats["backend"],
+        "subscribers": args.subscribers,
+        "users": args.users,
+        "connect_s": round(connect_s, 2),
+        "rss_baseline_mb": round(baseline / 1024, 1),
+        "rss_loaded_mb": round(loaded / 1024, 1),
+        "kb_per_subscriber": round((loaded - baseline) / args.subscribers, 1),
+        "delivered": len(latencies),
+        "missing": args.subscribers - len(latencies),
+        "delivery_p50_ms": round(statistics.median(latencies), 1) if latencies else None,
+        "delivery_p99_ms": round(percentile(latencies, 99), 1) if latencies else None,
+        "delivery_max_ms": round(max(latencies), 1) if latencies else None,
+        "overflows": stats["overflows"],
+    }
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Benchmark de throughput concurrente: Session síncrona vs AsyncSession.
+
+Levanta dos apps FastAPI mínimas sobre el mismo archivo SQLite: una con el patrón
+anterior (endpoints ``async def`` usando ``Session`` síncrona, que bloquea el event
+loop) y otra con ``AsyncSession`` + aiosqlite, y lanza la misma mezcla de lecturas
+y escrituras de tareas con concurrencia configurable.
+
+Con SQLite local cada consulta tarda microsegundos y el salto al hilo de aiosqlite
+puede costar más de lo que bloquea; la ventaja del modo asíncrono aparece cuando
+la base de datos está en red (Postgres) y cada consulta espera I/O. Apunta
+``--sync-url``/``--async-url`` a una base Postgres para medir ese caso.
+
+Uso (desde ``backend/``)::
+
+    python -m benchmarks.db_concurrency --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import httpx
+from fastapi import Depends, FastAPI, HTTPException
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.database import Base, to_async_url
+from app.models import Task, User
+
+def build_sync_app(url: str, pool_size: int) -> FastAPI:
+    # Con menos conexiones que peticiones concurrentes el patrón síncrono se
+    # bloquea: el checkout del pool detiene el event loop que debería liberarlas
+    options = {"connect_args": {"check_same_thread": False}} if url.startswith("sqlite") else {}
+    engine = create_engine(url, pool_size=pool_size, **options)
+    SessionLocal = sessionmaker(bind=engine, autoflush=False)
+
+    def get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+
+    @app.get("/tasks/{task_id}")
+    async def get_task(task_id: int, db: Session = Depends(get_db)):
+        task = db.query(Task).filter(Task.id == task_id).first()
+        if not task:
+            raise HTTPException(status_code=404)
+        return {"id": task.id, "title": task.title}
+
+    @app.post("/tasks")
+    async def create_task(db: Session = Depends(get_db)):
+        task = Task(title="bench", user_id=1)
+        db.add(task)
+        db.commit()
+        return {"id": task.id}
+
+    return app
+
+def build_async_app(url: str, pool_size: int) -> FastAPI:
+    # aiosqlite usa NullPool sobre archivos; pool_size solo aplica a otros drivers
+    options = {} if url.startswith("sqlite") else {"pool_size": pool_size}
+    engine = create_async_engine(url, **options)
+    SessionLocal = async_sessionmaker(bind=engine, expire_on_commit=False)
+
+    async def get_db():
+        async with SessionLocal() as db:
+            yield db
+
+    app = FastAPI()
+
+    @app.get("/tasks/{task_id}")
+    async def get_task(task_id: int, db: AsyncSession = Depends(get_db)):
+        result = await db.execute(select(Task).where(Task.id == task_id))
+        task = result.scalar_one_or_none()
+        if not task:
+            raise HTTPException(status_code=404)
+        return {"id": task.id, "title": task.title}
+
+    @app.post("/tasks")
+    async def create_task(db: AsyncSession = Depends(get_db)):
+        task = Task(title="bench", user_id=1)
+        db.add(task)
+        await db.commit()
+        return {"id": task.id}
+
+    return app
+
+def seed(url: str, tasks: int):
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        db.add(User(id=1, email="bench@example.com", hashed_password="x", api_key="bench"))
+        db.add_all(Task(title=f"task {i}", user_id=1) for i in range(tasks))
+        db.commit()
+    engine.dispose()
+
+async def drive(app: FastAPI, requests: int, concurrency: int, seeded: int, write_ratio: float) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(i: int):
+            async with semaphore:
+                start = time.perf_counter()
+                if (i % 100) < write_ratio * 100:
+                    response = await client.post("/tasks")
+                else:
+                    response = await client.get(f"/tasks/{i % seeded + 1}")
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--seed-tasks", type=int, default=1000)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--sync-url", help="URL síncrona (por defecto un SQLite temporal)")
+    parser.add_argument("--async-url", help="URL asíncrona equivalente a --sync-url")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        sync_url = args.sync_url or f"sqlite:///{path}"
+        async_url = args.async_url or to_async_url(sync_url)
+        seed(sync_url, args.seed_tasks)
+        results = {}
+        for mode, builder, url in (
+            ("sync_session", build_sync_app, sync_url),
+            ("async_session", build_async_app, async_url),
+        ):
+            app = builder(url, args.concurrency)
+            results[mode] = asyncio.run(
+                drive(app, args.requests, args.concurrency, args.seed_tasks, args.write_ratio)
+            )
+        print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
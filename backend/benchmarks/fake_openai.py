@@ -0,0 +1,187 @@
+"""Servidor falso compatible con la API de OpenAI para probar ``app.llm_gateway``.
+
+Implementa ``POST /v1/chat/completions`` (con y sin ``stream``) con latencia,
+tiempo hasta el primer token y ritmo de tokens configurables. Los proveedores
+de ``--fail-providers`` responden 503, y los de ``--slow-providers`` tardan
+``--slow-delay`` segundos; así se puede ejercitar el failover, el circuit
+breaker y el hedging sin tocar OpenRouter.
+
+Uso (desde ``backend/``)::
+
+    # Servidor real para la app: BASE_URL=http://127.0.0.1:8089/v1
+    python -m benchmarks.fake_openai serve --port 8089 --ttft 0.2 --tokens 50
+
+    # Comprobaciones del gateway en proceso
+    python -m benchmarks.fake_openai check
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Iterable
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+def create_app(
+    ttft: float = 0.05,
+    token_delay: float = 0.005,
+    tokens: int = 20,
+    fail_providers: Iterable[str] = (),
+    slow_providers: Iterable[str] = (),
+    slow_delay: float = 1.0,
+) -> FastAPI:
+    app = FastAPI(title="Fake OpenAI")
+    app.state.fail_providers = set(fail_providers)
+    app.state.slow_providers = set(slow_providers)
+    app.state.calls = []
+
+    def chunk(completion_id: str, model: str, delta: dict, finish_reason=None) -> str:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(payload)}\n\n"
+
+    @app.post("/v1/chat/completions")
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "fake")
+        provider = ((body.get("provider") or {}).get("order") or [None])[0]
+        app.state.calls.append(provider)
+
+        if provider in app.state.slow_providers:
+            await asyncio.sleep(slow_delay)
+        if provider in app.state.fail_providers:
+            return JSONResponse({"error": {"message": f"{provider} unavailable"}}, status_code=503)
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        words = [f"token{i} " for i in range(tokens)]
+
+        if not body.get("stream"):
+            await asyncio.sleep(ttft + token_delay * tokens)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(words)},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 10, "completion_tokens": tokens, "total_tokens": 10 + tokens},
+            }
+
+        async def events():
+            await asyncio.sleep(ttft)
+            for word in words:
+                yield chunk(completion_id, model, {"content": word})
+                await asyncio.sleep(token_delay)
+            yield chunk(completion_id, model, {}, "stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+def make_gateway(app: FastAPI, **kwargs):
+    """LLMGateway que habla con ``app`` en proceso, sin red"""
+    import httpx
+    from app.llm_gateway import LLMGateway
+
+    return LLMGateway(
+        api_key="fake",
+        base_url="http://fake-openai/v1",
+        transport=httpx.ASGITransport(app=app),
+        **kwargs
+    )
+
+async def check() -> dict:
+    """Escenarios básicos del gateway contra el servidor falso"""
+    from app.llm_gateway import LLMUnavailableError
+
+    messages = [{"role": "user", "content": "hola"}]
+    results = {}
+
+    # Failover: el primer proveedor falla y responde el segundo
+    app = create_app(fail_providers=["Groq"])
+    gateway = make_gateway(app, provider_order=["Groq", "Fireworks"], retry_backoff=0.01)
+    response = await gateway.chat_completion(model="fake", messages=messages)
+    results["failover"] = {"calls": list(app.state.calls), "ok": bool(response.choices[0].message.content)}
+
+    # Circuit breaker: tras varios fallos ya no se llama a Groq
+    for _ in range(6):
+        await gateway.chat_completion(model="fake", messages=messages)
+    app.state.calls.clear()
+    await gateway.chat_completion(model="fake", messages=messages)
+    results["breaker"] = {"calls_after_open": app.state.calls, "breakers": gateway.stats()["breakers"]}
+    await gateway.aclose()
+
+    # Todos los proveedores caídos: error explícito
+    app = create_app(fail_providers=["Groq", "Fireworks"])
+    gateway = make_gateway(app, provider_order=["Groq", "Fireworks"], retry_backoff=0.01)
+    try:
+        await gateway.chat_completion(model="fake", messages=messages)
+        results["all_down"] = "no error"
+    except LLMUnavailableError as e:
+        results["all_down"] = f"LLMUnavailableError: {e}"
+    await gateway.aclose()
+
+    # Hedging: el primer proveedor es lento y gana el segundo
+    app = create_app(slow_providers=["Groq"], slow_delay=1.0)
+    gateway = make_gateway(app, provider_order=["Groq", "Fireworks"], hedge_delay=0.1)
+    start = time.perf_counter()
+    stream = await gateway.chat_completion(model="fake", messages=messages, stream=True)
+    text = "".join([c.choices[0].delta.content or "" async for c in stream])
+    results["hedge"] = {
+        "elapsed_s": round(time.perf_counter() - start, 3),
+        "hedges": gateway.stats()["hedges"],
+        "in_flight": gateway.stats()["in_flight"],
+        "tokens": len(text.split()),
+    }
+    await gateway.aclose()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["serve", "check"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--ttft", type=float, default=0.05, help="segundos hasta el primer token")
+    parser.add_argument("--token-delay", type=float, default=0.005)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--fail-providers", default="", help="lista separada por comas")
+    parser.add_argument("--slow-providers", default="", help="lista separada por comas")
+    parser.add_argument("--slow-delay", type=float, default=1.0)
+    args = parser.parse_args()
+
+    if args.command == "check":
+        # El gateway global de app.llm_gateway exige una API key al importarse
+        os.environ.setdefault("OPENROUTER_API_KEY", "fake")
+        print(json.dumps(asyncio.run(check()), indent=2))
+        return
+
+    import uvicorn
+    uvicorn.run(
+        create_app(
+            ttft=args.ttft,
+            token_delay=args.token_delay,
+            tokens=args.tokens,
+            fail_providers=[p for p in args.fail_providers.split(",") if p],
+            slow_providers=[p for p in args.slow_providers.split(",") if p],
+            slow_delay=args.slow_delay,
+        ),
+        host=args.host,
+        port=args.port,
+        log_level="warning",
+    )
+
+if __name__ == "__main__":
+    main()
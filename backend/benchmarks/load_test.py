@@ -0,0 +1,624 @@
+"""Prueba de carga reproducible de ``app.main:app`` con dependencias falsas en local.
+
+Arranca la aplicación completa (workers en segundo plano incluidos) sobre un
+SQLite temporal con ``alembic upgrade head``, servida por uvicorn en un puerto
+local para que los clientes la midan por HTTP real (con ``httpx.ASGITransport``
+la respuesta llega entera y el primer byte del streaming sería la latencia
+total), y sustituye lo externo:
+
+- LLM: ``benchmarks.fake_openai`` servido por uvicorn en un puerto local, con
+  ``--ttft`` y ``--tokens-per-sec`` configurables; la app llega a él por HTTP
+  igual que a OpenRouter (``BASE_URL``). ``--llm-url`` usa uno ya arrancado.
+- Redis: ``--redis fake`` conecta el pool de ``app.redis_pool`` a un servidor
+  ``fakeredis`` en proceso (rate limiting, change feed y cachés por Redis,
+  scripts Lua incluidos); ``--redis memory`` usa los backends en memoria.
+- Stripe: ``stripe.checkout.Session.create`` devuelve una sesión falsa y los
+  webhooks se firman con un secreto de prueba.
+
+Registra ``--users`` usuarios con ``--tasks-per-user`` tareas y una sesión de
+chat cada uno, calienta ``--warmup`` segundos y lanza ``--concurrency``
+clientes que eligen operaciones según ``--mix`` durante ``--duration``
+segundos (o hasta ``--requests`` peticiones). Cada cliente usa su propia
+semilla, así que la secuencia de operaciones es la misma entre ejecuciones.
+
+El informe JSON da, por operación, throughput y latencias p50/p95/p99 (y el
+primer byte en las de streaming), y por ruta las consultas SQL y el tiempo en
+base de datos por petición, tomados de las métricas de la propia app. Con
+``--compare`` se contrasta con un informe anterior y el proceso termina con
+código 1 si alguna operación empeora más de ``--threshold``.
+
+Uso (desde ``backend/``)::
+
+    python -m benchmarks.load_test --concurrency 50 --duration 30 --output base.json
+    # ... cambios ...
+    python -m benchmarks.load_test --concurrency 50 --duration 30 --compare base.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Optional
+
+SECRET = "whsec_benchmark"
+PLAN = "price_benchmark"
+PASSWORD = "benchmark-password"
+
+# Operación -> (método, plantilla de ruta, peso por defecto)
+OPERATIONS = {
+    "login": ("POST", "/token", 2),
+    "me": ("GET", "/me", 5),
+    "list_tasks": ("GET", "/api/tasks", 25),
+    "poll_tasks": ("GET", "/api/tasks", 10),
+    "get_task": ("GET", "/api/tasks/{task_id}", 15),
+    "create_task": ("POST", "/api/tasks", 8),
+    "update_task": ("PUT", "/api/tasks/{task_id}", 8),
+    "search_tasks": ("GET", "/api/tasks:search", 5),
+    "task_stats": ("GET", "/api/stats", 5),
+    "chat": ("POST", "/chat", 5),
+    "chat_stream": ("POST", "/chat", 5),
+    "chat_session": ("POST", "/chat/sessions/{session_id}/messages", 5),
+    "checkout": ("POST", "/create-checkout-session", 2),
+    "webhook": ("POST", "/webhook", 3),
+}
+STREAMED = {"chat_stream"}
+WORDS = ("informe", "reunión", "cliente", "revisar", "preparar", "presupuesto", "diseño", "migrar", "factura")
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def parse_mix(text: str) -> dict:
+    """``"list_tasks=5,chat=1"`` -> pesos; vacío: los pesos por defecto"""
+    if not text:
+        return {name: weight for name, (_, _, weight) in OPERATIONS.items()}
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise SystemExit(f"Operación desconocida en --mix: {name} (disponibles: {', '.join(OPERATIONS)})")
+        mix[name] = float(weight or 1)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+def git_revision() -> dict:
+    here = os.path.dirname(__file__)
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=here, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=here,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+    return {"commit": commit, "dirty": dirty}
+
+class FakeLLMServer:
+    """``fake_openai`` servido por uvicorn en un hilo, en un puerto libre de 127.0.0.1"""
+
+    def __init__(self, ttft: float, tokens_per_sec: float, tokens: int):
+        import uvicorn
+        from benchmarks.fake_openai import create_app
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.bind(("127.0.0.1", 0))
+        self.url = f"http://127.0.0.1:{self.socket.getsockname()[1]}/v1"
+        app = create_app(ttft=ttft, token_delay=1 / tokens_per_sec if tokens_per_sec > 0 else 0, tokens=tokens)
+        self.server = uvicorn.Server(uvicorn.Config(app, log_level="warning", lifespan="off"))
+        self.thread = threading.Thread(target=self.server.run, kwargs={"sockets": [self.socket]}, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        deadline = time.monotonic() + 10
+        while not self.server.started:
+            if time.monotonic() > deadline or not self.thread.is_alive():
+                raise RuntimeError("No arrancó el servidor LLM falso")
+            time.sleep(0.01)
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+class AppServer:
+    """``app.main:app`` servido por uvicorn en el event loop actual, en un puerto libre de 127.0.0.1"""
+
+    def __init__(self, app):
+        import uvicorn
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.bind(("127.0.0.1", 0))
+        self.url = f"http://127.0.0.1:{self.socket.getsockname()[1]}"
+        # lifespan="on": el arranque y la parada de la app lanzan y detienen los workers en segundo plano
+        self.server = uvicorn.Server(uvicorn.Config(app, log_level="warning", access_log=False, lifespan="on"))
+        self.task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self.task = asyncio.create_task(self.server.serve(sockets=[self.socket]))
+        deadline = time.monotonic() + 10
+        while not self.server.started:
+            if self.task.done() or time.monotonic() > deadline:
+                raise RuntimeError("No arrancó la aplicación")
+            await asyncio.sleep(0.01)
+
+    async def stop(self):
+        self.server.should_exit = True
+        await self.task
+
+def configure_environment(args, tmp: str, llm_url: str):
+    """La configuración de la app se lee al importarla: debe fijarse antes"""
+    redis_backend = "redis" if args.redis == "fake" else "memory"
+    os.environ.update({
+        "SQLALCHEMY_DATABASE_URL": args.database_url or f"sqlite:///{os.path.join(tmp, 'load.db')}",
+        "BASE_URL": llm_url,
+        "OPENROUTER_API_KEY": "benchmark",
+        "STRIPE_SECRET_KEY": "sk_test_benchmark",
+        "STRIPE_WEBHOOK_SECRET": SECRET,
+        "STRIPE_PLAN_CREDITS": f"{PLAN}:1000000000",
+        "RATE_LIMIT_BACKEND": redis_backend,
+        "RATE_LIMIT_DEFAULT": str(args.rate_limit),
+        "CHANGE_FEED_BACKEND": redis_backend,
+        "RESOURCE_VERSION_BACKEND": redis_backend,
+        "COMPLETION_CACHE_REDIS": "1" if args.redis == "fake" else "0",
+        "USER_CACHE_REDIS": "1" if args.redis == "fake" else "0",
+        "METRICS_ENABLED": "1",
+        "METRICS_SLOW_REQUEST_MS": "0",
+        "TASK_STORE_DIR": "",
+    })
+    if args.bcrypt_rounds:
+        os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+
+def use_fake_redis():
+    """Conecta el cliente compartido a un servidor fakeredis en proceso"""
+    import fakeredis
+    import redis.asyncio as redis
+    from fakeredis.aioredis import FakeConnection
+    from app import redis_pool
+
+    redis_pool.redis_client.connection_pool = redis.ConnectionPool(
+        connection_class=FakeConnection,
+        server=fakeredis.FakeServer(),
+        decode_responses=True,
+        max_connections=redis_pool.REDIS_MAX_CONNECTIONS,
+    )
+
+def stub_stripe():
+    import stripe
+
+    def create(**params):
+        session_id = f"cs_test_{uuid.uuid4().hex[:16]}"
+        return SimpleNamespace(id=session_id, url=f"https://checkout.stripe.test/{session_id}")
+
+    stripe.checkout.Session.create = create
+
+def metrics_snapshot() -> dict:
+    """(count, sum) de las series por ruta de ``app.metrics``"""
+    from app.metrics import http_db_duration, http_db_queries, http_duration
+
+    return {
+        name: {labels: (series[2], series[1]) for labels, series in histogram.series.items()}
+        for name, histogram in (("duration", http_duration), ("queries", http_db_queries), ("db", http_db_duration))
+    }
+
+def route_report(before: dict, after: dict) -> dict:
+    routes = {}
+    for labels, (count, total) in sorted(after["duration"].items()):
+        count -= before["duration"].get(labels, (0, 0))[0]
+        if count <= 0:
+            continue
+        total -= before["duration"].get(labels, (0, 0.0))[1]
+        queries = after["queries"][labels][1] - before["queries"].get(labels, (0, 0.0))[1]
+        db_time = after["db"][labels][1] - before["db"].get(labels, (0, 0.0))[1]
+        routes[" ".join(labels)] = {
+            "requests": count,
+            "server_mean_ms": round(total / count * 1000, 2),
+            "db_queries_per_request": round(queries / count, 2),
+            "db_ms_per_request": round(db_time / count * 1000, 3),
+        }
+    return routes
+
+class BenchUser:
+    def __init__(self, email: str):
+        self.email = email
+        self.headers = {}
+        self.task_ids = []
+        self.session_id = None
+        self.user_id = None
+        self.list_etag = None
+
+class Workload:
+    """Operaciones de la mezcla; cada una devuelve (status, segundos hasta el primer byte o None)"""
+
+    def __init__(self, client, run_id: str):
+        self.client = client
+        self.run_id = run_id
+        self.counter = itertools.count(1)
+
+    def text(self, rng: random.Random, words: int) -> str:
+        return " ".join(rng.choice(WORDS) for _ in range(words))
+
+    async def login(self, user, rng):
+        response = await self.client.post("/token", data={"username": user.email, "password": PASSWORD})
+        return response.status_code, None
+
+    async def me(self, user, rng):
+        return (await self.client.get("/me", headers=user.headers)).status_code, None
+
+    async def list_tasks(self, user, rng):
+        params = {"limit": 50}
+        if rng.random() < 0.5:
+            params["status"] = rng.choice(("TODO", "IN_PROGRESS", "DONE"))
+        return (await self.client.get("/api/tasks", params=params, headers=user.headers)).status_code, None
+
+    async def poll_tasks(self, user, rng):
+        # Una pestaña del tablero que refresca: If-None-Match con el último ETag
+        headers = {**user.headers, "If-None-Match": user.list_etag} if user.list_etag else user.headers
+        response = await self.client.get("/api/tasks", params={"limit": 50}, headers=headers)
+        user.list_etag = response.headers.get("etag", user.list_etag)
+        return response.status_code, None
+
+    async def get_task(self, user, rng):
+        response = await self.client.get(f"/api/tasks/{rng.choice(user.task_ids)}", headers=user.headers)
+        return response.status_code, None
+
+    async def create_task(self, user, rng):
+        response = await self.client.post("/api/tasks", headers=user.headers, json={
+            "title": self.text(rng, 3),
+            "description": self.text(rng, 12),
+            "priority": rng.choice(("LOW", "MEDIUM", "HIGH")),
+            "estimated_hours": rng.randint(1, 8),
+        })
+        if response.status_code == 200:
+            user.task_ids.append(response.json()["id"])
+        return response.status_code, None
+
+    async def update_task(self, user, rng):
+        response = await self.client.put(f"/api/tasks/{rng.choice(user.task_ids)}", headers=user.headers, json={
+            "status": rng.choice(("TODO", "IN_PROGRESS", "DONE")),
+            "priority": rng.choice(("LOW", "MEDIUM", "HIGH")),
+        })
+        return response.status_code, None
+
+    async def search_tasks(self, user, rng):
+        response = await self.client.get("/api/tasks:search", params={"q": rng.choice(WORDS)[:4]}, headers=user.headers)
+        return response.status_code, None
+
+    async def task_stats(self, user, rng):
+        return (await self.client.get("/api/stats", headers=user.headers)).status_code, None
+
+    def chat_message(self, rng) -> str:
+        # Mensajes únicos: se mide la llamada al LLM, no la caché de respuestas
+        return f"{self.text(rng, 8)} ({self.run_id}-{next(self.counter)})"
+
+    async def chat(self, user, rng):
+        response = await self.client.post("/chat", headers=user.headers, json={"message": self.chat_message(rng)})
+        return response.status_code, None
+
+    async def chat_stream(self, user, rng):
+        begin = time.perf_counter()
+        first_byte = None
+        body = {"message": self.chat_message(rng), "stream": True}
+        async with self.client.stream("POST", "/chat", headers=user.headers, json=body) as response:
+            async for _ in response.aiter_bytes():
+                if first_byte is None:
+                    first_byte = time.perf_counter() - begin
+        return response.status_code, first_byte
+
+    async def chat_session(self, user, rng):
+        response = await self.client.post(f"/chat/sessions/{user.session_id}/messages", headers=user.headers,
+                                          json={"message": self.chat_message(rng)})
+        return response.status_code, None
+
+    async def checkout(self, user, rng):
+        response = await self.client.post("/create-checkout-session", headers=user.headers, json={"plan_id": PLAN})
+        return response.status_code, None
+
+    async def webhook(self, user, rng):
+        from app.stripe_events import signature_header
+
+        number = next(self.counter)
+        now = int(time.time())
+        payload = json.dumps({
+            "id": f"evt_{self.run_id}_{number}",
+            "object": "event",
+            "api_version": "2023-10-16",
+            "type": "customer.subscription.updated",
+            "created": now,
+            "livemode": False,
+            "data": {"object": {
+                "id": f"sub_{self.run_id}_{user.user_id}",
+                "object": "subscription",
+                "customer": f"cus_{self.run_id}_{user.user_id}",
+                "status": "active",
+                "current_period_end": now + 30 * 24 * 3600,
+                "metadata": {"user_id": str(user.user_id)},
+                "items": {"data": [{"price": {"id": PLAN}}]},
+            }},
+        })
+        response = await self.client.post("/webhook", content=payload, headers={
+            "Content-Type": "application/json",
+            "Stripe-Signature": signature_header(payload, SECRET),
+        })
+        return response.status_code, None
+
+async def prepare_users(client, workload: Workload, args, run_id: str) -> list:
+    """Registro, créditos ilimitados, tareas iniciales y una sesión de chat por usuario"""
+    from sqlalchemy import select, update
+    from app.database import AsyncSessionLocal
+    from app.models import User
+
+    users = [BenchUser(f"load-{run_id}-{i}@example.com") for i in range(args.users)]
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def register(user):
+        async with semaphore:
+            response = await client.post("/register", json={"email": user.email, "password": PASSWORD})
+            response.raise_for_status()
+            user.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    await asyncio.gather(*(register(user) for user in users))
+    async with AsyncSessionLocal() as db:
+        emails = [user.email for user in users]
+        await db.execute(update(User).where(User.email.in_(emails)).values(credits=1000000000))
+        ids = dict((await db.execute(select(User.email, User.id).where(User.email.in_(emails)))).all())
+        await db.commit()
+
+    async def seed(user, rng):
+        async with semaphore:
+            user.user_id = ids[user.email]
+            for _ in range(args.tasks_per_user):
+                status, _ = await workload.create_task(user, rng)
+                if status != 200:
+                    raise RuntimeError(f"No se pudo crear una tarea inicial: {status}")
+            response = await client.post("/chat/sessions", headers=user.headers, json={"title": "carga"})
+            response.raise_for_status()
+            user.session_id = response.json()["id"]
+
+    rng = random.Random(args.seed)
+    await asyncio.gather(*(seed(user, random.Random(rng.random())) for user in users))
+    return users
+
+async def drive(workload: Workload, users: list, mix: dict, args, stop_at: float, budget: list, seed: str) -> list:
+    """Un cliente: operaciones según la mezcla hasta ``stop_at`` o hasta agotar ``budget``"""
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    samples = []
+    while time.perf_counter() < stop_at:
+        if budget is not None:
+            if budget[0] <= 0:
+                break
+            budget[0] -= 1
+        name = rng.choices(names, weights)[0]
+        user = rng.choice(users)
+        begin = time.perf_counter()
+        try:
+            status, first_byte = await getattr(workload, name)(user, rng)
+        except Exception as e:
+            status, first_byte = type(e).__name__, None
+        samples.append((name, begin, time.perf_counter() - begin, status, first_byte))
+    return samples
+
+def operation_report(samples: list, elapsed: float) -> dict:
+    by_name = {}
+    for name, _, latency, status, first_byte in samples:
+        by_name.setdefault(name, []).append((latency, status, first_byte))
+    report = {}
+    for name in sorted(by_name):
+        rows = by_name[name]
+        latencies = [latency * 1000 for latency, _, _ in rows]
+        statuses = {}
+        for _, status, _ in rows:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        errors = sum(count for status, count in statuses.items() if not (status.isdigit() and int(status) < 400))
+        method, route, _ = OPERATIONS[name]
+        entry = {
+            "route": f"{method} {route}",
+            "requests": len(rows),
+            "errors": errors,
+            "rps": round(len(rows) / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+            "max_ms": round(max(latencies), 2),
+            "statuses": statuses,
+        }
+        first_bytes = [first_byte * 1000 for _, _, first_byte in rows if first_byte is not None]
+        if first_bytes:
+            entry["first_byte_p50_ms"] = round(percentile(first_bytes, 50), 2)
+            entry["first_byte_p95_ms"] = round(percentile(first_bytes, 95), 2)
+        report[name] = entry
+    return report
+
+async def run(args, mix: dict) -> dict:
+    import httpx
+    from app.database import async_engine
+    from app.llm_gateway import llm_gateway
+    from app.main import app
+    from app.chat_sessions import chat_compactor
+    from app.stripe_events import stripe_inbox
+
+    stub_stripe()
+    run_id = uuid.uuid4().hex[:8]
+    server = AppServer(app)
+    await server.start()
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=server.url, timeout=args.timeout, limits=limits) as client:
+        workload = Workload(client, run_id)
+        begin = time.perf_counter()
+        users = await prepare_users(client, workload, args, run_id)
+        setup_s = time.perf_counter() - begin
+
+        if args.warmup > 0:
+            stop_at = time.perf_counter() + args.warmup
+            await asyncio.gather(*(
+                drive(workload, users, mix, args, stop_at, None, f"{args.seed}-warmup-{worker}")
+                for worker in range(args.concurrency)
+            ))
+
+        before = metrics_snapshot()
+        budget = [args.requests] if args.requests else None
+        stop_at = time.perf_counter() + (args.duration if not args.requests else float("inf"))
+        begin = time.perf_counter()
+        results = await asyncio.gather(*(
+            drive(workload, users, mix, args, stop_at, budget, f"{args.seed}-{worker}")
+            for worker in range(args.concurrency)
+        ))
+        elapsed = time.perf_counter() - begin
+        after = metrics_snapshot()
+
+    samples = [sample for worker in results for sample in worker]
+    latencies = [sample[2] * 1000 for sample in samples]
+    operations = operation_report(samples, elapsed)
+    report = {
+        "totals": {
+            "requests": len(samples),
+            "errors": sum(entry["errors"] for entry in operations.values()),
+            "rps": round(len(samples) / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 50), 2) if latencies else None,
+            "p95_ms": round(percentile(latencies, 95), 2) if latencies else None,
+            "p99_ms": round(percentile(latencies, 99), 2) if latencies else None,
+            "elapsed_s": round(elapsed, 2),
+            "setup_s": round(setup_s, 2),
+        },
+        "operations": operations,
+        "routes": route_report(before, after),
+        "llm": llm_gateway.stats(),
+        "chat_compactor": chat_compactor.stats(),
+        "webhooks": stripe_inbox.stats(),
+    }
+    await server.stop()
+    await async_engine.dispose()
+    return report
+
+def compare(report: dict, baseline: dict, threshold: float) -> dict:
+    """Cambios relativos frente a ``baseline``; regresión si p95 sube o el throughput baja más de ``threshold``"""
+    operations, regressions = {}, []
+    for name, current in report["operations"].items():
+        previous = baseline.get("operations", {}).get(name)
+        if not previous:
+            continue
+        change = {
+            "p95_ms": [previous["p95_ms"], current["p95_ms"]],
+            "rps": [previous["rps"], current["rps"]],
+            "p95_change": round(current["p95_ms"] / previous["p95_ms"] - 1, 3) if previous["p95_ms"] else None,
+            "rps_change": round(current["rps"] / previous["rps"] - 1, 3) if previous["rps"] else None,
+        }
+        operations[name] = change
+        if change["p95_change"] is not None and change["p95_change"] > threshold:
+            regressions.append(f"{name}: p95 {previous['p95_ms']} -> {current['p95_ms']} ms")
+        if change["rps_change"] is not None and change["rps_change"] < -threshold:
+            regressions.append(f"{name}: {previous['rps']} -> {current['rps']} peticiones/s")
+    routes = {}
+    for route, current in report["routes"].items():
+        previous = baseline.get("routes", {}).get(route)
+        if not previous:
+            continue
+        routes[route] = {"db_queries_per_request": [previous["db_queries_per_request"], current["db_queries_per_request"]]}
+        # Las consultas por petición apenas dependen de la máquina: cualquier aumento claro es una regresión
+        if current["db_queries_per_request"] > previous["db_queries_per_request"] + 0.5:
+            regressions.append(
+                f"{route}: {previous['db_queries_per_request']} -> {current['db_queries_per_request']} consultas por petición"
+            )
+    return {
+        "baseline_commit": baseline.get("git", {}).get("commit"),
+        "threshold": threshold,
+        "operations": operations,
+        "routes": routes,
+        "regressions": regressions,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=20, help="clientes simultáneos")
+    parser.add_argument("--duration", type=float, default=20, help="segundos medidos")
+    parser.add_argument("--requests", type=int, default=0, help="total de peticiones medidas (sustituye a --duration)")
+    parser.add_argument("--warmup", type=float, default=3, help="segundos de calentamiento sin medir")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--tasks-per-user", type=int, default=20)
+    parser.add_argument("--mix", default="", help=f"pesos por operación, p. ej. list_tasks=5,chat=1 ({', '.join(OPERATIONS)})")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--ttft", type=float, default=0.2, help="segundos hasta el primer token del LLM falso")
+    parser.add_argument("--tokens-per-sec", type=float, default=100, help="ritmo de tokens del LLM falso")
+    parser.add_argument("--tokens", type=int, default=40, help="tokens por respuesta del LLM falso")
+    parser.add_argument("--llm-url", default="", help="servidor compatible con OpenAI ya arrancado (p. ej. fake_openai serve)")
+    parser.add_argument("--redis", choices=["fake", "memory"], default="fake")
+    parser.add_argument("--database-url", default="", help="base de datos síncrona para alembic; por defecto un SQLite temporal")
+    parser.add_argument("--bcrypt-rounds", type=int, default=0, help="coste de bcrypt; 0: el de la app")
+    parser.add_argument("--rate-limit", type=int, default=1000000000, help="peticiones por ventana y usuario en /chat")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--output", default="", help="guarda el informe JSON en este fichero")
+    parser.add_argument("--compare", default="", help="informe JSON anterior con el que comparar")
+    parser.add_argument("--threshold", type=float, default=0.2, help="empeoramiento relativo tolerado al comparar")
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    if args.redis == "fake":
+        try:
+            import fakeredis  # noqa: F401
+        except ImportError:
+            raise SystemExit("--redis fake necesita el paquete fakeredis (pip install fakeredis lupa); o usa --redis memory")
+
+    llm_server = None
+    if not args.llm_url:
+        llm_server = FakeLLMServer(args.ttft, args.tokens_per_sec, args.tokens)
+        llm_server.start()
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            configure_environment(args, tmp, args.llm_url or llm_server.url)
+
+            from alembic import command
+            from alembic.config import Config
+
+            here = os.path.dirname(__file__)
+            config = Config(os.path.join(here, "..", "alembic.ini"))
+            config.set_main_option("script_location", os.path.join(here, "..", "migrations"))
+            config.set_main_option("sqlalchemy.url", os.environ["SQLALCHEMY_DATABASE_URL"])
+            command.upgrade(config, "head")
+
+            if args.redis == "fake":
+                use_fake_redis()
+            report = asyncio.run(run(args, mix))
+    finally:
+        if llm_server is not None:
+            llm_server.stop()
+
+    report = {
+        "git": git_revision(),
+        "config": {
+            "concurrency": args.concurrency,
+            "duration": None if args.requests else args.duration,
+            "requests": args.requests or None,
+            "warmup": args.warmup,
+            "users": args.users,
+            "tasks_per_user": args.tasks_per_user,
+            "mix": mix,
+            "seed": args.seed,
+            "llm": args.llm_url or {"ttft": args.ttft, "tokens_per_sec": args.tokens_per_sec, "tokens": args.tokens},
+            "redis": args.redis,
+            "database": "sqlite-temporal" if not args.database_url else args.database_url.split("@")[-1],
+            "python": sys.version.split()[0],
+        },
+        **report,
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            report["comparison"] = compare(report, json.load(f), args.threshold)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+    if report.get("comparison", {}).get("regressions"):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Benchmark de la latencia de /chat durante una avalancha de logins.
+
+Arranca ``app.main:app`` en proceso (httpx + ASGITransport) sobre un SQLite
+temporal, con un cliente LLM falso y rate limiting en memoria. Mientras
+``--logins`` peticiones concurrentes golpean ``/token``, un cliente mide la
+latencia de ``/chat``. Se compara bcrypt en línea dentro del event loop
+(comportamiento anterior) con el pool acotado de ``password_hasher``.
+
+Uso (desde ``backend/``)::
+
+    python -m benchmarks.login_storm --logins 200 --chats 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+from types import SimpleNamespace
+
+class FakeCompletions:
+    async def create(self, **kwargs):
+        async def stream():
+            for part in ("Hola", " mundo"):
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=part))])
+        return stream()
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=200, help="logins concurrentes")
+    parser.add_argument("--chats", type=int, default=100, help="peticiones /chat secuenciales")
+    parser.add_argument("--rounds", type=int, default=12, help="coste de bcrypt")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # La configuración debe fijarse antes de importar la app
+        os.environ["SQLALCHEMY_DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'storm.db')}"
+        os.environ.pop("ASYNC_DATABASE_URL", None)
+        os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+        os.environ["RATE_LIMIT_BACKEND"] = "memory"
+        os.environ["RATE_LIMIT_DEFAULT"] = str(10 ** 9)
+        os.environ["COMPLETION_CACHE_ENABLED"] = "0"
+        os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+
+        import httpx
+        from app import main as app_main
+        from app.auth import PasswordHasher, password_hasher
+        from app.database import Base, async_engine, engine
+        from app.llm_gateway import llm_gateway
+        from app.usage_recorder import usage_recorder
+
+        class InlineHasher(PasswordHasher):
+            """bcrypt ejecutado directamente en el event loop, como antes"""
+
+            async def _run(self, fn, *args):
+                return fn(*args)
+
+        Base.metadata.create_all(engine)
+        llm_gateway.client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+
+        async def run(hasher) -> dict:
+            app_main.password_hasher = hasher
+            transport = httpx.ASGITransport(app=app_main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+                response = await client.post("/token", data={"username": "storm@example.com", "password": "storm"})
+                headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+                await client.post("/chat", json={"message": "warmup"}, headers=headers)
+
+                async def login():
+                    response = await client.post("/token", data={"username": "storm@example.com", "password": "storm"})
+                    return response.status_code
+
+                async def chats():
+                    latencies = []
+                    for i in range(args.chats):
+                        start = time.perf_counter()
+                        await client.post("/chat", json={"message": f"chat {i}"}, headers=headers)
+                        latencies.append((time.perf_counter() - start) * 1000)
+                    return latencies
+
+                start = time.perf_counter()
+                latencies, *codes = await asyncio.gather(chats(), *(login() for _ in range(args.logins)))
+                elapsed = time.perf_counter() - start
+
+            return {
+                "elapsed_s": round(elapsed, 2),
+                "logins_ok": codes.count(200),
+                "logins_shed_503": codes.count(503),
+                "chat_p50_ms": round(statistics.median(latencies), 1),
+                "chat_p95_ms": round(percentile(latencies, 95), 1),
+                "chat_max_ms": round(max(latencies), 1),
+            }
+
+        async def both():
+            await usage_recorder.start()
+            transport = httpx.ASGITransport(app=app_main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                await client.post("/register", json={"email": "storm@example.com", "password": "storm"})
+            results = {
+                "inline": await run(InlineHasher()),
+                "pool": await run(password_hasher),
+            }
+            await usage_recorder.stop()
+            password_hasher.shutdown()
+            await async_engine.dispose()
+            return results
+
+        print(json.dumps(asyncio.run(both()), indent=2))
+
+if __name__ == "__main__":
+    main()
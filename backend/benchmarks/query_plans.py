@@ -0,0 +1,96 @@
+"""Comprueba que las consultas más frecuentes usan los índices de las migraciones.
+
+Aplica ``alembic upgrade head`` sobre un SQLite temporal, ejecuta
+``EXPLAIN QUERY PLAN`` para cada consulta caliente y falla (código de salida 1)
+si el plan no menciona el índice esperado.
+
+Uso (desde ``backend/``)::
+
+    python -m benchmarks.query_plans
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, select, text
+
+from app.enums import SuggestionJobStatus, TaskStatus
+from app.models import AISuggestion, APIRequest, SuggestionJob, Task, TaskStats
+from app.task_stats import overdue_query
+
+NOW = datetime(2024, 1, 1)
+
+HOT_QUERIES = [
+    (
+        "get_tasks: página por (updated_at, id)",
+        select(Task).where(Task.user_id == 1).order_by(Task.updated_at.desc(), Task.id.desc()).limit(51),
+        "ix_tasks_user_updated",
+    ),
+    (
+        "tablero: tareas abiertas que vencen",
+        select(Task.id).where(Task.user_id == 1, Task.status == TaskStatus.TODO, Task.due_date < NOW),
+        "ix_tasks_user_status_due",
+    ),
+    (
+        # La consulta real de read_stats: las vencidas se cuentan al leer
+        "estadísticas: tareas vencidas por proyecto",
+        overdue_query(1, NOW),
+        "ix_tasks_user_status_due",
+    ),
+    (
+        "estadísticas: contadores del usuario",
+        select(TaskStats).where(TaskStats.user_id == 1),
+        "sqlite_autoindex_task_stats_1",
+    ),
+    (
+        "subtareas de una tarea",
+        select(Task).where(Task.parent_task_id == 1),
+        "ix_tasks_parent_task_id",
+    ),
+    (
+        "tareas de un proyecto",
+        select(Task).where(Task.project_id == 1),
+        "ix_tasks_project_id",
+    ),
+    (
+        "uso de la API por usuario en el tiempo",
+        select(APIRequest).where(APIRequest.user_id == 1, APIRequest.timestamp >= NOW),
+        "ix_api_requests_user_timestamp",
+    ),
+    (
+        "sugerencias de una tarea",
+        select(AISuggestion).where(AISuggestion.task_id == 1),
+        "ix_ai_suggestions_task_id",
+    ),
+    (
+        "trabajos de sugerencias pendientes",
+        select(SuggestionJob.id).where(SuggestionJob.status == SuggestionJobStatus.PENDING),
+        "ix_suggestion_jobs_status",
+    ),
+]
+
+def main() -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'plans.db')}"
+        config = Config(os.path.join(os.path.dirname(__file__), "..", "alembic.ini"))
+        config.set_main_option("script_location", os.path.join(os.path.dirname(__file__), "..", "migrations"))
+        config.set_main_option("sqlalchemy.url", url)
+        command.upgrade(config, "head")
+
+        engine = create_engine(url)
+        failures = 0
+        with engine.connect() as conn:
+            for name, query, index in HOT_QUERIES:
+                sql = str(query.compile(engine, compile_kwargs={"literal_binds": True}))
+                plan = " | ".join(row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+                ok = index in plan
+                failures += not ok
+                print(f"[{'OK' if ok else 'FAIL'}] {name}: {plan}")
+        engine.dispose()
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""Reproducción de webhooks de Stripe firmados en local contra ``POST /webhook``.
+
+Aplica ``alembic upgrade head`` sobre un SQLite temporal, crea ``--users``
+usuarios y, para cada uno, genera la secuencia de eventos de una suscripción
+(alta, checkout completado, ``--renewals`` renovaciones y baja opcional) con
+el formato de Stripe, firmados con un secreto de prueba. Los envía como lo
+hace Stripe en el peor caso: cada evento ``--duplicates`` veces y en orden
+aleatorio, con ``--concurrency`` peticiones en paralelo. Mide la latencia del
+acuse de recibo, espera a que el worker aplique la bandeja de entrada y
+comprueba el estado final: una sola suscripción por usuario, fin de periodo
+de la última renovación y créditos del plan (o el tope gratuito tras la baja).
+
+Uso (desde ``backend/``)::
+
+    python -m benchmarks.stripe_webhooks --users 200 --renewals 3 --duplicates 3
+"""
+import argparse
+import asyncio
+import calendar
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+SECRET = "whsec_benchmark"
+PLAN = "price_benchmark"
+PERIOD = 30 * 24 * 3600
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def event(event_id: str, event_type: str, created: int, obj: dict) -> dict:
+    return {
+        "id": event_id,
+        "object": "event",
+        "api_version": "2023-10-16",
+        "type": event_type,
+        "created": created,
+        "livemode": False,
+        "data": {"object": obj},
+    }
+
+def subscription_object(user_id: int, status: str, period_end: int) -> dict:
+    return {
+        "id": f"sub_{user_id}",
+        "object": "subscription",
+        "customer": f"cus_{user_id}",
+        "status": status,
+        "current_period_end": period_end,
+        "metadata": {"user_id": str(user_id)},
+        "items": {"data": [{"price": {"id": PLAN}}]},
+    }
+
+def user_events(user_id: int, email: str, renewals: int, cancel: bool, start: int) -> list:
+    """Secuencia de eventos de la suscripción de un usuario, en el orden en que Stripe los crea"""
+    events = [
+        event(f"evt_{user_id}_created", "customer.subscription.created", start,
+              subscription_object(user_id, "active", start + PERIOD)),
+        event(f"evt_{user_id}_checkout", "checkout.session.completed", start + 1, {
+            "id": f"cs_{user_id}",
+            "object": "checkout.session",
+            "mode": "subscription",
+            "customer": f"cus_{user_id}",
+            "customer_email": email,
+            "client_reference_id": str(user_id),
+            "subscription": f"sub_{user_id}",
+            "metadata": {"user_id": str(user_id), "plan_id": PLAN},
+        }),
+    ]
+    for renewal in range(1, renewals + 1):
+        created = start + renewal * PERIOD
+        events.append(event(f"evt_{user_id}_renewal_{renewal}", "customer.subscription.updated", created,
+                            subscription_object(user_id, "active", created + PERIOD)))
+    if cancel:
+        created = start + renewals * PERIOD + 10
+        events.append(event(f"evt_{user_id}_deleted", "customer.subscription.deleted", created,
+                            subscription_object(user_id, "canceled", start + (renewals + 1) * PERIOD)))
+    return events
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--renewals", type=int, default=3)
+    parser.add_argument("--duplicates", type=int, default=3, help="veces que se entrega cada evento")
+    parser.add_argument("--cancel-ratio", type=float, default=0.25, help="fracción de usuarios que se dan de baja")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # La configuración debe fijarse antes de importar la aplicación
+        os.environ.update({
+            "SQLALCHEMY_DATABASE_URL": f"sqlite:///{os.path.join(tmp, 'webhooks.db')}",
+            "STRIPE_WEBHOOK_SECRET": SECRET,
+            "STRIPE_PLAN_CREDITS": f"{PLAN}:5000",
+            "STRIPE_FREE_CREDITS": "100",
+            "STRIPE_WEBHOOK_RETRY_BACKOFF": "0.05",
+            "RATE_LIMIT_BACKEND": "memory",
+            "CHANGE_FEED_BACKEND": "memory",
+            "COMPLETION_CACHE_ENABLED": "0",
+            "OPENROUTER_API_KEY": os.environ.get("OPENROUTER_API_KEY", "benchmark"),
+        })
+        os.environ.pop("ASYNC_DATABASE_URL", None)
+
+        from alembic import command
+        from alembic.config import Config
+
+        here = os.path.dirname(__file__)
+        config = Config(os.path.join(here, "..", "alembic.ini"))
+        config.set_main_option("script_location", os.path.join(here, "..", "migrations"))
+        config.set_main_option("sqlalchemy.url", os.environ["SQLALCHEMY_DATABASE_URL"])
+        command.upgrade(config, "head")
+
+        print(json.dumps(asyncio.run(run(args)), indent=2))
+
+async def run(args) -> dict:
+    import httpx
+    from sqlalchemy import func, insert, select
+    from app.database import AsyncSessionLocal, async_engine
+    from app.enums import WebhookEventStatus
+    from app.main import app, start_background_workers, stop_background_workers
+    from app.models import StripeEvent, Subscription, User
+    from app.stripe_events import signature_header, stripe_inbox
+
+    rng = random.Random(args.seed)
+    async with AsyncSessionLocal() as db:
+        await db.execute(insert(User), [
+            {"id": i, "email": f"stripe{i}@example.com", "hashed_password": "x", "api_key": f"key{i}", "credits": 100}
+            for i in range(1, args.users + 1)
+        ])
+        await db.commit()
+
+    start = int(time.time()) - 365 * 24 * 3600
+    cancelled = set(rng.sample(range(1, args.users + 1), int(args.users * args.cancel_ratio)))
+    payloads = []
+    for user_id in range(1, args.users + 1):
+        for item in user_events(user_id, f"stripe{user_id}@example.com", args.renewals, user_id in cancelled, start):
+            payloads += [json.dumps(item)] * args.duplicates
+    rng.shuffle(payloads)
+
+    await start_background_workers()
+    latencies, outcomes = [], {}
+    queue = asyncio.Queue()
+    for payload in payloads:
+        queue.put_nowait(payload)
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def sender():
+            while not queue.empty():
+                payload = queue.get_nowait()
+                begin = time.perf_counter()
+                response = await client.post("/webhook", content=payload, headers={
+                    "Content-Type": "application/json",
+                    "Stripe-Signature": signature_header(payload, SECRET),
+                })
+                latencies.append((time.perf_counter() - begin) * 1000)
+                result = response.json().get("event", response.status_code)
+                outcomes[result] = outcomes.get(result, 0) + 1
+
+        begin = time.perf_counter()
+        await asyncio.gather(*(sender() for _ in range(args.concurrency)))
+        send_s = time.perf_counter() - begin
+
+        # Firma inválida: se rechaza sin guardar nada
+        bad = await client.post("/webhook", content=payloads[0], headers={"Stripe-Signature": "t=1,v1=00"})
+
+    while True:
+        async with AsyncSessionLocal() as db:
+            pending = await db.scalar(
+                select(func.count()).select_from(StripeEvent).where(StripeEvent.status == WebhookEventStatus.PENDING)
+            )
+        if not pending:
+            break
+        await asyncio.sleep(0.05)
+    drain_s = time.perf_counter() - begin
+    stats = stripe_inbox.stats()
+    await stop_background_workers()
+
+    errors = []
+    async with AsyncSessionLocal() as db:
+        users = {user.id: user for user in (await db.execute(select(User))).scalars()}
+        subscriptions = (await db.execute(select(Subscription))).scalars().all()
+        failed = await db.scalar(
+            select(func.count()).select_from(StripeEvent).where(StripeEvent.status == WebhookEventStatus.FAILED)
+        )
+    by_user = {}
+    for subscription in subscriptions:
+        by_user.setdefault(subscription.user_id, []).append(subscription)
+    for user_id, user in users.items():
+        rows = by_user.get(user_id, [])
+        if len(rows) != 1:
+            errors.append(f"usuario {user_id}: {len(rows)} suscripciones")
+            continue
+        subscription = rows[0]
+        expected_end = start + (args.renewals + 1) * PERIOD
+        if calendar.timegm(subscription.current_period_end.timetuple()) != expected_end:
+            errors.append(f"usuario {user_id}: fin de periodo {subscription.current_period_end}")
+        expected_credits = 100 if user_id in cancelled else 5000
+        if user.credits != expected_credits:
+            errors.append(f"usuario {user_id}: {user.credits} créditos, se esperaban {expected_credits}")
+        expected_status = "canceled" if user_id in cancelled else "active"
+        if subscription.status != expected_status:
+            errors.append(f"usuario {user_id}: estado {subscription.status}")
+    await async_engine.dispose()
+
+    return {
+        "deliveries": len(payloads),
+        "unique_events": len(payloads) // args.duplicates,
+        "outcomes": outcomes,
+        "bad_signature_status": bad.status_code,
+        "ack_p50_ms": round(statistics.median(latencies), 2),
+        "ack_p99_ms": round(percentile(latencies, 99), 2),
+        "send_s": round(send_s, 2),
+        "drain_s": round(drain_s, 2),
+        "inbox": stats,
+        "failed_events": failed,
+        "errors": errors[:20],
+        "error_count": len(errors),
+    }
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Benchmark de la búsqueda de texto completo frente a LIKE sobre las tareas.
+
+Aplica ``alembic upgrade head`` sobre un SQLite temporal (tabla FTS5 y
+triggers incluidos), inserta ``--tasks`` tareas repartidas entre ``--users``
+usuarios con texto sintético de frecuencias tipo Zipf, y mide para términos
+frecuentes, intermedios y raros (completos y por prefijo) la latencia de
+``search_tasks`` y la de un ``LIKE '%término%'`` sobre título y descripción
+de las tareas del usuario, que es lo más parecido a filtrar la lista entera.
+
+Uso (desde ``backend/``)::
+
+    python -m benchmarks.task_search --tasks 1000000 --users 1000
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+SYLLABLES = ["ba", "ca", "de", "fi", "go", "la", "me", "ni", "po", "ra", "se", "ti", "vo", "za", "ción", "dor", "mar", "tel"]
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def vocabulary(size: int, rng: random.Random):
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    # Orden aleatorio: que las palabras frecuentes no compartan prefijo
+    words = sorted(words)
+    rng.shuffle(words)
+    return words
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--words", type=int, default=20000, help="tamaño del vocabulario")
+    parser.add_argument("--queries", type=int, default=200, help="consultas por tipo de término")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "search.db")
+        # La URL debe fijarse antes de importar app.database
+        os.environ["SQLALCHEMY_DATABASE_URL"] = f"sqlite:///{path}"
+        os.environ.pop("ASYNC_DATABASE_URL", None)
+
+        from alembic import command
+        from alembic.config import Config
+        from sqlalchemy import insert, or_, select
+        from app.database import AsyncSessionLocal, SessionLocal, async_engine, engine
+        from app.models import Task, User
+        from app.task_search import search_tasks
+
+        here = os.path.dirname(__file__)
+        config = Config(os.path.join(here, "..", "alembic.ini"))
+        config.set_main_option("script_location", os.path.join(here, "..", "migrations"))
+        config.set_main_option("sqlalchemy.url", os.environ["SQLALCHEMY_DATABASE_URL"])
+        command.upgrade(config, "head")
+
+        rng = random.Random(args.seed)
+        words = vocabulary(args.words, rng)
+        # Pesos Zipf: la palabra i aparece con probabilidad proporcional a 1/(i+1)
+        cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(words))))
+
+        def sentence(low: int, high: int) -> str:
+            return " ".join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(low, high)))
+
+        with SessionLocal() as db:
+            db.execute(insert(User), [
+                {"id": i, "email": f"user{i}@example.com", "hashed_password": "x", "api_key": f"key{i}"}
+                for i in range(1, args.users + 1)
+            ])
+            db.commit()
+
+        start = time.perf_counter()
+        batch = 10000
+        with SessionLocal() as db:
+            for offset in range(0, args.tasks, batch):
+                db.execute(insert(Task), [
+                    {
+                        "title": sentence(3, 7),
+                        "description": sentence(10, 30),
+                        "user_id": rng.randint(1, args.users),
+                    }
+                    for _ in range(offset, min(offset + batch, args.tasks))
+                ])
+                db.commit()
+        load_s = time.perf_counter() - start
+
+        # Frecuencias por rango en el vocabulario; el prefijo son las 4 primeras letras
+        bands = {
+            "frecuente": words[:20],
+            "intermedio": words[200:1000],
+            "raro": words[-2000:],
+        }
+        cases = []
+        for band, pool in bands.items():
+            cases.append((band, [rng.choice(pool) for _ in range(args.queries)], False))
+            cases.append((f"{band} (prefijo)", [rng.choice(pool)[:4] for _ in range(args.queries)], True))
+
+        async def run_fts(terms, prefix):
+            latencies, hits = [], 0
+            async with AsyncSessionLocal() as db:
+                for term in terms:
+                    user_id = rng.randint(1, args.users)
+                    begin = time.perf_counter()
+                    rows = await search_tasks(db, user_id, term, limit=20, prefix=prefix)
+                    latencies.append((time.perf_counter() - begin) * 1000)
+                    hits += len(rows)
+            return latencies, hits
+
+        async def run_like(terms, prefix):
+            latencies, hits = [], 0
+            async with AsyncSessionLocal() as db:
+                for term in terms:
+                    user_id = rng.randint(1, args.users)
+                    pattern = f"%{term}%"
+                    begin = time.perf_counter()
+                    result = await db.execute(
+                        select(Task.id, Task.title)
+                        .where(Task.user_id == user_id, or_(Task.title.like(pattern), Task.description.like(pattern)))
+                        .order_by(Task.id.desc())
+                        .limit(20)
+                    )
+                    latencies.append((time.perf_counter() - begin) * 1000)
+                    hits += len(result.all())
+            return latencies, hits
+
+        def summary(latencies, hits):
+            return {
+                "p50_ms": round(statistics.median(latencies), 2),
+                "p95_ms": round(percentile(latencies, 95), 2),
+                "max_ms": round(max(latencies), 2),
+                "avg_hits": round(hits / len(latencies), 1),
+            }
+
+        async def queries():
+            results = {}
+            for name, terms, prefix in cases:
+                results[name] = {
+                    "fts": summary(*await run_fts(terms, prefix)),
+                    "like": summary(*await run_like(terms, prefix)),
+                }
+            await async_engine.dispose()
+            return results
+
+        results = asyncio.run(queries())
+        engine.dispose()
+        print(json.dumps({
+            "tasks": args.tasks,
+            "users": args.users,
+            "load_rows_per_s": round(args.tasks / load_s),
+            "db_mb": round(os.path.getsize(path) / 2 ** 20, 1),
+            "queries": results,
+        }, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
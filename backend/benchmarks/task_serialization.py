@@ -0,0 +1,186 @@
+"""Coste de serializar listas de tareas: modelos Pydantic frente a tuplas codificadas directamente.
+
+Crea ``--tasks`` tareas de un usuario en un SQLite temporal (con ``alembic
+upgrade head``) y, para la misma consulta de ``GET /api/tasks``, compara:
+
+- ``pydantic``: la ruta actual; ``select(Task)`` carga objetos ORM y FastAPI
+  los valida con el ``response_model`` y los codifica con ``JSONResponse``.
+- ``fast_orjson`` / ``fast_json``: ``TASK_LIST_FAST_PATH``; ``select`` de las
+  columnas y ``row_encoding.encode_rows`` con orjson o con json estándar.
+- ``fast_msgpack``: lo mismo con ``Accept: application/msgpack``.
+
+Mide tiempo de CPU (consulta y serialización por separado, mediana de
+``--repeat``) y el pico de memoria asignada con ``tracemalloc`` en una pasada
+aparte, y comprueba que las cuatro salidas decodifican al mismo contenido.
+
+Uso (desde ``backend/``)::
+
+    python -m benchmarks.task_serialization --tasks 10000
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # La configuración debe fijarse antes de importar la aplicación
+        os.environ.update({
+            "SQLALCHEMY_DATABASE_URL": f"sqlite:///{os.path.join(tmp, 'serialization.db')}",
+            "METRICS_ENABLED": "0",
+            "OPENROUTER_API_KEY": os.environ.get("OPENROUTER_API_KEY", "benchmark"),
+        })
+        os.environ.pop("ASYNC_DATABASE_URL", None)
+
+        from alembic import command
+        from alembic.config import Config
+
+        here = os.path.dirname(__file__)
+        config = Config(os.path.join(here, "..", "alembic.ini"))
+        config.set_main_option("script_location", os.path.join(here, "..", "migrations"))
+        config.set_main_option("sqlalchemy.url", os.environ["SQLALCHEMY_DATABASE_URL"])
+        command.upgrade(config, "head")
+
+        print(json.dumps(asyncio.run(run(args)), indent=2))
+
+async def run(args) -> dict:
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from sqlalchemy import insert, select
+    from app import row_encoding
+    from app.database import AsyncSessionLocal, async_engine
+    from app.enums import TaskPriority, TaskStatus
+    from app.models import Task, User
+    from app.task_router import TASK_FIELDS, router
+
+    rng = random.Random(args.seed)
+    start = datetime(2024, 1, 1)
+    async with AsyncSessionLocal() as db:
+        await db.execute(insert(User), [{"id": 1, "email": "serialize@example.com", "hashed_password": "x", "api_key": "k"}])
+        await db.execute(insert(Task), [
+            {
+                "title": f"Tarea {i} · revisar informe",
+                "description": None if i % 4 == 0 else f"Descripción de la tarea {i} con algo de texto",
+                "status": rng.choice(list(TaskStatus)),
+                "priority": rng.choice(list(TaskPriority)),
+                "due_date": None if i % 3 == 0 else start + timedelta(days=rng.randint(0, 365), minutes=rng.randint(0, 1440)),
+                "estimated_hours": None if i % 5 == 0 else rng.randint(1, 40) / 4,
+                "created_at": start + timedelta(seconds=i, microseconds=rng.randint(0, 999999)),
+                "updated_at": start + timedelta(seconds=2 * i, microseconds=rng.randint(0, 999999)),
+                "completed_at": None,
+                "user_id": 1,
+            }
+            for i in range(args.tasks)
+        ])
+        await db.commit()
+
+    route = next(r for r in router.routes if r.path == "/tasks" and "GET" in r.methods)
+    order = (Task.updated_at.desc(), Task.id.desc())
+    columns = [getattr(Task, field) for field in TASK_FIELDS]
+
+    async def load_models(db):
+        return (await db.execute(select(Task).where(Task.user_id == 1).order_by(*order))).scalars().all()
+
+    async def load_rows(db):
+        return (await db.execute(select(*columns).where(Task.user_id == 1).order_by(*order))).all()
+
+    async def encode_models(rows):
+        content = await serialize_response(field=route.response_field, response_content=rows)
+        return JSONResponse(content=content).body
+
+    def encoder(media_type, use_orjson=True):
+        async def encode(rows):
+            saved = row_encoding.orjson
+            if not use_orjson:
+                row_encoding.orjson = None
+            try:
+                return row_encoding.encode_rows(TASK_FIELDS, rows, media_type)
+            finally:
+                row_encoding.orjson = saved
+        return encode
+
+    paths = {"pydantic": (load_models, encode_models)}
+    if row_encoding.orjson is not None:
+        paths["fast_orjson"] = (load_rows, encoder(row_encoding.JSON_MEDIA_TYPE))
+    paths["fast_json"] = (load_rows, encoder(row_encoding.JSON_MEDIA_TYPE, use_orjson=False))
+    if row_encoding.msgpack is not None:
+        paths["fast_msgpack"] = (load_rows, encoder(row_encoding.MSGPACK_MEDIA_TYPES[0]))
+
+    async def measure(load, encode):
+        # Sesión nueva en cada pasada: sin identity map, como en una petición real
+        async with AsyncSessionLocal() as db:
+            begin = time.process_time()
+            rows = await load(db)
+            loaded = time.process_time()
+            body = await encode(rows)
+            encoded = time.process_time()
+        return body, loaded - begin, encoded - loaded
+
+    results, bodies = {}, {}
+    per_10k = 10000 / args.tasks
+    for name, (load, encode) in paths.items():
+        await measure(load, encode)
+        query_s, encode_s = [], []
+        for _ in range(args.repeat):
+            gc.collect()
+            body, query, serialize = await measure(load, encode)
+            query_s.append(query)
+            encode_s.append(serialize)
+        bodies[name] = body
+
+        gc.collect()
+        tracemalloc.start()
+        await measure(load, encode)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        query_ms = statistics.median(query_s) * 1000
+        encode_ms = statistics.median(encode_s) * 1000
+        results[name] = {
+            "query_cpu_ms_per_10k": round(query_ms * per_10k, 2),
+            "serialize_cpu_ms_per_10k": round(encode_ms * per_10k, 2),
+            "total_cpu_ms_per_10k": round((query_ms + encode_ms) * per_10k, 2),
+            "peak_alloc_mb_per_10k": round(peak / 2**20 * per_10k, 2),
+            "body_kb": round(len(body) / 1024, 1),
+        }
+
+    # Todas las rutas deben devolver el mismo contenido
+    expected = json.loads(bodies["pydantic"])
+    parity = {}
+    for name, body in bodies.items():
+        if name == "fast_msgpack":
+            decoded = row_encoding.msgpack.unpackb(body)
+        else:
+            decoded = json.loads(body)
+        parity[name] = decoded == expected
+    baseline = results["pydantic"]["total_cpu_ms_per_10k"]
+    for name, entry in results.items():
+        entry["speedup"] = round(baseline / entry["total_cpu_ms_per_10k"], 2) if entry["total_cpu_ms_per_10k"] else None
+    await async_engine.dispose()
+
+    return {
+        "tasks": args.tasks,
+        "orjson": row_encoding.orjson is not None,
+        "msgpack": row_encoding.msgpack is not None,
+        "paths": results,
+        "same_content": parity,
+        "byte_identical_json": {
+            name: bodies[name] == bodies["pydantic"] for name in bodies if name != "fast_msgpack"
+        },
+    }
+
+if __name__ == "__main__":
+    main()
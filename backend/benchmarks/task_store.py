@@ -0,0 +1,153 @@
+"""Micro-benchmark del almacén de tareas de la API ligera (``app/task_store.py``).
+
+Crea ``--tasks`` tareas con estados, prioridades y etiquetas aleatorias y mide
+altas, cambios de estado, bajas y listados filtrados (por un campo, por varios
+y con ``limit``). Después mide el arranque en frío reproduciendo solo el log,
+compacta, y vuelve a medir el arranque desde el snapshot más un log corto.
+Como referencia, mide el ``PUT``/``DELETE`` de la versión anterior (lista con
+búsqueda lineal y ``list.pop``) sobre una muestra pequeña.
+
+Uso (desde ``backend/``)::
+
+    python -m benchmarks.task_store --tasks 1000000
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+STATUSES = ("todo", "in-progress", "done")
+PRIORITIES = ("low", "medium", "high")
+TAGS = tuple(f"tag{i}" for i in range(50))
+
+def timed(function, repeat: int = 1):
+    """Devuelve (resultado, segundos por llamada)"""
+    begin = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return result, (time.perf_counter() - begin) / repeat
+
+def rate(count: int, seconds: float) -> int:
+    return int(count / seconds) if seconds else 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=1000000)
+    parser.add_argument("--updates", type=int, default=200000)
+    parser.add_argument("--deletes", type=int, default=100000)
+    parser.add_argument("--baseline-ops", type=int, default=200, help="operaciones medidas sobre la lista antigua")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    # Debe fijarse antes de importar: main.py abre su propio almacén al importarse
+    os.environ["TASK_STORE_DIR"] = ""
+    os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+    from app.task_store import SNAPSHOT_FILE, TaskStore
+
+    rng = random.Random(args.seed)
+    created_at = "2024-01-01T00:00:00"
+    rows = [
+        (f"Tarea {i}", f"Descripción de la tarea {i}", rng.choice(STATUSES), rng.choice(PRIORITIES),
+         rng.sample(TAGS, rng.randint(0, 3)), created_at)
+        for i in range(args.tasks)
+    ]
+    result = {"tasks": args.tasks}
+
+    # Memoria por tarea solo con los índices en memoria
+    gc.collect()
+    tracemalloc.start()
+    memory_store = TaskStore(directory=None)
+    _, seconds = timed(lambda: [memory_store.create(*row) for row in rows])
+    result["insert_memory_per_s"] = rate(args.tasks, seconds)
+    result["bytes_per_task"] = tracemalloc.get_traced_memory()[0] // args.tasks
+    tracemalloc.stop()
+    del memory_store
+    gc.collect()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Sin compactación automática: el arranque en frío reproduce el log completo
+        store = TaskStore(directory=tmp, compact_ops=0)
+        _, seconds = timed(lambda: [store.create(*row) for row in rows])
+        result["insert_logged_per_s"] = rate(args.tasks, seconds)
+
+        ids = rng.sample(range(1, args.tasks + 1), args.updates + args.deletes)
+        updated, deleted = ids[:args.updates], ids[args.updates:]
+        _, seconds = timed(lambda: [store.update(task_id, status=rng.choice(STATUSES)) for task_id in updated])
+        result["update_per_s"] = rate(args.updates, seconds)
+        _, seconds = timed(lambda: [store.delete(task_id) for task_id in deleted])
+        result["delete_per_s"] = rate(args.deletes, seconds)
+
+        queries = {
+            "all_limit_50": {"limit": 50},
+            "status": {"status": "done"},
+            "status_limit_50": {"status": "done", "limit": 50},
+            "status_priority": {"status": "todo", "priority": "high"},
+            "tag": {"tag": "tag7"},
+            "status_priority_tag": {"status": "in-progress", "priority": "low", "tag": "tag7"},
+            "status_offset_10000_limit_50": {"status": "done", "offset": 10000, "limit": 50},
+        }
+        listing = {}
+        for name, query in queries.items():
+            # La primera llamada reordena los índices tocados por las actualizaciones
+            _, first = timed(lambda: store.list(**query))
+            found, seconds = timed(lambda: store.list(**query), repeat=5)
+            listing[name] = {"rows": len(found), "first_ms": round(first * 1000, 2), "ms": round(seconds * 1000, 3)}
+        result["list"] = listing
+        expected = {record.id: record.status for record in store.list()}
+        store.close()
+
+        log_bytes = sum(os.path.getsize(os.path.join(tmp, name)) for name in os.listdir(tmp))
+        store, seconds = timed(lambda: TaskStore(directory=tmp, compact_ops=0))
+        result["restart_log_replay_s"] = round(seconds, 3)
+        result["log_mb"] = round(log_bytes / 2**20, 1)
+        assert {r.id: r.status for r in store.list()} == expected, "el log no reproduce el estado"
+
+        _, seconds = timed(lambda: store.compact(wait=True))
+        result["compact_s"] = round(seconds, 3)
+        for task_id in rng.sample(sorted(expected), 1000):
+            store.update(task_id, status="done")
+            expected[task_id] = "done"
+        store.close()
+
+        store, seconds = timed(lambda: TaskStore(directory=tmp))
+        result["restart_snapshot_s"] = round(seconds, 3)
+        result["snapshot_mb"] = round(os.path.getsize(os.path.join(tmp, SNAPSHOT_FILE)) / 2**20, 1)
+        assert {r.id: r.status for r in store.list()} == expected, "snapshot + log no reproducen el estado"
+        store.close()
+
+    # Referencia: lista de modelos Pydantic con búsqueda lineal, como la versión anterior
+    from main import Task
+
+    gc.collect()
+    tracemalloc.start()
+    tasks = [Task(id=i + 1, title=row[0], description=row[1], status=row[2], priority=row[3], tags=row[4])
+             for i, row in enumerate(rows)]
+    result["baseline_list_bytes_per_task"] = tracemalloc.get_traced_memory()[0] // args.tasks
+    tracemalloc.stop()
+    targets = rng.sample(range(1, args.tasks + 1), args.baseline_ops)
+
+    def linear_update():
+        for task_id in targets:
+            index = next((index for index, task in enumerate(tasks) if task.id == task_id), None)
+            tasks[index] = tasks[index]
+
+    def linear_delete():
+        for task_id in targets:
+            index = next(index for index, task in enumerate(tasks) if task.id == task_id)
+            tasks.pop(index)
+
+    _, seconds = timed(linear_update)
+    result["baseline_list_update_per_s"] = rate(args.baseline_ops, seconds)
+    _, seconds = timed(linear_delete)
+    result["baseline_list_delete_per_s"] = rate(args.baseline_ops, seconds)
+    _, seconds = timed(lambda: [task for task in tasks if task.status == "done"])
+    result["baseline_list_filter_status_ms"] = round(seconds * 1000, 2)
+
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
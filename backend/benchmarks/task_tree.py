@@ -0,0 +1,105 @@
+"""Benchmark del árbol de subtareas: CTE recursivo frente a carga perezosa por nodo.
+
+Crea en un SQLite temporal un árbol de ``--nodes`` tareas (``--fanout`` hijos
+por nodo) y lo recorre de dos formas: accediendo a ``Task.subtasks`` nodo a
+nodo (N+1 consultas, como hacía el frontend) y con ``load_tree`` (una
+consulta). Comprueba que ambos acumulados coinciden.
+
+Uso (desde ``backend/``)::
+
+    python -m benchmarks.task_tree --nodes 10000 --fanout 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=10000)
+    parser.add_argument("--fanout", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # La URL debe fijarse antes de importar app.database
+        os.environ["SQLALCHEMY_DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'tree.db')}"
+        os.environ.pop("ASYNC_DATABASE_URL", None)
+
+        from sqlalchemy import event, insert
+        from app.database import AsyncSessionLocal, Base, SessionLocal, async_engine, engine
+        from app.enums import TaskStatus
+        from app.models import Task, User
+        from app.task_tree import TASK_TREE_MAX_DEPTH, load_tree
+
+        Base.metadata.create_all(engine)
+        with SessionLocal() as db:
+            user = User(email="tree@example.com", hashed_password="x", api_key="tree")
+            db.add(user)
+            db.commit()
+            rows = []
+            for i in range(1, args.nodes + 1):
+                rows.append({
+                    "id": i,
+                    "title": f"Tarea {i}",
+                    "user_id": user.id,
+                    "parent_task_id": (i - 2) // args.fanout + 1 if i > 1 else None,
+                    "estimated_hours": 1.5,
+                    "status": TaskStatus.DONE if i % 3 == 0 else TaskStatus.TODO,
+                })
+            db.execute(insert(Task), rows)
+            db.commit()
+            user_id = user.id
+
+        queries = 0
+
+        def count_query(*_):
+            nonlocal queries
+            queries += 1
+
+        event.listen(engine, "before_cursor_execute", count_query)
+        event.listen(async_engine.sync_engine, "before_cursor_execute", count_query)
+
+        def lazy_rollup(task):
+            total, hours, done = 1, task.estimated_hours or 0, int(task.status == TaskStatus.DONE)
+            for child in task.subtasks:
+                child_total, child_hours, child_done = lazy_rollup(child)
+                total, hours, done = total + child_total, hours + child_hours, done + child_done
+            return total, hours, done
+
+        queries = 0
+        start = time.perf_counter()
+        with SessionLocal() as db:
+            total, hours, done = lazy_rollup(db.get(Task, 1))
+        lazy = {
+            "ms": round((time.perf_counter() - start) * 1000, 1),
+            "queries": queries,
+            "subtree_tasks": total,
+            "subtree_estimated_hours": hours,
+        }
+
+        async def cte():
+            nonlocal queries
+            queries = 0
+            start = time.perf_counter()
+            async with AsyncSessionLocal() as db:
+                roots = await load_tree(db, Task.id == 1, user_id, TASK_TREE_MAX_DEPTH)
+            elapsed = time.perf_counter() - start
+            await async_engine.dispose()
+            return {
+                "ms": round(elapsed * 1000, 1),
+                "queries": queries,
+                "subtree_tasks": roots[0]["subtree_tasks"],
+                "subtree_estimated_hours": roots[0]["subtree_estimated_hours"],
+            }
+
+        results = {"lazy_loading": lazy, "recursive_cte": asyncio.run(cte())}
+        results["rollups_match"] = (
+            results["lazy_loading"]["subtree_tasks"] == results["recursive_cte"]["subtree_tasks"]
+            and results["lazy_loading"]["subtree_estimated_hours"] == results["recursive_cte"]["subtree_estimated_hours"]
+        )
+        print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Benchmark de contención de escritura sobre un archivo SQLite.
+
+Lanza N creadores de tareas en paralelo (un commit por tarea, como ``create_task``)
+contra el mismo archivo, primero con la configuración por defecto de SQLAlchemy
+(journal rollback, NullPool, sin busy timeout) y después con el pool y los PRAGMA
+de ``app.database`` (WAL, synchronous=NORMAL, busy_timeout, mmap).
+
+Uso (desde ``backend/``)::
+
+    python -m benchmarks.write_contention --writers 32 --tasks-per-writer 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine, exc
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.database import Base, configure_sqlite, engine_options
+from app.models import Task
+
+async def run_writers(async_engine, writers: int, tasks_per_writer: int) -> dict:
+    SessionLocal = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+    committed = 0
+    locked_errors = 0
+    latencies = []
+
+    async def writer(n: int):
+        nonlocal committed, locked_errors
+        for i in range(tasks_per_writer):
+            start = time.perf_counter()
+            try:
+                async with SessionLocal() as db:
+                    db.add(Task(title=f"writer {n} task {i}", user_id=1))
+                    await db.commit()
+                committed += 1
+                latencies.append(time.perf_counter() - start)
+            except exc.OperationalError:
+                locked_errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(writer(n) for n in range(writers)))
+    elapsed = time.perf_counter() - start
+    await async_engine.dispose()
+
+    latencies.sort()
+    return {
+        "committed": committed,
+        "locked_errors": locked_errors,
+        "seconds": round(elapsed, 3),
+        "commits_per_second": round(committed / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2) if latencies else None,
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2) if latencies else None,
+    }
+
+def fresh_database(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writers", type=int, default=32)
+    parser.add_argument("--tasks-per-writer", type=int, default=200)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "contention.db")
+        url = f"sqlite+aiosqlite:///{path}"
+
+        fresh_database(path)
+        default_engine = create_async_engine(url)
+        results["default"] = asyncio.run(run_writers(default_engine, args.writers, args.tasks_per_writer))
+
+        fresh_database(path)
+        tuned_engine = create_async_engine(url, **engine_options(url, is_async=True))
+        configure_sqlite(tuned_engine.sync_engine)
+        results["tuned"] = asyncio.run(run_writers(tuned_engine, args.writers, args.tasks_per_writer))
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,25 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional
 from enum import Enum
-from openai import AsyncOpenAI
 import asyncio
+import json
+import logging
 from dotenv import load_dotenv
 import os
 from datetime import datetime
+from app.llm_gateway import llm_gateway, LLMUnavailableError
+from app.prompts import CHAT_SYSTEM_PROMPT
+from app.metrics import METRICS_ENABLED, MetricsMiddleware, loop_lag_monitor, render_metrics, require_metrics_token
+from app.task_store import TaskStore
 
 # Cargar variables de entorno
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI(
     title="AI Chat API",
     description="API para servicios de chat con IA",
@@ -27,6 +35,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 class TaskStatus(str, Enum):
     TODO = "todo"
     IN_PROGRESS = "in-progress"
@@ -46,29 +57,42 @@ class Task(BaseModel):
     tags: List[str] = []
     created_at: str = Field(default_factory=lambda: datetime.now().isoformat())
 
-# Almacenamiento temporal de tareas
-tasks: List[Task] = []
-task_counter = 1
+# Almacenamiento de tareas: índices en memoria y log en disco (TASK_STORE_DIR)
+task_store = TaskStore()
+
+def task_fields(task: Task) -> dict:
+    return {
+        "title": task.title,
+        "description": task.description,
+        "status": task.status.value,
+        "priority": task.priority.value,
+        "tags": task.tags,
+        "created_at": task.created_at,
+    }
 
 # Modelo de datos para la solicitud
 class ChatRequest(BaseModel):
     message: str
     model: str = "qwen/qwq-32b:online"
+    stream: bool = False  # Opt-in: enviar la respuesta como Server-Sent Events
 
-# Cliente OpenAI global
-client = AsyncOpenAI(
-    base_url=os.getenv("BASE_URL"),
-    api_key=os.getenv("OPENROUTER_API_KEY"),
-)
+@app.on_event("startup")
+async def start_loop_lag_monitor():
+    if METRICS_ENABLED:
+        await loop_lag_monitor.start()
+
+@app.on_event("shutdown")
+async def close_llm_gateway():
+    await loop_lag_monitor.stop()
+    await llm_gateway.aclose()
+    task_store.close()
 
 @app.post("/chat")
 async def chat(request: ChatRequest):
     try:
-        print(f"Enviando mensaje: {request.message}")  # Debug
-        print(f"Usando modelo: {request.model}")  # Debug
-        print(f"API Key: {os.getenv('OPENROUTER_API_KEY')[:10]}...")  # Debug parcial de la API key
+        logger.debug("Chat con %s: mensaje de %d caracteres", request.model, len(request.message))
         
-        completion = await client.chat.completions.create(
+        completion = await llm_gateway.chat_completion(
             extra_headers={
                 "HTTP-Referer": "http://localhost:3001",  # Actualizado al puerto correcto
                 "X-Title": "Task Manager AI",
@@ -77,7 +101,7 @@ async def chat(request: ChatRequest):
             messages=[
                 {
                     "role": "system",
-                    "content": "Eres un asistente de productividad que ayuda a las personas a alcanzar sus metas. Cuando sugieras tareas, formátealas así: 'TASK: [título de la tarea]\nDESCRIPTION: [descripción detallada]'"
+                    "content": CHAT_SYSTEM_PROMPT
                 },
                 {
                     "role": "user",
@@ -85,31 +109,36 @@ async def chat(request: ChatRequest):
                 }
             ],
             temperature=0.7,
-            stream=True,
-            extra_body={
-                "provider": {
-                    "order": ["Groq","Fireworks"],
-                    "allow_fallbacks": True  # Permitimos fallbacks por si acaso
-                }
-            }
+            stream=True
         )
         
-        response_text = ""
+        if request.stream:
+            return StreamingResponse(
+                stream_chat_events(completion),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+
+        parts = []
         try:
             async for chunk in completion:
-                if chunk.choices[0].delta.content is not None:
-                    response_text += chunk.choices[0].delta.content
-                    print("Chunk recibido:", chunk.choices[0].delta.content[:50])  # Debug
+                if chunk.choices and chunk.choices[0].delta.content is not None:
+                    parts.append(chunk.choices[0].delta.content)
         except Exception as stream_error:
-            print(f"Error en el streaming: {str(stream_error)}")
+            logger.warning("Error en el streaming de %s: %s", request.model, stream_error)
             raise HTTPException(status_code=500, detail=f"Error en el streaming: {str(stream_error)}")
         
-        print(f"Respuesta completa: {response_text[:100]}...")  # Debug
+        response_text = "".join(parts)
+        logger.debug("Respuesta de %s: %d caracteres", request.model, len(response_text))
         return {"response": response_text}
     
+    except HTTPException:
+        raise
+    except LLMUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         error_detail = str(e)
-        print(f"Error en el chat: {error_detail}")
+        logger.error("Error en el chat con %s: %s", request.model, error_detail)
         
         if "API key" in error_detail.lower():
             raise HTTPException(status_code=500, detail="Error de autenticación con OpenRouter. Verifica tu API key.")
@@ -118,39 +147,67 @@ async def chat(request: ChatRequest):
         else:
             raise HTTPException(status_code=500, detail=f"Error en el chat: {error_detail}")
 
+def sse_event(data: dict) -> str:
+    """Formatea un evento Server-Sent Events"""
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def stream_chat_events(completion):
+    """Reenvía los deltas del modelo al cliente a medida que llegan"""
+    tokens = 0
+    try:
+        async for chunk in completion:
+            if chunk.choices and chunk.choices[0].delta.content is not None:
+                tokens += 1
+                yield sse_event({"delta": chunk.choices[0].delta.content})
+        yield sse_event({"done": True, "tokens": tokens})
+        yield "data: [DONE]\n\n"
+    except Exception as stream_error:
+        logger.warning("Error en el streaming: %s", stream_error)
+        yield sse_event({"error": str(stream_error)})
+
+@app.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(require_metrics_token)])
+async def get_metrics():
+    """Métricas en formato de texto de Prometheus"""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 async def root():
     return {"message": "Bienvenido a la API de Chat con IA"}
 
 @app.get("/tasks", response_model=List[Task])
-async def get_tasks():
-    return tasks
+async def get_tasks(
+    status: Optional[TaskStatus] = None,
+    priority: Optional[TaskPriority] = None,
+    tag: Optional[str] = None,
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1),
+):
+    records = task_store.list(
+        status=status.value if status else None,
+        priority=priority.value if priority else None,
+        tag=tag,
+        offset=offset,
+        limit=limit,
+    )
+    return [record.to_dict() for record in records]
 
 @app.post("/tasks", response_model=Task)
 async def create_task(task: Task):
-    global task_counter
-    task.id = task_counter
-    task_counter += 1
-    tasks.append(task)
-    return task
+    return task_store.create(**task_fields(task)).to_dict()
 
 @app.put("/tasks/{task_id}", response_model=Task)
 async def update_task(task_id: int, updated_task: Task):
-    task_index = next((index for index, task in enumerate(tasks) if task.id == task_id), None)
-    if task_index is None:
+    record = task_store.update(task_id, **task_fields(updated_task))
+    if record is None:
         raise HTTPException(status_code=404, detail="Task not found")
-    
-    updated_task.id = task_id
-    tasks[task_index] = updated_task
-    return updated_task
+    return record.to_dict()
 
 @app.delete("/tasks/{task_id}")
 async def delete_task(task_id: int):
-    task_index = next((index for index, task in enumerate(tasks) if task.id == task_id), None)
-    if task_index is None:
+    if not task_store.delete(task_id):
         raise HTTPException(status_code=404, detail="Task not found")
-    
-    tasks.pop(task_index)
     return {"message": "Task deleted successfully"}
 
 if __name__ == "__main__":
@@ -0,0 +1,39 @@
+"""composite indexes
+
+Índices para los accesos más frecuentes: tareas por usuario filtradas por
+estado/fecha límite o paginadas por updated_at, subtareas por padre, uso de la
+API por usuario en el tiempo y sugerencias/tags por tarea.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 19:06:18.695853
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_index('ix_tasks_user_status_due', 'tasks', ['user_id', 'status', 'due_date'])
+    op.create_index('ix_tasks_user_updated', 'tasks', ['user_id', 'updated_at', 'id'])
+    op.create_index('ix_tasks_parent_task_id', 'tasks', ['parent_task_id'])
+    op.create_index('ix_tasks_project_id', 'tasks', ['project_id'])
+    op.create_index('ix_api_requests_user_timestamp', 'api_requests', ['user_id', 'timestamp'])
+    op.create_index('ix_ai_suggestions_task_id', 'ai_suggestions', ['task_id'])
+    op.create_index('ix_task_tags_task_id', 'task_tags', ['task_id'])
+    op.create_index('ix_suggestion_jobs_status', 'suggestion_jobs', ['status'])
+
+def downgrade():
+    op.drop_index('ix_suggestion_jobs_status', table_name='suggestion_jobs')
+    op.drop_index('ix_task_tags_task_id', table_name='task_tags')
+    op.drop_index('ix_ai_suggestions_task_id', table_name='ai_suggestions')
+    op.drop_index('ix_api_requests_user_timestamp', table_name='api_requests')
+    op.drop_index('ix_tasks_project_id', table_name='tasks')
+    op.drop_index('ix_tasks_parent_task_id', table_name='tasks')
+    op.drop_index('ix_tasks_user_updated', table_name='tasks')
+    op.drop_index('ix_tasks_user_status_due', table_name='tasks')
@@ -0,0 +1,71 @@
+"""task stats
+
+Tabla de contadores de tareas por usuario (project_id = 0) y por proyecto,
+mantenida por deltas desde las rutas de escritura. Se rellena a partir de las
+tareas existentes.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 19:20:41.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+COUNTERS = """
+    COUNT(*),
+    SUM(CASE WHEN status = 'TODO' THEN 1 ELSE 0 END),
+    SUM(CASE WHEN status = 'IN_PROGRESS' THEN 1 ELSE 0 END),
+    SUM(CASE WHEN status = 'DONE' THEN 1 ELSE 0 END),
+    SUM(CASE WHEN priority = 'LOW' THEN 1 ELSE 0 END),
+    SUM(CASE WHEN priority = 'MEDIUM' THEN 1 ELSE 0 END),
+    SUM(CASE WHEN priority = 'HIGH' THEN 1 ELSE 0 END),
+    SUM(COALESCE(estimated_hours, 0)),
+    CURRENT_TIMESTAMP
+"""
+
+COLUMNS = "user_id, project_id, total, todo, in_progress, done, low, medium, high, estimated_hours, updated_at"
+
+def upgrade():
+    op.create_table('task_stats',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('project_id', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=False),
+    sa.Column('todo', sa.Integer(), nullable=False),
+    sa.Column('in_progress', sa.Integer(), nullable=False),
+    sa.Column('done', sa.Integer(), nullable=False),
+    sa.Column('low', sa.Integer(), nullable=False),
+    sa.Column('medium', sa.Integer(), nullable=False),
+    sa.Column('high', sa.Integer(), nullable=False),
+    sa.Column('estimated_hours', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'project_id', name='uq_task_stats_user_project')
+    )
+    with op.batch_alter_table('task_stats', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_task_stats_id'), ['id'], unique=False)
+
+    op.execute(f"""
+        INSERT INTO task_stats ({COLUMNS})
+        SELECT user_id, 0, {COUNTERS}
+        FROM tasks WHERE user_id IS NOT NULL GROUP BY user_id
+    """)
+    op.execute(f"""
+        INSERT INTO task_stats ({COLUMNS})
+        SELECT user_id, project_id, {COUNTERS}
+        FROM tasks WHERE user_id IS NOT NULL AND project_id IS NOT NULL GROUP BY user_id, project_id
+    """)
+
+def downgrade():
+    with op.batch_alter_table('task_stats', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_task_stats_id'))
+
+    op.drop_table('task_stats')
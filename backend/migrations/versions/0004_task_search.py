@@ -0,0 +1,219 @@
+"""task search
+
+Índice de búsqueda de texto completo sobre título, descripción, etiquetas y
+sugerencias de IA de cada tarea. En SQLite es una tabla virtual FTS5 (rowid =
+id de la tarea); en PostgreSQL, una tabla con un tsvector ponderado e índice
+GIN. Se mantiene con triggers, así que cualquier escritura (rutas de la API,
+importación masiva, cola de sugerencias) lo deja sincronizado. Se rellena a
+partir de los datos existentes.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 21:05:12.431877
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+SQLITE_TAGS = "(SELECT group_concat(name, ' ') FROM task_tags WHERE task_id = {task_id})"
+SQLITE_SUGGESTIONS = "(SELECT group_concat(suggestion, ' ') FROM ai_suggestions WHERE task_id = {task_id})"
+
+SQLITE_UPGRADE = [
+    # owner guarda el token u<user_id> para filtrar por usuario dentro del MATCH;
+    # va la última para que snippet() prefiera las columnas de texto en empates
+    """
+    CREATE VIRTUAL TABLE task_search USING fts5(
+        title, description, tags, suggestions, owner,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3 4'
+    )
+    """,
+    """
+    CREATE TRIGGER task_search_tasks_insert AFTER INSERT ON tasks BEGIN
+        INSERT INTO task_search (rowid, title, description, tags, suggestions, owner)
+        VALUES (NEW.id, NEW.title, NEW.description, '', '', 'u' || NEW.user_id);
+    END
+    """,
+    """
+    CREATE TRIGGER task_search_tasks_update AFTER UPDATE OF title, description, user_id ON tasks BEGIN
+        UPDATE task_search
+        SET owner = 'u' || NEW.user_id, title = NEW.title, description = NEW.description
+        WHERE rowid = NEW.id;
+    END
+    """,
+    """
+    CREATE TRIGGER task_search_tasks_delete AFTER DELETE ON tasks BEGIN
+        DELETE FROM task_search WHERE rowid = OLD.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER task_search_tags_insert AFTER INSERT ON task_tags BEGIN
+        UPDATE task_search SET tags = {SQLITE_TAGS.format(task_id="NEW.task_id")} WHERE rowid = NEW.task_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER task_search_tags_update AFTER UPDATE OF name, task_id ON task_tags BEGIN
+        UPDATE task_search SET tags = {SQLITE_TAGS.format(task_id="OLD.task_id")} WHERE rowid = OLD.task_id;
+        UPDATE task_search SET tags = {SQLITE_TAGS.format(task_id="NEW.task_id")} WHERE rowid = NEW.task_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER task_search_tags_delete AFTER DELETE ON task_tags BEGIN
+        UPDATE task_search SET tags = {SQLITE_TAGS.format(task_id="OLD.task_id")} WHERE rowid = OLD.task_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER task_search_suggestions_insert AFTER INSERT ON ai_suggestions BEGIN
+        UPDATE task_search
+        SET suggestions = {SQLITE_SUGGESTIONS.format(task_id="NEW.task_id")}
+        WHERE rowid = NEW.task_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER task_search_suggestions_update AFTER UPDATE OF suggestion, task_id ON ai_suggestions BEGIN
+        UPDATE task_search
+        SET suggestions = {SQLITE_SUGGESTIONS.format(task_id="OLD.task_id")}
+        WHERE rowid = OLD.task_id;
+        UPDATE task_search
+        SET suggestions = {SQLITE_SUGGESTIONS.format(task_id="NEW.task_id")}
+        WHERE rowid = NEW.task_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER task_search_suggestions_delete AFTER DELETE ON ai_suggestions BEGIN
+        UPDATE task_search
+        SET suggestions = {SQLITE_SUGGESTIONS.format(task_id="OLD.task_id")}
+        WHERE rowid = OLD.task_id;
+    END
+    """,
+    f"""
+    INSERT INTO task_search (rowid, title, description, tags, suggestions, owner)
+    SELECT id, title, description,
+           coalesce({SQLITE_TAGS.format(task_id="tasks.id")}, ''),
+           coalesce({SQLITE_SUGGESTIONS.format(task_id="tasks.id")}, ''),
+           'u' || user_id
+    FROM tasks
+    """,
+]
+
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER IF EXISTS task_search_suggestions_delete",
+    "DROP TRIGGER IF EXISTS task_search_suggestions_update",
+    "DROP TRIGGER IF EXISTS task_search_suggestions_insert",
+    "DROP TRIGGER IF EXISTS task_search_tags_delete",
+    "DROP TRIGGER IF EXISTS task_search_tags_update",
+    "DROP TRIGGER IF EXISTS task_search_tags_insert",
+    "DROP TRIGGER IF EXISTS task_search_tasks_delete",
+    "DROP TRIGGER IF EXISTS task_search_tasks_update",
+    "DROP TRIGGER IF EXISTS task_search_tasks_insert",
+    "DROP TABLE IF EXISTS task_search",
+]
+
+# 'simple' no aplica stemming ni stopwords, igual que el tokenizador de FTS5
+POSTGRES_DOCUMENT = """
+    setweight(to_tsvector('simple', coalesce(t.title, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(
+        (SELECT string_agg(name, ' ') FROM task_tags WHERE task_id = t.id), '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce(t.description, '')), 'C') ||
+    setweight(to_tsvector('simple', coalesce(
+        (SELECT string_agg(suggestion, ' ') FROM ai_suggestions WHERE task_id = t.id), '')), 'D')
+"""
+
+POSTGRES_UPGRADE = [
+    """
+    CREATE TABLE task_search (
+        task_id integer PRIMARY KEY,
+        user_id integer,
+        document tsvector NOT NULL
+    )
+    """,
+    "CREATE INDEX ix_task_search_document ON task_search USING gin (document)",
+    "CREATE INDEX ix_task_search_user_id ON task_search (user_id)",
+    f"""
+    CREATE FUNCTION task_search_refresh(tid integer) RETURNS void AS $$
+    BEGIN
+        IF tid IS NULL THEN
+            RETURN;
+        END IF;
+        INSERT INTO task_search (task_id, user_id, document)
+        SELECT t.id, t.user_id, {POSTGRES_DOCUMENT}
+        FROM tasks t WHERE t.id = tid
+        ON CONFLICT (task_id) DO UPDATE
+        SET user_id = EXCLUDED.user_id, document = EXCLUDED.document;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE FUNCTION task_search_tasks_trigger() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            DELETE FROM task_search WHERE task_id = OLD.id;
+            RETURN OLD;
+        END IF;
+        PERFORM task_search_refresh(NEW.id);
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE FUNCTION task_search_children_trigger() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            PERFORM task_search_refresh(OLD.task_id);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            PERFORM task_search_refresh(NEW.task_id);
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER task_search_tasks
+    AFTER INSERT OR DELETE OR UPDATE OF title, description, user_id ON tasks
+    FOR EACH ROW EXECUTE FUNCTION task_search_tasks_trigger()
+    """,
+    """
+    CREATE TRIGGER task_search_tags
+    AFTER INSERT OR DELETE OR UPDATE OF name, task_id ON task_tags
+    FOR EACH ROW EXECUTE FUNCTION task_search_children_trigger()
+    """,
+    """
+    CREATE TRIGGER task_search_suggestions
+    AFTER INSERT OR DELETE OR UPDATE OF suggestion, task_id ON ai_suggestions
+    FOR EACH ROW EXECUTE FUNCTION task_search_children_trigger()
+    """,
+    f"""
+    INSERT INTO task_search (task_id, user_id, document)
+    SELECT t.id, t.user_id, {POSTGRES_DOCUMENT}
+    FROM tasks t
+    """,
+]
+
+POSTGRES_DOWNGRADE = [
+    "DROP TRIGGER IF EXISTS task_search_suggestions ON ai_suggestions",
+    "DROP TRIGGER IF EXISTS task_search_tags ON task_tags",
+    "DROP TRIGGER IF EXISTS task_search_tasks ON tasks",
+    "DROP FUNCTION IF EXISTS task_search_children_trigger()",
+    "DROP FUNCTION IF EXISTS task_search_tasks_trigger()",
+    "DROP FUNCTION IF EXISTS task_search_refresh(integer)",
+    "DROP TABLE IF EXISTS task_search",
+]
+
+def statements(upgrade: bool):
+    if op.get_bind().dialect.name == "postgresql":
+        return POSTGRES_UPGRADE if upgrade else POSTGRES_DOWNGRADE
+    return SQLITE_UPGRADE if upgrade else SQLITE_DOWNGRADE
+
+def upgrade():
+    for statement in statements(upgrade=True):
+        op.execute(statement)
+
+def downgrade():
+    for statement in statements(upgrade=False):
+        op.execute(statement)
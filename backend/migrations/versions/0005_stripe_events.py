@@ -0,0 +1,60 @@
+"""stripe events
+
+Bandeja de entrada de los webhooks de Stripe (un registro por id de evento)
+procesada en segundo plano. Las suscripciones guardan el id de cliente de
+Stripe y la fecha del último evento aplicado, para descartar los que llegan
+fuera de orden.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 22:14:37.902215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('stripe_events',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('event_id', sa.String(), nullable=False),
+    sa.Column('type', sa.String(), nullable=False),
+    sa.Column('customer', sa.String(), nullable=True),
+    sa.Column('created', sa.Integer(), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('status', sa.Enum('PENDING', 'PROCESSED', 'FAILED', name='webhookeventstatus'), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=True),
+    sa.Column('last_error', sa.String(), nullable=True),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=True),
+    sa.Column('received_at', sa.DateTime(), nullable=True),
+    sa.Column('processed_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('event_id')
+    )
+    with op.batch_alter_table('stripe_events', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_stripe_events_id'), ['id'], unique=False)
+        batch_op.create_index('ix_stripe_events_status_created', ['status', 'created', 'id'], unique=False)
+
+    with op.batch_alter_table('subscriptions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('stripe_customer_id', sa.String(), nullable=True))
+        batch_op.add_column(sa.Column('last_event_at', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_subscriptions_stripe_customer_id'), ['stripe_customer_id'], unique=False)
+
+def downgrade():
+    with op.batch_alter_table('subscriptions', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_subscriptions_stripe_customer_id'))
+        batch_op.drop_column('last_event_at')
+        batch_op.drop_column('stripe_customer_id')
+
+    with op.batch_alter_table('stripe_events', schema=None) as batch_op:
+        batch_op.drop_index('ix_stripe_events_status_created')
+        batch_op.drop_index(batch_op.f('ix_stripe_events_id'))
+
+    op.drop_table('stripe_events')
+    if op.get_bind().dialect.name == "postgresql":
+        sa.Enum(name='webhookeventstatus').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,69 @@
+"""chat sessions
+
+Sesiones de chat persistidas en el servidor: los mensajes de cada sesión y el
+resumen de los turnos antiguos, con los contadores de tokens enviados frente
+a los que costaría reenviar el historial completo.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 23:41:09.518334
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table('chat_sessions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(), nullable=True),
+    sa.Column('model', sa.String(), nullable=False),
+    sa.Column('summary', sa.Text(), nullable=True),
+    sa.Column('summary_tokens', sa.Integer(), nullable=False),
+    sa.Column('summarized_through', sa.Integer(), nullable=False),
+    sa.Column('message_count', sa.Integer(), nullable=False),
+    sa.Column('history_tokens', sa.Integer(), nullable=False),
+    sa.Column('pending_tokens', sa.Integer(), nullable=False),
+    sa.Column('compactions', sa.Integer(), nullable=False),
+    sa.Column('prompt_tokens_sent', sa.Integer(), nullable=False),
+    sa.Column('prompt_tokens_full', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('chat_sessions', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_chat_sessions_id'), ['id'], unique=False)
+        batch_op.create_index('ix_chat_sessions_user_updated', ['user_id', 'updated_at'], unique=False)
+
+    op.create_table('chat_messages',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('session_id', sa.Integer(), nullable=False),
+    sa.Column('role', sa.String(), nullable=False),
+    sa.Column('content', sa.Text(), nullable=False),
+    sa.Column('tokens', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['session_id'], ['chat_sessions.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('chat_messages', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_chat_messages_id'), ['id'], unique=False)
+        batch_op.create_index('ix_chat_messages_session_id', ['session_id', 'id'], unique=False)
+
+def downgrade():
+    with op.batch_alter_table('chat_messages', schema=None) as batch_op:
+        batch_op.drop_index('ix_chat_messages_session_id')
+        batch_op.drop_index(batch_op.f('ix_chat_messages_id'))
+
+    op.drop_table('chat_messages')
+    with op.batch_alter_table('chat_sessions', schema=None) as batch_op:
+        batch_op.drop_index('ix_chat_sessions_user_updated')
+        batch_op.drop_index(batch_op.f('ix_chat_sessions_id'))
+
+    op.drop_table('chat_sessions')
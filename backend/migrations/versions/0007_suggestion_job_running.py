@@ -0,0 +1,31 @@
+"""suggestion job running status
+
+Estado RUNNING para los trabajos de sugerencias: un worker reclama el trabajo
+con un UPDATE condicionado antes de llamar al modelo, así que varios procesos
+no repiten el mismo trabajo.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 23:58:12.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # En SQLite el enum es un VARCHAR sin CHECK: solo PostgreSQL necesita el valor nuevo
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.execute("ALTER TYPE suggestionjobstatus ADD VALUE IF NOT EXISTS 'RUNNING'")
+
+def downgrade():
+    # PostgreSQL no permite quitar valores de un enum; los trabajos en curso vuelven a PENDING
+    op.execute(
+        sa.text("UPDATE suggestion_jobs SET status = 'PENDING' WHERE status = 'RUNNING'")
+    )
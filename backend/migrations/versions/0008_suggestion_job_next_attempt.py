@@ -0,0 +1,25 @@
+"""suggestion job next attempt
+
+Hora del siguiente intento de un trabajo de sugerencias fallido: el backoff
+se guarda en la tabla y el sweeper de cualquier proceso lo respeta.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19 00:21:40.615203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column('suggestion_jobs', sa.Column('next_attempt_at', sa.DateTime(), nullable=True))
+
+def downgrade():
+    with op.batch_alter_table('suggestion_jobs') as batch_op:
+        batch_op.drop_column('next_attempt_at')
@@ -0,0 +1,29 @@
+import os
+import sys
+import tempfile
+
+# La configuración de la app se lee al importarla: debe fijarse antes
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = tempfile.mkdtemp(prefix="task-manager-tests-")
+os.environ.update({
+    "SQLALCHEMY_DATABASE_URL": f"sqlite:///{os.path.join(DATA_DIR, 'tests.db')}",
+    "OPENROUTER_API_KEY": "test",
+    "RESOURCE_VERSION_BACKEND": "memory",
+    "RATE_LIMIT_BACKEND": "memory",
+    "CHANGE_FEED_BACKEND": "memory",
+    "COMPLETION_CACHE_ENABLED": "0",
+    "METRICS_ENABLED": "0",
+    "TASK_STORE_DIR": "",
+    "BCRYPT_ROUNDS": "4",
+})
+os.environ.pop("ASYNC_DATABASE_URL", None)
+sys.path.insert(0, BACKEND)
+
+def pytest_configure(config):
+    from alembic import command
+    from alembic.config import Config
+
+    alembic_config = Config(os.path.join(BACKEND, "alembic.ini"))
+    alembic_config.set_main_option("script_location", os.path.join(BACKEND, "migrations"))
+    alembic_config.set_main_option("sqlalchemy.url", os.environ["SQLALCHEMY_DATABASE_URL"])
+    command.upgrade(alembic_config, "head")
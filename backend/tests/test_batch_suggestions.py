@@ -0,0 +1,43 @@
+import uuid
+
+from sqlalchemy import func, select
+
+from app import task_router
+from app.database import AsyncSessionLocal
+from app.models import AISuggestion, Task, User
+from app.task_router import BatchSuggestionRequest, batch_task_suggestions
+from benchmarks.fake_openai import create_app, make_gateway
+from tests.test_suggestion_queue import PROVIDERS, run
+
+async def create_tasks(count: int):
+    async with AsyncSessionLocal() as db:
+        user = User(email=f"{uuid.uuid4().hex}@example.com", hashed_password="x", api_key=uuid.uuid4().hex)
+        tasks = [Task(title=f"Tarea {i}", user=user) for i in range(count)]
+        db.add_all(tasks)
+        await db.commit()
+        return user, [task.id for task in tasks]
+
+async def batch(monkeypatch, fake, count: int = 3):
+    monkeypatch.setattr(task_router, "llm_gateway", make_gateway(fake, provider_order=PROVIDERS, max_retries=0))
+    user, task_ids = await create_tasks(count)
+    async with AsyncSessionLocal() as db:
+        report = await batch_task_suggestions(BatchSuggestionRequest(task_ids=task_ids), user, db)
+    async with AsyncSessionLocal() as db:
+        stored = await db.scalar(select(func.count()).where(AISuggestion.task_id.in_(task_ids)))
+    return report, stored
+
+def test_unparsed_batch_falls_back_and_counts_every_call(monkeypatch):
+    # El servidor falso no devuelve JSON: el lote no asigna nada y cada tarea usa la llamada individual
+    fake = create_app(ttft=0, token_delay=0)
+    report, stored = run(batch(monkeypatch, fake))
+    assert [item.source for item in report.results] == ["fallback"] * 3
+    assert all(item.suggestion_id for item in report.results)
+    assert (report.batches, report.fallbacks, report.llm_calls) == (1, 3, 4)
+    assert report.llm_calls == len(fake.state.calls)
+    assert stored == 3
+
+def test_failed_calls_are_not_counted(monkeypatch):
+    fake = create_app(fail_providers=PROVIDERS)
+    report, stored = run(batch(monkeypatch, fake))
+    assert [item.source for item in report.results] == ["failed"] * 3
+    assert (report.llm_calls, report.total_tokens, stored) == (0, 0, 0)
@@ -0,0 +1,65 @@
+import asyncio
+import functools
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.bulk_io import LineTooLongError, iter_csv_rows, iter_lines
+
+async def body(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+def collect(lines):
+    async def gather():
+        return [line async for line in lines]
+    return asyncio.run(gather())
+
+def test_lines_split_across_chunks():
+    lines = iter_lines(body(b'{"title": "a"}\r\n{"ti', b'tle": "b"}\n', b"\xc3", b"\xb1"), max_line_bytes=32)
+    assert collect(lines) == ['{"title": "a"}', '{"title": "b"}', "ñ"]
+
+def test_line_without_newline_is_rejected_before_buffering_the_body():
+    seen = []
+
+    async def endless():
+        while True:
+            seen.append(1)
+            yield b"x" * 1024
+
+    with pytest.raises(LineTooLongError) as error:
+        collect(iter_lines(endless(), max_line_bytes=10 * 1024))
+    assert error.value.line == 1
+    assert len(seen) == 11
+
+def test_long_line_counts_bytes_not_characters():
+    # 6 caracteres, 12 bytes
+    with pytest.raises(LineTooLongError) as error:
+        collect(iter_lines(body("ok\n".encode(), ("ñ" * 6 + "\n").encode()), max_line_bytes=10))
+    assert error.value.line == 2
+
+def test_unclosed_csv_quote_is_bounded():
+    async def rows():
+        lines = iter_lines(body(b'title\n"' + b"a\n" * 100), max_line_bytes=64)
+        return [row async for row in iter_csv_rows(lines, max_record_bytes=64)]
+
+    with pytest.raises(LineTooLongError) as error:
+        asyncio.run(rows())
+    assert error.value.line == 2
+
+def test_bulk_import_rejects_oversized_line(monkeypatch):
+    from app import task_router
+    from app.main import app
+
+    client = TestClient(app)
+    email = f"{uuid.uuid4().hex}@example.com"
+    token = client.post("/register", json={"email": email, "password": "bulk"}).json()["access_token"]
+    monkeypatch.setattr(task_router, "iter_lines", functools.partial(iter_lines, max_line_bytes=1024))
+    response = client.post(
+        "/api/tasks:bulk",
+        content=b'{"title": "ok"}\n' + b'{"title": "' + b"x" * 4096,
+        headers={"Authorization": f"Bearer {token}", "Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 413
+    assert "Line 2 exceeds 1024 bytes" in response.json()["detail"]
@@ -0,0 +1,94 @@
+import asyncio
+import uuid
+from types import SimpleNamespace
+
+import anyio
+from sqlalchemy import select
+
+from app import main
+from app.database import AsyncSessionLocal
+from app.models import ChatMessage, ChatSession, User
+from tests.test_suggestion_queue import run
+
+def chunk(content: str):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+async def slow_stream(words, fail_after=None):
+    for i, word in enumerate(words):
+        if i == fail_after:
+            raise RuntimeError("provider reset")
+        await asyncio.sleep(0.01)
+        yield chunk(word)
+
+async def create_session() -> int:
+    async with AsyncSessionLocal() as db:
+        user = User(email=f"{uuid.uuid4().hex}@example.com", hashed_password="x", api_key=uuid.uuid4().hex)
+        db.add(user)
+        await db.flush()
+        session = ChatSession(user_id=user.id, model="fake")
+        db.add(session)
+        await db.commit()
+        return session.id
+
+async def saved_messages(session_id: int):
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(ChatMessage.role, ChatMessage.content).where(ChatMessage.session_id == session_id).order_by(ChatMessage.id)
+        )
+        return [tuple(row) for row in result]
+
+def capture_usage(monkeypatch):
+    charged = []
+    monkeypatch.setattr(main, "record_api_usage", lambda user_id, model, tokens: charged.append(tokens))
+    return charged
+
+def test_disconnect_saves_partial_turn_and_charges_it(monkeypatch):
+    charged = capture_usage(monkeypatch)
+
+    async def scenario():
+        session_id = await create_session()
+        turn = (session_id, "hola", 10, 10)
+        events = main.stream_session_events(slow_stream([f"w{i} " for i in range(50)]), 1, "fake", turn)
+        # Como StreamingResponse: al desconectarse el cliente se cancela el grupo de tareas
+        async with anyio.create_task_group() as group:
+            async def consume():
+                received = 0
+                async for _ in events:
+                    received += 1
+                    if received == 3:
+                        group.cancel_scope.cancel()
+            group.start_soon(consume)
+        await events.aclose()
+        return await saved_messages(session_id)
+
+    messages = run(scenario())
+    assert messages[0] == ("user", "hola")
+    assert messages[1][0] == "assistant" and messages[1][1].startswith("w0 w1 w2")
+    assert charged == [len(messages[1][1].split())]
+
+def test_provider_error_saves_what_was_streamed(monkeypatch):
+    charged = capture_usage(monkeypatch)
+
+    async def scenario():
+        session_id = await create_session()
+        turn = (session_id, "hola", 10, 10)
+        events = [event async for event in main.stream_session_events(slow_stream(["a ", "b ", "c "], fail_after=2), 1, "fake", turn)]
+        return events, await saved_messages(session_id)
+
+    events, messages = run(scenario())
+    assert "provider reset" in events[-1]
+    assert messages == [("user", "hola"), ("assistant", "a b ")]
+    assert charged == [2]
+
+def test_no_content_no_turn_no_charge(monkeypatch):
+    charged = capture_usage(monkeypatch)
+
+    async def scenario():
+        session_id = await create_session()
+        turn = (session_id, "hola", 10, 10)
+        events = [event async for event in main.stream_session_events(slow_stream(["a "], fail_after=0), 1, "fake", turn)]
+        return events, await saved_messages(session_id)
+
+    events, messages = run(scenario())
+    assert "provider reset" in events[-1]
+    assert (messages, charged) == ([], [])
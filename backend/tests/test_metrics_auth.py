@@ -0,0 +1,30 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app import metrics
+
+TOKEN = "metrics-test"
+PROTECTED = {
+    "app.main": ["/metrics", "/cache/stats", "/llm/stats", "/changes/stats", "/etag/stats", "/chat/stats", "/webhook/stats"],
+    "main": ["/metrics"],
+}
+
+@pytest.fixture(params=sorted(PROTECTED))
+def client(request, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", TOKEN)
+    module = __import__(request.param, fromlist=["app"])
+    # Los tests arrancan con METRICS_ENABLED=0, y entonces /metrics responde 404
+    monkeypatch.setattr(module, "METRICS_ENABLED", True)
+    return TestClient(module.app), PROTECTED[request.param]
+
+def test_requests_without_token_get_401(client):
+    client, paths = client
+    for path in paths:
+        assert client.get(path).status_code == 401, path
+        assert client.get(path, headers={"Authorization": "Bearer wrong"}).status_code == 401, path
+        assert client.get(path, headers={"Authorization": f"Bearer {TOKEN}"}).status_code == 200, path
+
+def test_unset_token_denies_everyone(client, monkeypatch):
+    client, paths = client
+    monkeypatch.setattr(metrics, "METRICS_TOKEN", "")
+    assert client.get(paths[0], headers={"Authorization": "Bearer "}).status_code == 401
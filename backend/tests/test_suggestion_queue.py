@@ -0,0 +1,140 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, update
+
+from app.database import AsyncSessionLocal, async_engine
+from app.enums import SuggestionJobStatus
+from app.models import AISuggestion, SuggestionJob, Task, User
+from app.suggestion_queue import SuggestionQueue
+from app.task_router import make_suggestion_handler
+from benchmarks.fake_openai import create_app, make_gateway
+
+PROVIDERS = ["Groq", "Fireworks"]
+
+def run(coroutine):
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            await async_engine.dispose()
+    return asyncio.run(main())
+
+async def create_job(status=SuggestionJobStatus.PENDING, updated_at=None) -> int:
+    async with AsyncSessionLocal() as db:
+        user = User(email=f"{uuid.uuid4().hex}@example.com", hashed_password="x", api_key=uuid.uuid4().hex)
+        task = Task(title="Preparar la demo", description="Diapositivas y guion", user=user)
+        job = SuggestionJob(task=task, status=status, updated_at=updated_at or datetime.utcnow())
+        db.add(job)
+        await db.commit()
+        return job.id
+
+async def job_state(job_id: int):
+    async with AsyncSessionLocal() as db:
+        job = await db.get(SuggestionJob, job_id)
+        count = await db.scalar(select(func.count()).where(AISuggestion.task_id == job.task_id))
+        return job.status, job.attempts, count
+
+def make_queue(fake, **kwargs) -> SuggestionQueue:
+    gateway = make_gateway(fake, provider_order=PROVIDERS, retry_backoff=0.01, max_retries=0)
+    return SuggestionQueue(make_suggestion_handler(gateway=gateway), **kwargs)
+
+def test_job_writes_one_suggestion_and_ready():
+    async def scenario():
+        fake = create_app(ttft=0, token_delay=0)
+        job_id = await create_job()
+        await make_queue(fake)._run(job_id)
+        return await job_state(job_id), len(fake.state.calls)
+
+    (status, attempts, suggestions), calls = run(scenario())
+    assert (status, attempts, suggestions, calls) == (SuggestionJobStatus.READY, 0, 1, 1)
+
+def test_concurrent_workers_claim_job_once():
+    async def scenario():
+        fake = create_app(ttft=0.05, token_delay=0)
+        job_id = await create_job()
+        # Dos procesos que barren el mismo pendiente
+        await asyncio.gather(make_queue(fake)._run(job_id), make_queue(fake)._run(job_id))
+        return await job_state(job_id), len(fake.state.calls)
+
+    (status, _, suggestions), calls = run(scenario())
+    assert (status, suggestions, calls) == (SuggestionJobStatus.READY, 1, 1)
+
+def test_result_discarded_when_job_resolved_elsewhere():
+    async def scenario():
+        fake = create_app(ttft=0, token_delay=0)
+        job_id = await create_job()
+        queue = make_queue(fake)
+        handler = queue.handler
+
+        async def resolved_by_batch(job_id: int):
+            content = await handler(job_id)
+            # suggestions:batch cierra el trabajo mientras el worker llamaba al modelo
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(SuggestionJob).where(SuggestionJob.id == job_id).values(status=SuggestionJobStatus.READY)
+                )
+                await db.commit()
+            return content
+
+        queue.handler = resolved_by_batch
+        await queue._run(job_id)
+        return await job_state(job_id)
+
+    status, _, suggestions = run(scenario())
+    assert (status, suggestions) == (SuggestionJobStatus.READY, 0)
+
+def test_failed_job_after_max_retries():
+    async def scenario():
+        fake = create_app(fail_providers=PROVIDERS)
+        job_id = await create_job()
+        await make_queue(fake, max_retries=1)._run(job_id)
+        return await job_state(job_id)
+
+    status, attempts, suggestions = run(scenario())
+    assert (status, attempts, suggestions) == (SuggestionJobStatus.FAILED, 1, 0)
+
+def test_stale_running_job_is_reclaimed():
+    async def scenario():
+        fake = create_app(ttft=0, token_delay=0)
+        fresh = await create_job(SuggestionJobStatus.RUNNING)
+        stale = await create_job(SuggestionJobStatus.RUNNING, datetime.utcnow() - timedelta(minutes=10))
+        queue = make_queue(fake, claim_timeout=60)
+        await queue._run(fresh)
+        await queue._run(stale)
+        return await job_state(fresh), await job_state(stale)
+
+    fresh, stale = run(scenario())
+    assert fresh == (SuggestionJobStatus.RUNNING, 0, 0)
+    assert stale == (SuggestionJobStatus.READY, 0, 1)
+
+def test_failed_job_waits_for_backoff_in_other_processes():
+    async def scenario():
+        fake = create_app(fail_providers=PROVIDERS)
+        job_id = await create_job()
+        failing = make_queue(fake, max_retries=3, backoff=30)
+        await failing._run(job_id)
+        async with AsyncSessionLocal() as db:
+            job = await db.get(SuggestionJob, job_id)
+            waiting = (job.status, job.attempts, job.next_attempt_at > datetime.utcnow())
+
+        # Otro proceso barre el pendiente antes de que venza el backoff: no lo reclama
+        other = make_queue(create_app(ttft=0, token_delay=0))
+        await other._run(job_id)
+        early = await job_state(job_id)
+
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(SuggestionJob)
+                .where(SuggestionJob.id == job_id)
+                .values(next_attempt_at=datetime.utcnow() - timedelta(seconds=1))
+            )
+            await db.commit()
+        await other._run(job_id)
+        return waiting, early, await job_state(job_id)
+
+    waiting, early, due = run(scenario())
+    assert waiting == (SuggestionJobStatus.PENDING, 1, True)
+    assert early == (SuggestionJobStatus.PENDING, 1, 0)
+    assert due == (SuggestionJobStatus.READY, 1, 1)
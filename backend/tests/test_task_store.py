@@ -0,0 +1,59 @@
+import marshal
+import os
+
+import pytest
+
+from app.task_store import SNAPSHOT_FILE, SnapshotVersionError, TaskStore, segment_name
+
+def add(store: TaskStore, title: str):
+    return store.create(title, "", "TODO", "LOW", ["demo"], "2024-01-01T00:00:00")
+
+def titles(store: TaskStore):
+    return [store.get(task_id).title for task_id in range(1, 10) if store.get(task_id)]
+
+def test_writes_after_a_corrupt_entry_survive_restart(tmp_path):
+    store = TaskStore(directory=str(tmp_path), compact_ops=0)
+    add(store, "antes")
+    store.close()
+    segment = tmp_path / segment_name(0)
+    with open(segment, "ab") as log:
+        log.write(b'["p",2,"rota\n["p",3,"perdida","","TODO","LOW",[],"x"]\n')
+
+    store = TaskStore(directory=str(tmp_path), compact_ops=0)
+    assert titles(store) == ["antes"]
+    add(store, "después")
+    store.close()
+
+    # Lo escrito tras la corrupción se reproduce; lo apartado queda en .corrupt
+    store = TaskStore(directory=str(tmp_path), compact_ops=0)
+    assert titles(store) == ["antes", "después"]
+    store.close()
+    assert (tmp_path / (segment_name(0) + ".corrupt")).read_bytes().startswith(b'["p",2,"rota')
+
+def test_line_separator_in_title_is_not_a_new_entry(tmp_path):
+    store = TaskStore(directory=str(tmp_path), compact_ops=0)
+    add(store, "uno\u2028dos")
+    store.close()
+    store = TaskStore(directory=str(tmp_path), compact_ops=0)
+    assert titles(store) == ["uno\u2028dos"]
+    store.close()
+
+def test_snapshot_roundtrip(tmp_path):
+    store = TaskStore(directory=str(tmp_path), compact_ops=0)
+    add(store, "a")
+    store.compact(wait=True)
+    add(store, "b")
+    store.close()
+    store = TaskStore(directory=str(tmp_path), compact_ops=0)
+    assert titles(store) == ["a", "b"]
+    store.close()
+
+@pytest.mark.parametrize("content", [
+    marshal.dumps({"version": 1, "segment": 1, "next_id": 2, "tasks": [], "indexes": {}}),
+    b"task-store-snapshot 99\n" + marshal.dumps({}),
+])
+def test_snapshot_of_another_version_is_rejected(tmp_path, content):
+    (tmp_path / SNAPSHOT_FILE).write_bytes(content)
+    with pytest.raises(SnapshotVersionError):
+        TaskStore(directory=str(tmp_path), compact_ops=0)
+    assert os.path.exists(tmp_path / SNAPSHOT_FILE)
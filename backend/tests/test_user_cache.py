@@ -0,0 +1,47 @@
+import asyncio
+import json
+from datetime import datetime
+
+import pytest
+
+from app.models import User
+from app.user_cache import UserCache
+
+SECRETS = ("hashed_password", "api_key")
+
+def make_user() -> User:
+    return User(
+        id=7, email="cache@example.com", hashed_password="$2b$12$secret", api_key="key-secret",
+        is_active=True, credits=42, subscription_id="sub_1",
+        created_at=datetime(2024, 1, 1), updated_at=datetime(2024, 1, 2, 3, 4, 5),
+    )
+
+def test_memory_entry_has_no_secrets():
+    async def scenario():
+        cache = UserCache(enabled=True)
+        await cache.set("cache@example.com", make_user())
+        _, data = cache._entries["cache@example.com"]
+        return data, await cache.get("cache@example.com")
+
+    data, cached = asyncio.run(scenario())
+    assert not set(SECRETS) & set(data)
+    assert (cached.id, cached.credits, cached.updated_at) == (7, 42, datetime(2024, 1, 2, 3, 4, 5))
+    assert cached.hashed_password is None and cached.api_key is None
+
+def test_redis_entry_has_no_secrets():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        cache = UserCache(enabled=True)
+        cache.attach_redis(client)
+        await cache.set("cache@example.com", make_user())
+        raw = await client.get(cache.prefix + "cache@example.com")
+        # Entrada antigua con todas las columnas: los secretos no pasan a la instancia
+        await client.set(cache.prefix + "old@example.com", json.dumps({**json.loads(raw), "api_key": "leak"}))
+        cache.clear()
+        return raw, await cache.get("old@example.com")
+
+    raw, old = asyncio.run(scenario())
+    assert not set(SECRETS) & set(json.loads(raw))
+    assert old.api_key is None and old.email == "cache@example.com"